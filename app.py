@@ -8,8 +8,10 @@ import json
 import sqlite3
 import uuid
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context
 from flask_cors import CORS
+from history_shards import HistoryShards, init_history_db
+from history_export import EXPORT_KINDS, iter_export_records, iter_ndjson
 
 # Fix console encoding for Windows
 if sys.platform.startswith('win'):
@@ -22,26 +24,28 @@ CORS(app)
 
 # Конфигурация
 DATABASE_PATH = "chat_history.db"
+HISTORY_ARCHIVE_DIR = "history_archive"
+HISTORY_RETENTION_DAYS = 90  # Разговоры старше переносятся в сжатый архив
+HISTORY_RETENTION_INTERVAL = 3600  # Период запуска архивации, секунды
+MODEL_CHECKPOINT_INTERVAL = 300  # Период публикации и сохранения дообученных моделей, секунды
+
+# /api/export отдает разговоры всех сессий, поэтому по умолчанию выключен (массовая выгрузка -
+# history_export.py); включенный отвечает только запросам с этой же машины
+EXPORT_API_ENABLED = False
+EXPORT_API_HOSTS = ('127.0.0.1', '::1')
+
+# Шардирование истории: >1 распределяет сессии по нескольким файлам базы
+HISTORY_SHARDS = 1
+history_shards = HistoryShards(DATABASE_PATH, HISTORY_SHARDS)
 
 # Инициализация базы данных
 def init_db():
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT NOT NULL,
-            user_message TEXT NOT NULL,
-            ai_response TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    for db_path in history_shards.all_paths():
+        init_history_db(db_path)
 
 # Получение истории разговора
 def get_conversation_history(session_id, limit=10):
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = sqlite3.connect(history_shards.path_for(session_id))
     cursor = conn.cursor()
     cursor.execute('''
         SELECT user_message, ai_response, timestamp 
@@ -56,7 +60,7 @@ def get_conversation_history(session_id, limit=10):
 
 # Сохранение сообщения в базу данных
 def save_message(session_id, user_message, ai_response):
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = sqlite3.connect(history_shards.path_for(session_id))
     cursor = conn.cursor()
     cursor.execute('''
         INSERT INTO conversations (session_id, user_message, ai_response)
@@ -69,12 +73,25 @@ def save_message(session_id, user_message, ai_response):
 
 # Импорт нашей гибридной LLM с обучением
 from hybrid_voicaj_llm import HybridVoicajLLM
+from history_archive import HistoryArchiver, start_retention_worker
+from feedback_queue import FeedbackQueue, FeedbackQueueFull
+from request_clock import reference_clock, parse_client_time
+from llm_admission import LLMOverloaded
 
 # Создаем экземпляр гибридной Voicaj LLM
 voicaj_llm = HybridVoicajLLM()
 
+# Очередь обратной связи (обучение в фоновом потоке)
+feedback_queue = FeedbackQueue(voicaj_llm)
+
+# Архив старой истории (по архиватору на каждый шард)
+history_archivers = {
+    db_path: HistoryArchiver(db_path, HISTORY_ARCHIVE_DIR, HISTORY_RETENTION_DAYS)
+    for db_path in history_shards.all_paths()
+}
+
 # Обработка сообщений
-def process_message(message, history=None, json_mode=False):
+def process_message(message, history=None, json_mode=False, debug_info=None):
     try:
         # Выбираем режим обработки
         if json_mode:
@@ -85,7 +102,12 @@ def process_message(message, history=None, json_mode=False):
             detected_types = voicaj_llm._detect_types(message.lower())
             print(f"DEBUG: Detected types: {detected_types}")
             
-            result = voicaj_llm.analyze_text(message)
+            if debug_info is None:
+                result = voicaj_llm.analyze_text(message)
+            else:
+                # Отладочный раздел: уверенность и источник каждого поля, время уровней
+                result, debug = voicaj_llm.analyze_text(message, debug=True)
+                debug_info.update(debug)
             print(f"DEBUG: Voicaj LLM returned {len(result)} objects")
             print(f"DEBUG: Object types: {[obj['type'] for obj in result]}")
             return result
@@ -93,6 +115,8 @@ def process_message(message, history=None, json_mode=False):
             # Обычный режим - простой ответ
             return f"Получено сообщение: {message}"
             
+    except LLMOverloaded:
+        raise
     except Exception as e:
         print(f"DEBUG: Exception occurred: {e}")
         import traceback
@@ -113,16 +137,29 @@ def chat():
         data = request.get_json(force=True)
         message = data.get('message', '').strip()
         json_mode = data.get('json_mode', False)  # Получаем режим из запроса
+        # Время и часовой пояс клиента: «завтра» считается от его дня, а не от дня сервера
+        client_time = data.get('client_time')  # ISO 8601, например 2025-10-07T23:30:00+03:00
+        client_timezone = data.get('timezone')  # IANA, например Europe/Moscow
+        debug_info = {} if data.get('debug') else None  # Уверенность полей в ответе
         
         if not message:
             return jsonify({'error': 'Message cannot be empty'}), 400
+        try:
+            reference_time = parse_client_time(client_time, client_timezone)
+        except ValueError as e:
+            return jsonify({'error': f'client_time/timezone: {e}'}), 400
         
         # Get conversation history (increased limit for more context)
         session_id = session.get('session_id', str(uuid.uuid4()))
         history = get_conversation_history(session_id, limit=20)
         
         # Send request to Voicaj LLM
-        response = process_message(message, history, json_mode)
+        with reference_clock.request(reference_time):
+            try:
+                response = process_message(message, history, json_mode, debug_info)
+            except LLMOverloaded as e:
+                # Политика 'reject': клиент повторит запрос, когда очередь к LLM разойдется
+                return jsonify({'error': str(e), 'retry_after': e.retry_after}), 429, {'Retry-After': str(e.retry_after)}
         
         print(f"DEBUG: process_message returned type: {type(response)}")
         print(f"DEBUG: process_message returned {len(response) if isinstance(response, list) else 1} objects")
@@ -138,12 +175,15 @@ def chat():
         # Определяем тип ответа
         response_type = 'structured_json' if json_mode else 'text'
         
-        return jsonify({
+        payload = {
             'response': response,
             'session_id': session_id,
             'type': response_type,
             'json_mode': json_mode
-        })
+        }
+        if debug_info is not None:
+            payload['debug'] = debug_info
+        return jsonify(payload)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -152,9 +192,16 @@ def chat():
 def get_history():
     session_id = session.get('session_id', str(uuid.uuid4()))
     history = get_conversation_history(session_id, limit=50)  # Increased limit
+    history = list(reversed(history))
+    
+    # По запросу подмешиваем сообщения, уже перенесенные в архив
+    if request.args.get('archived') in ('1', 'true'):
+        archived = [(row['user_message'], row['ai_response'], row['timestamp'])
+                    for row in history_archivers[history_shards.path_for(session_id)].load_archived_session(session_id)]
+        history = archived + history
     
     formatted_history = []
-    for user_msg, ai_msg, timestamp in reversed(history):
+    for user_msg, ai_msg, timestamp in history:
         # Try to parse AI response as JSON for better display
         try:
             ai_parsed = json.loads(ai_msg) if isinstance(ai_msg, str) else ai_msg
@@ -169,10 +216,38 @@ def get_history():
     
     return jsonify({'history': formatted_history})
 
+@app.route('/api/export')
+def export_history():
+    """Потоковая выгрузка истории и извлеченных объектов в NDJSON (только локально, если включена)"""
+    if not EXPORT_API_ENABLED or request.remote_addr not in EXPORT_API_HOSTS:
+        return jsonify({'error': 'Выгрузка через API отключена, используйте history_export.py'}), 403
+    
+    kind = request.args.get('kind', 'conversations')
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    object_type = request.args.get('type')
+    compress = request.args.get('gzip') in ('1', 'true')
+    
+    if kind not in EXPORT_KINDS:
+        return jsonify({'error': f'kind должен быть одним из: {", ".join(EXPORT_KINDS)}'}), 400
+    try:
+        # Даты разбираются при вызове, до начала потока - тем же кодом, что и фильтрует выгрузку
+        records = iter_export_records(history_shards.all_paths(), kind, date_from, date_to, object_type,
+                                      archive_dir=HISTORY_ARCHIVE_DIR)
+    except ValueError:
+        return jsonify({'error': 'Даты должны быть в формате ГГГГ-ММ-ДД или ISO 8601'}), 400
+    
+    filename = f"voicaj_{kind}.ndjson" + (".gz" if compress else "")
+    return Response(
+        stream_with_context(iter_ndjson(records, compress=compress)),
+        mimetype='application/gzip' if compress else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @app.route('/api/clear', methods=['POST'])
 def clear_history():
     session_id = session.get('session_id', str(uuid.uuid4()))
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = sqlite3.connect(history_shards.path_for(session_id))
     cursor = conn.cursor()
     cursor.execute('DELETE FROM conversations WHERE session_id = ?', (session_id,))
     conn.commit()
@@ -182,7 +257,7 @@ def clear_history():
 
 @app.route('/api/feedback', methods=['POST'])
 def submit_feedback():
-    """Принимает обратную связь для обучения модели"""
+    """Принимает обратную связь для обучения модели (обработка в фоне)"""
     try:
         data = request.get_json(force=True)
         user_input = data.get('user_input', '')
@@ -192,17 +267,47 @@ def submit_feedback():
         if not user_input or not feedback:
             return jsonify({'error': 'Необходимы user_input и feedback'}), 400
         
-        # Используем новую систему улучшения
-        improved_output = voicaj_llm.improve_from_feedback(user_input, model_output, feedback)
+        # Ставим в очередь - обучение не задерживает ответ
+        try:
+            job_id = feedback_queue.submit(user_input, model_output, feedback)
+        except FeedbackQueueFull as e:
+            return jsonify({'error': str(e)}), 503
         
         return jsonify({
-            'message': 'Обратная связь принята и модель улучшена',
-            'improved_output': improved_output
-        })
+            'message': 'Обратная связь принята и будет обработана',
+            'job_id': job_id,
+            'status_url': f'/api/feedback/{job_id}'
+        }), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/feedback/<job_id>')
+def feedback_status(job_id):
+    """Состояние задания обработки обратной связи"""
+    job = feedback_queue.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Задание не найдено'}), 404
+    return jsonify(job)
+
+@app.route('/api/learning')
+def learning_status():
+    """Онлайн-дообучение быстрых моделей: накопленные примеры и последние публикации"""
+    return jsonify(voicaj_llm.online_learner.status())
+
+@app.route('/api/metrics')
+def metrics():
+    """Счетчики обработки запросов: схлопывание одинаковых запросов, очередь к LLM и кэш генераций"""
+    try:
+        llm_cache = voicaj_llm.generation_cache.stats()
+    except sqlite3.Error as e:
+        llm_cache = {'error': str(e)}
+    return jsonify({
+        'inflight': voicaj_llm.inflight.stats(),
+        'llm_queue': voicaj_llm.llm_admission.stats(),
+        'llm_cache': llm_cache
+    })
+
 @app.route('/api/models')
 def get_models():
     try:
@@ -217,10 +322,16 @@ def get_models():
 
 if __name__ == '__main__':
     init_db()
+    start_retention_worker(list(history_archivers.values()), HISTORY_RETENTION_INTERVAL)
+    voicaj_llm.training_store.start_compactor()
+    voicaj_llm.start_hot_reload()
+    voicaj_llm.start_online_learning(MODEL_CHECKPOINT_INTERVAL)
+    feedback_queue.start()
     print("Starting local AI assistant...")
     print(f"Web interface will be available at: http://localhost:5000")
     print("Using Hybrid Voicaj LLM model (Rule-based + Neural Network)")
-    print(f"Database: {DATABASE_PATH}")
+    print(f"Database: {DATABASE_PATH} (shards: {HISTORY_SHARDS})")
+    print(f"History archive: {HISTORY_ARCHIVE_DIR} (older than {HISTORY_RETENTION_DAYS} days)")
     print("=" * 50)
     
     # Запуск в режиме доступности из сети
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+from collections import namedtuple
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+# Найденный фрагмент: kind - 'time' (value 'HH:MM') или 'date' (value - (способ, число), см. resolve_date);
+# start/end - позиции в тексте, confidence - насколько однозначно прочитано
+DateSpan = namedtuple('DateSpan', ['kind', 'value', 'start', 'end', 'confidence'])
+
+# Опорные даты дня запроса: смещения на 0..7 дней и ближайшие дни недели (обычный и «следующий»).
+# Считаются один раз на календарный день (см. request_clock.py)
+DayAnchors = namedtuple('DayAnchors', ['today', 'offsets', 'weekdays', 'next_weekdays'])
+
+# Без даты срок - завтра, без времени - конец рабочего дня (как раньше)
+DEFAULT_TIME = '18:00'
+DEFAULT_DAYS_AHEAD = 1
+
+# Уверенность подставленных значений. Время по умолчанию ниже 0.5 не опускает: если день назван
+# явно («завтра» - 0.95 * 0.6), срок не эскалируется - время в запросе не сказано, и LLM знает
+# его не лучше правила (18:00 совпадает с разметкой примерно в половине таких примеров)
+DEFAULT_DATE_CONFIDENCE = 0.5
+DEFAULT_TIME_CONFIDENCE = 0.6
+
+# Один проход регулярным выражением: время HH:MM, числа, слова (с дефисом - «когда-нибудь»)
+_TOKEN_RE = re.compile(r'(?P<clock>\b(?:[01]?\d|2[0-3]):[0-5]\d\b)|(?P<num>\d+)|(?P<word>[^\W\d_]+(?:-[^\W\d_]+)*)')
+
+
+def _forms(kind: str, value, *words: str):
+    return {word: (kind, value) for word in words}
+
+
+# Словарь грамматики: слово -> (класс, значение)
+_LEXICON = {
+    **_forms('prep', 'в', 'в', 'во'), **_forms('prep', 'к', 'к', 'ко'), **_forms('prep', 'до', 'до'),
+    **_forms('prep', 'около', 'около'), **_forms('prep', 'на', 'на'), **_forms('prep', 'через', 'через'),
+    **_forms('prep', 'после', 'после'),
+    **_forms('period', 'утро', 'утра', 'утром'), **_forms('period', 'день', 'днем', 'днём'),
+    **_forms('period', 'вечер', 'вечера', 'вечером'), **_forms('period', 'ночь', 'ночи', 'ночью'),
+    **_forms('hour', 1, 'час', 'часа', 'часов'),
+    # «день»/«дня» - и единица срока, и часть суток («в 3 дня»); различает грамматика
+    **_forms('unit', 1, 'день', 'дня', 'дней', 'сутки', 'суток'), **_forms('unit', 30, 'месяц', 'месяца', 'месяцев'),
+    **_forms('relday', 0, 'сегодня'), **_forms('relday', 1, 'завтра'), **_forms('relday', 2, 'послезавтра'),
+    **_forms('week', 7, 'неделе', 'неделю', 'недели', 'недель'),
+    **_forms('this', 0, 'этой', 'эту', 'этот', 'ближайшей', 'ближайший', 'ближайшую'),
+    **_forms('next', 7, 'следующей', 'следующую', 'следующий', 'следующее', 'будущей', 'будущий', 'будущую'),
+    **_forms('weekday', 0, 'понедельник', 'понедельника', 'понедельнику'),
+    **_forms('weekday', 1, 'вторник', 'вторника', 'вторнику'),
+    **_forms('weekday', 2, 'среда', 'среду', 'среды', 'среде'),
+    **_forms('weekday', 3, 'четверг', 'четверга', 'четвергу'),
+    **_forms('weekday', 4, 'пятница', 'пятницу', 'пятницы', 'пятнице'),
+    **_forms('weekday', 5, 'суббота', 'субботу', 'субботы', 'субботе'),
+    **_forms('weekday', 6, 'воскресенье', 'воскресенья', 'воскресенью'),
+    **{word: ('month', month) for month, words in enumerate((
+        ('января',), ('февраля',), ('марта',), ('апреля',), ('мая',), ('июня',), ('июля',), ('августа',),
+        ('сентября',), ('октября',), ('ноября',), ('декабря',)), 1) for word in words},
+    **{word: ('num', number) for number, word in enumerate((
+        'ноль', 'один', 'два', 'три', 'четыре', 'пять', 'шесть', 'семь', 'восемь', 'девять', 'десять',
+        'одиннадцать', 'двенадцать'))},
+    **_forms('num', 1, 'одну', 'одного'), **_forms('num', 2, 'две', 'пару'),
+    **_forms('clockword', '12:00', 'полдень'), **_forms('clockword', '00:00', 'полночь'),
+    **_forms('end', 0, 'конца', 'концу'),
+    **_forms('urgent', 0, 'срочно', 'немедленно'),
+}
+
+# Время по умолчанию для части суток без числа («вечером»)
+_PERIOD_TIME = {'утро': 10, 'день': 14, 'вечер': 18, 'ночь': 22}
+
+# Доверие к прочтениям: от явного HH:MM до части суток без числа
+CONFIDENCE = {
+    'clock': 0.95, 'hour_period': 0.9, 'hour_word': 0.85, 'hour_prep': 0.7, 'period': 0.5, 'end_of_day': 0.8,
+    'relday': 0.95, 'weekday': 0.9, 'month_day': 0.9, 'after': 0.9, 'week': 0.7, 'this_week': 0.6, 'urgent': 0.6,
+}
+
+
+def _apply_period(hour: int, period: Optional[str]) -> int:
+    """Час с учетом части суток: «7 вечера» -> 19, «3 дня» -> 15, «12 ночи» -> 0"""
+    if period == 'вечер' and hour < 12:
+        return hour + 12
+    if period == 'день' and 1 <= hour <= 6:
+        return hour + 12
+    if period == 'ночь':
+        if hour == 12:
+            return 0
+        if 9 <= hour < 12:
+            return hour + 12
+    return hour
+
+
+class DateTimeExtractor:
+    """Грамматика русских сроков поверх одного прохода токенизатора.
+
+    Токены - время HH:MM, числа и слова, классифицированные по словарю (_LEXICON).
+    Правила смотрят не дальше трех токенов вперед и сдвигают позицию за разобранный
+    фрагмент, поэтому разбор линеен по длине текста. Результат - фрагменты с позициями
+    и уверенностью; дату относительно дня запроса считает resolve_date.
+    """
+
+    def tokenize(self, text: str) -> List[Tuple[str, object, int, int, str]]:
+        """Токены (класс, значение, начало, конец, слово)"""
+        tokens = []
+        for match in _TOKEN_RE.finditer(text.lower()):
+            group = match.lastgroup
+            word = match.group()
+            if group == 'word':
+                kind, value = _LEXICON.get(word, ('other', None))
+            elif group == 'num':
+                kind, value = 'num', int(word)
+            else:
+                kind, value = 'clock', word
+            tokens.append((kind, value, match.start(), match.end(), word))
+        return tokens
+
+    def extract(self, text: str) -> List[DateSpan]:
+        """Все найденные фрагменты времени и даты в порядке текста"""
+        tokens = self.tokenize(text)
+        spans = []
+        i = 0
+        while i < len(tokens):
+            if tokens[i][0] == 'other':
+                i += 1
+                continue
+            span, consumed = self._match(tokens, i)
+            if span is not None:
+                spans.append(span)
+            i += max(consumed, 1)
+        return spans
+
+    @staticmethod
+    def _kind(tokens, i: int) -> Optional[str]:
+        return tokens[i][0] if i < len(tokens) else None
+
+    @staticmethod
+    def _word(tokens, i: int) -> Optional[str]:
+        return tokens[i][4] if i < len(tokens) else None
+
+    def _match(self, tokens, i: int) -> Tuple[Optional[DateSpan], int]:
+        """Правило, начинающееся с токена i: (фрагмент или None, сколько токенов разобрано)"""
+        kind, value, start, _, word = tokens[i]
+        nxt = self._kind(tokens, i + 1)
+        previous = tokens[i - 1][4] if i > 0 and tokens[i - 1][0] == 'prep' else None
+
+        def span(kind_, value_, last, confidence):
+            return DateSpan(kind_, value_, tokens[i - 1][2] if previous else start, tokens[last][3], confidence)
+
+        # HH:MM [часть суток]
+        if kind == 'clock':
+            hours, minutes = map(int, value.split(':'))
+            if nxt == 'period':
+                hours = _apply_period(hours, tokens[i + 1][1])
+                return span('time', f"{hours:02d}:{minutes:02d}", i + 1, CONFIDENCE['clock']), 2
+            return span('time', f"{hours:02d}:{minutes:02d}", i, CONFIDENCE['clock']), 1
+
+        if kind == 'num':
+            # «через N дней/недель»
+            if previous == 'через' and nxt in ('unit', 'week'):
+                return span('date', ('days', value * tokens[i + 1][1]), i + 1, CONFIDENCE['after']), 2
+            # «15 марта»
+            if nxt == 'month' and 1 <= value <= 31:
+                return span('date', ('month_day', tokens[i + 1][1] * 100 + value), i + 1, CONFIDENCE['month_day']), 2
+            at = previous in ('в', 'к', 'до', 'около')
+            if 0 <= value <= 24:
+                hours = value % 24
+                # «N часов вечера», «в N часов»; без предлога и части суток «2 часа» - длительность
+                if nxt == 'hour':
+                    if self._kind(tokens, i + 2) == 'period':
+                        hours = _apply_period(hours, tokens[i + 2][1])
+                        return span('time', f"{hours:02d}:00", i + 2, CONFIDENCE['hour_period']), 3
+                    if at:
+                        return span('time', f"{hours:02d}:00", i + 1, CONFIDENCE['hour_word']), 2
+                    return None, 2
+                # «7 утра», «в 3 дня»
+                if nxt == 'period' or (at and self._word(tokens, i + 1) == 'дня'):
+                    hours = _apply_period(hours, 'день' if nxt == 'unit' else tokens[i + 1][1])
+                    return span('time', f"{hours:02d}:00", i + 1, CONFIDENCE['hour_period']), 2
+                # «в 18», «до 12», «к 9» без единиц после числа; «в 5 компаний» - не время
+                if at and 7 <= value <= 23 and nxt not in ('unit', 'month', 'week') \
+                        and self._word(tokens, i + 1) not in ('минут', 'минуты', 'раз', 'раза', 'лет', 'года', 'кг'):
+                    return span('time', f"{hours:02d}:00", i, CONFIDENCE['hour_prep']), 1
+            return None, 1
+
+        if kind == 'relday':
+            return span('date', ('days', value), i, CONFIDENCE['relday']), 1
+
+        if kind == 'weekday':
+            return span('date', ('weekday', value), i, CONFIDENCE['weekday']), 1
+
+        # «следующей неделе», «эту неделю», «следующий вторник»
+        if kind in ('next', 'this'):
+            if nxt == 'week':
+                days = 7 if kind == 'next' else 3
+                return span('date', ('days', days), i + 1, CONFIDENCE['week' if kind == 'next' else 'this_week']), 2
+            if nxt == 'weekday':
+                weekday = tokens[i + 1][1]
+                method = 'next_weekday' if kind == 'next' else 'weekday'
+                return span('date', (method, weekday), i + 1, CONFIDENCE['weekday']), 2
+            return None, 1
+
+        # «через неделю», «через день»
+        if kind == 'prep' and value == 'через' and nxt in ('unit', 'week'):
+            return DateSpan('date', ('days', tokens[i + 1][1]), start, tokens[i + 1][3], CONFIDENCE['after']), 2
+
+        # «до конца дня»
+        if kind == 'end' and self._word(tokens, i + 1) == 'дня':
+            return span('time', '23:59', i + 1, CONFIDENCE['end_of_day']), 2
+
+        if kind == 'clockword':
+            return span('time', value, i, CONFIDENCE['hour_word']), 1
+
+        # «утром», «вечером» без числа; именительный падеж («каждый вечер») не срок
+        if kind == 'period' and word not in ('утро', 'день', 'вечер', 'ночь'):
+            return span('time', f"{_PERIOD_TIME[value]:02d}:00", i, CONFIDENCE['period']), 1
+
+        if kind == 'urgent':
+            return span('date', ('days', 0), i, CONFIDENCE['urgent']), 1
+
+        return None, 1
+
+
+def best_span(spans: List[DateSpan], kind: str) -> Optional[DateSpan]:
+    """Самый уверенный фрагмент данного вида (при равенстве - первый в тексте)"""
+    best = None
+    for span in spans:
+        if span.kind == kind and (best is None or span.confidence > best.confidence):
+            best = span
+    return best
+
+
+def day_anchors(today: date) -> DayAnchors:
+    """Опорные даты для дня today"""
+    offsets = tuple(today + timedelta(days=days) for days in range(8))
+    # Ближайший такой день недели после сегодняшнего; «следующий» - через неделю, если этот
+    # день еще на текущей неделе
+    weekdays, next_weekdays = [], []
+    for weekday in range(7):
+        days = (weekday - today.weekday()) % 7 or 7
+        weekdays.append(offsets[days])
+        next_weekdays.append(today + timedelta(days=days + 7 if days < 7 - today.weekday() else days))
+    return DayAnchors(today, offsets, tuple(weekdays), tuple(next_weekdays))
+
+
+def resolve_date(value: Tuple[str, int], anchors: DayAnchors) -> date:
+    """Дата фрагмента относительно дня запроса"""
+    method, number = value
+    if method == 'days':
+        return anchors.offsets[number] if number < len(anchors.offsets) else anchors.today + timedelta(days=number)
+    if method == 'weekday':
+        return anchors.weekdays[number]
+    if method == 'next_weekday':
+        return anchors.next_weekdays[number]
+    month, day = divmod(number, 100)
+    try:
+        resolved = anchors.today.replace(month=month, day=day)
+        if resolved < anchors.today:
+            resolved = resolved.replace(year=resolved.year + 1)
+    except ValueError:
+        return anchors.offsets[DEFAULT_DAYS_AHEAD]
+    return resolved
+
+
+def due_date(spans: List[DateSpan], anchors: DayAnchors) -> Tuple[str, float]:
+    """Срок 'YYYY-MM-DD HH:MM' и уверенность (произведение уверенностей даты и времени;
+    для подставленных значений - DEFAULT_DATE_CONFIDENCE и DEFAULT_TIME_CONFIDENCE)"""
+    date_span = best_span(spans, 'date')
+    time_span = best_span(spans, 'time')
+    if date_span is not None:
+        day, date_confidence = resolve_date(date_span.value, anchors), date_span.confidence
+    else:
+        day, date_confidence = anchors.offsets[DEFAULT_DAYS_AHEAD], DEFAULT_DATE_CONFIDENCE
+    time, time_confidence = (time_span.value, time_span.confidence) if time_span is not None \
+        else (DEFAULT_TIME, DEFAULT_TIME_CONFIDENCE)
+    return f"{day.isoformat()} {time}", round(date_confidence * time_confidence, 3)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Замер разбора сроков на примерах обучения")
+    parser.add_argument("--data", default="voicaj_training_data.json", help="Снимок данных обучения")
+    parser.add_argument("--repeat", type=int, default=20, help="Повторов для замера")
+    parser.add_argument("--show", type=int, default=0, help="Показать N расхождений с разметкой")
+    args = parser.parse_args()
+
+    from training_store import TrainingStore
+    examples = TrainingStore(args.data).load()
+    labeled = [(example['input'], example['expected'][0]['dueDate']) for example in examples
+               if example.get('input') and example.get('expected') and example['expected'][0].get('dueDate')]
+    extractor = DateTimeExtractor()
+    anchors = day_anchors(date.today())
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        results = [due_date(extractor.extract(text), anchors) for text, _ in labeled]
+    elapsed_us = (time.perf_counter() - start) * 1e6 / args.repeat / max(len(labeled), 1)
+
+    matches = [result[0][11:] == expected[11:] for result, (_, expected) in zip(results, labeled)]
+    print(f"⏱️ Разбор срока: {elapsed_us:.1f} мкс/текст на {len(labeled)} примерах")
+    print(f"🎯 Время совпадает с разметкой: {sum(matches) / max(len(matches), 1):.1%}")
+    shown = 0
+    for (text, expected), (result, confidence), match in zip(labeled, results, matches):
+        if not match and shown < args.show:
+            print(f"   {expected[11:]} != {result[11:]} ({confidence:.2f}): {text}")
+            shown += 1
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Callable, List, Dict, Any, Optional, Sequence, Tuple
+
+from training_store import _file_lock, _example_key
+from type_classifier import VOICAJ_TYPES, PRIORITY_LEVELS
+
+DISTILL_LOG_PATH = "voicaj_distill.jsonl"
+DISTILL_REPORT_PATH = "voicaj_distill_report.jsonl"
+
+# Сложный по эвристикам запрос остается в быстром контуре, если классификатор типов настолько уверен
+DISTILL_CONFIDENCE_THRESHOLD = 0.85
+
+# Заглушки из промптов llm_analysis: объект с ними - эхо шаблона, а не ответ модели
+PROMPT_PLACEHOLDERS = {
+    'Emotional state', 'Task to complete', 'New habit', 'Long-term goal', 'Task', 'Mood', 'Moods', 'Задача',
+    'Current emotional state and feelings', 'Specific task that needs to be done', 'Regular activity to develop',
+    'Important long-term objective', 'Specific task to complete'
+}
+
+
+def analysis_prompt(text: str, detected_types: Sequence[str], today: datetime) -> str:
+    """Промпт llm_analysis: реплика пользователя, вступление ассистента и объекты-заглушки
+    (PROMPT_PLACEHOLDERS) под обнаруженные типы; модель продолжает после них"""
+    current_date = today.strftime("%Y-%m-%d")
+    tomorrow = (today + timedelta(days=1)).strftime("%Y-%m-%d")
+
+    if 'mood_entry' in detected_types and 'task' in detected_types:
+        prompt = f"""User: {text}
+
+Assistant: I'll create both a mood entry and a task for you.
+
+Mood Entry:
+{{
+    "title": "Emotional state",
+    "type": "mood_entry",
+    "description": "Current emotional state and feelings",
+    "tags": ["настроение", "эмоции"],
+    "priority": "high",
+    "dueDate": "{current_date} 18:00"
+}}
+
+Task:
+{{
+    "title": "Task to complete",
+    "type": "task",
+    "description": "Specific task that needs to be done",
+    "tags": ["задача"],
+    "priority": "high",
+    "dueDate": "{tomorrow} 18:00"
+}}"""
+    elif 'habit' in detected_types:
+        prompt = f"""User: {text}
+
+Assistant: I'll create a habit for you.
+
+{{
+    "title": "New habit",
+    "type": "habit",
+    "description": "Regular activity to develop",
+    "tags": ["привычка"],
+    "priority": "medium",
+    "dueDate": "{tomorrow} 18:00"
+}}"""
+    elif 'goal' in detected_types:
+        prompt = f"""User: {text}
+
+Assistant: I'll create a long-term goal for you.
+
+{{
+    "title": "Long-term goal",
+    "type": "goal",
+    "description": "Important long-term objective",
+    "tags": ["цель"],
+    "priority": "medium",
+            "dueDate": "2025-12-31 23:59"
+}}"""
+    else:
+        # Простая задача
+        prompt = f"""User: {text}
+
+Assistant: I'll create a task for you.
+
+{{
+    "title": "Task",
+    "type": "task",
+    "description": "Specific task to complete",
+    "tags": ["задача"],
+    "priority": "high",
+    "dueDate": "{tomorrow} 18:00"
+}}"""
+    return prompt
+
+
+def needs_llm(rules, type_classifier, text: str) -> bool:
+    """Эскалация в LLM: запрос сложный по правилам и быстрые модели в нем не уверены"""
+    if not rules.is_complex(text):
+        return False
+    return float(type_classifier.confidence([text])[0]) < DISTILL_CONFIDENCE_THRESHOLD
+
+
+def escalation_share(route: Callable[[str], Optional[str]], texts: Sequence[str]) -> float:
+    """Доля запросов, которые дошли бы до LLM (целиком или по полям); route - маршрут
+    запроса, например HybridVoicajLLM.llm_route"""
+    if not texts:
+        return 0.0
+    return sum(1 for text in texts if route(text)) / len(texts)
+
+
+def validate_llm_objects(objects: Any) -> List[Dict[str, Any]]:
+    """Оставляет объекты LLM, пригодные для обучения: схема соблюдена и это не эхо шаблона промпта"""
+    if not isinstance(objects, list):
+        return []
+    valid = []
+    for obj in objects:
+        if not isinstance(obj, dict) or obj.get('type') not in VOICAJ_TYPES:
+            continue
+        title, description = obj.get('title'), obj.get('description')
+        if not isinstance(title, str) or not title.strip() or title in PROMPT_PLACEHOLDERS:
+            continue
+        if not isinstance(description, str) or description in PROMPT_PLACEHOLDERS:
+            continue
+        if obj.get('priority') not in PRIORITY_LEVELS:
+            continue
+        tags = obj.get('tags')
+        if not isinstance(tags, list) or not tags or not all(isinstance(tag, str) and tag for tag in tags):
+            continue
+        valid.append(obj)
+    return valid
+
+
+class DistillationLog:
+    """Журнал удачных ответов LLM (JSONL, дописывается всеми воркерами)"""
+
+    def __init__(self, path: str = DISTILL_LOG_PATH):
+        self.path = path
+
+    def record(self, text: str, objects: List[Dict[str, Any]]) -> bool:
+        """Сохраняет ответ LLM, если в нем есть валидные объекты"""
+        valid = validate_llm_objects(objects)
+        if not text or not valid:
+            return False
+        line = json.dumps({'input': text, 'expected': valid, 'timestamp': datetime.now().isoformat()},
+                          ensure_ascii=False) + '\n'
+        with _file_lock(self.path, exclusive=True):
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        return True
+
+    def read(self, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """Записи после offset и новое смещение (недописанная последняя строка не читается)"""
+        records = []
+        try:
+            with _file_lock(self.path, exclusive=False):
+                with open(self.path, 'rb') as f:
+                    f.seek(offset)
+                    data = f.read()
+        except FileNotFoundError:
+            return records, offset
+
+        consumed = data.rfind(b'\n') + 1
+        for line in data[:consumed].splitlines():
+            try:
+                records.append(json.loads(line.decode('utf-8')))
+            except (ValueError, UnicodeDecodeError):
+                continue
+        return records, offset + consumed
+
+
+def dedupe_distilled(records: Sequence[Dict[str, Any]],
+                     known: Sequence[Dict[str, Any]] = ()) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Схлопывает повторы по нормализованному запросу (берется последний ответ).
+
+    Запросы, на которые LLM давала разные наборы типов, отбрасываются как противоречивые;
+    запросы, уже присутствующие в данных обучения, пропускаются.
+    """
+    known_keys = {_example_key(example) for example in known}
+    latest: Dict[str, Dict[str, Any]] = {}
+    type_sets: Dict[str, set] = {}
+    stats = {'records': len(records), 'invalid': 0, 'duplicates': 0, 'conflicts': 0, 'known': 0}
+
+    for record in records:
+        objects = validate_llm_objects(record.get('expected'))
+        if not record.get('input') or not objects:
+            stats['invalid'] += 1
+            continue
+        key = _example_key(record)
+        if key in latest:
+            stats['duplicates'] += 1
+        types = frozenset(obj['type'] for obj in objects)
+        type_sets.setdefault(key, set()).add(types)
+        latest[key] = dict(record, expected=objects)
+
+    examples = []
+    for key, record in latest.items():
+        if len(type_sets[key]) > 1:
+            stats['conflicts'] += 1
+        elif key in known_keys:
+            stats['known'] += 1
+        else:
+            examples.append({
+                'input': record['input'],
+                'expected': record['expected'],
+                'feedback': 'дистилляция ответа LLM',
+                'source': 'llm_distill',
+                'timestamp': record.get('timestamp', datetime.now().isoformat())
+            })
+    return examples, stats
+
+
+def load_traffic_sample(db_paths: Sequence[str], limit: int = 2000) -> List[str]:
+    """Последние запросы пользователей из истории (по всем шардам) для оценки доли эскалаций"""
+    texts = []
+    per_shard = max(1, limit // max(len(db_paths), 1))
+    for db_path in db_paths:
+        if not os.path.exists(db_path):
+            continue
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            rows = conn.execute('SELECT user_message FROM conversations ORDER BY id DESC LIMIT ?', (per_shard,))
+            texts.extend(row[0] for row in rows if row[0])
+        except sqlite3.OperationalError:
+            continue
+        finally:
+            conn.close()
+    return texts
+
+
+def read_report(path: str = DISTILL_REPORT_PATH) -> List[Dict[str, Any]]:
+    """Все раунды дистилляции"""
+    rounds = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    rounds.append(json.loads(line))
+    except FileNotFoundError:
+        pass
+    return rounds
+
+
+def append_report(entry: Dict[str, Any], path: str = DISTILL_REPORT_PATH):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def last_offset(rounds: Sequence[Dict[str, Any]]) -> int:
+    """Смещение в журнале дистилляции, до которого он уже обработан"""
+    return rounds[-1].get('log_offset', 0) if rounds else 0
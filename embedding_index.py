@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+from lm_finetune import LM_MODEL_NAME, load_causal_lm
+
+EMBEDDING_INDEX_PATH = "voicaj_embeddings"
+
+# Ниже этого косинуса семантический сосед не считается похожим примером
+EMBEDDING_MIN_SCORE = 0.8
+
+# IVF включается на корпусах от этого размера: полный перебор float16 стоит ~2 мс на тысячу векторов
+IVF_MIN_VECTORS = 5000
+
+
+class MeanPoolEmbedder:
+    """Эмбеддинги текстов: скрытые состояния последнего слоя локальной модели, усредненные по токенам"""
+
+    def __init__(self, model, tokenizer, model_id: str, max_length: int = 64):
+        self.model = model.eval()
+        self.tokenizer = tokenizer
+        self.model_id = model_id
+        self.max_length = max_length
+        self.pad_token_id = getattr(tokenizer, 'pad_token_id', None) or tokenizer.eos_token_id
+
+    @classmethod
+    def load(cls, model_id: str = LM_MODEL_NAME, max_length: int = 64) -> 'MeanPoolEmbedder':
+        model, tokenizer = load_causal_lm(model_id)
+        return cls(model, tokenizer, model_id, max_length)
+
+    @torch.inference_mode()
+    def encode(self, texts: Sequence[str], batch_size: int = 32) -> np.ndarray:
+        """Нормированные эмбеддинги (n_texts x dim, float32); тексты идут пачками одной длины по возрастанию"""
+        encoded = [self.tokenizer.encode(text or ' ')[:self.max_length] or [self.pad_token_id] for text in texts]
+        # Сортировка по длине: в пачке почти нет паддинга
+        order = sorted(range(len(encoded)), key=lambda index: len(encoded[index]))
+        result = None
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            length = max(len(encoded[row]) for row in rows)
+            input_ids = torch.full((len(rows), length), self.pad_token_id, dtype=torch.long)
+            mask = torch.zeros((len(rows), length), dtype=torch.long)
+            for position, row in enumerate(rows):
+                input_ids[position, :len(encoded[row])] = torch.tensor(encoded[row])
+                mask[position, :len(encoded[row])] = 1
+            hidden = self.model(input_ids=input_ids, attention_mask=mask, output_hidden_states=True).hidden_states[-1]
+            weights = mask.unsqueeze(-1).to(hidden.dtype)
+            pooled = ((hidden * weights).sum(dim=1) / weights.sum(dim=1)).float().numpy()
+            if result is None:
+                result = np.zeros((len(texts), pooled.shape[1]), dtype=np.float32)
+            result[rows] = pooled
+        if result is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return _normalize(result)
+
+
+def inputs_hash(examples: Sequence[Dict[str, Any]], rows: int) -> str:
+    """Хеш текстов первых rows примеров: по нему индекс проверяет, что строка i - это training_data[i]"""
+    digest = hashlib.blake2b(digest_size=16)
+    for row in range(rows):
+        digest.update((examples[row].get('input') or '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10, sample: int = 20000,
+            seed: int = 0) -> np.ndarray:
+    """Сферический k-means (центроиды нормированы, близость - скалярное произведение)"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample:
+        vectors = vectors[rng.choice(len(vectors), sample, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = np.bincount(assignment, minlength=n_clusters) == 0
+        # Пустой кластер получает случайную точку, иначе его центроид обнулится
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids.astype(np.float32)
+
+
+class EmbeddingIndex:
+    """Векторы примеров обучения в файле float16 (mmap) с плоским или IVF поиском.
+
+    Файлы: <path>.f16 - строки векторов подряд, <path>.json - модель, размерность, тип
+    индекса, число строк и хеш их текстов (inputs_hash), для IVF - <path>.ivf.npy (центроиды)
+    и <path>.lists (номер списка каждого вектора, int32). Строка i соответствует
+    training_data[i], пока совпадает хеш: сжатие журнала обучения переставляет примеры, и
+    тогда индекс нужно пересобрать. У примеров без текста нулевой вектор, он не находится никогда. Файлы пишет только voicaj_trainer.py; векторы примеров,
+    пришедших после сборки, каждый воркер держит в памяти (хвост) и перебирает полностью.
+    """
+
+    def __init__(self, path: str, meta: Dict[str, Any], centroids: Optional[np.ndarray] = None):
+        self.path = path
+        self.meta = meta
+        self.dim = meta['dim']
+        self.centroids = centroids
+        self.nprobe = meta.get('nprobe', 8)
+        self._open()
+
+    def _open(self):
+        count = os.path.getsize(self.path + '.f16') // (self.dim * 2)
+        vectors = np.memmap(self.path + '.f16', dtype=np.float16, mode='r',
+                            shape=(count, self.dim)) if count else np.zeros((0, self.dim), np.float16)
+        lists = None
+        if self.centroids is not None:
+            assignment = np.fromfile(self.path + '.lists', dtype=np.int32)[:count]
+            order = np.argsort(assignment, kind='stable')
+            lists = (order.astype(np.int64), np.searchsorted(assignment[order], np.arange(len(self.centroids) + 1)))
+        # Файл, списки IVF и хвост подменяются одним присваиванием: поиск видит согласованное состояние
+        self._state = (vectors, lists, np.zeros((0, self.dim), np.float16))
+
+    @property
+    def stored(self) -> int:
+        """Число векторов в файле"""
+        return len(self._state[0])
+
+    def __len__(self) -> int:
+        vectors, _, tail = self._state
+        return len(vectors) + len(tail)
+
+    def matches(self, training_data: Sequence[Dict[str, Any]]) -> bool:
+        """Строки файла - это первые примеры training_data в том же порядке"""
+        return (self.meta.get('rows') == self.stored <= len(training_data)
+                and self.meta.get('inputs_hash') == inputs_hash(training_data, self.stored))
+
+    def _write_meta(self):
+        with open(self.path + '.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(self.path + '.json.tmp', self.path + '.json')
+
+    @classmethod
+    def build(cls, path: str, vectors: np.ndarray, model_id: str, kind: str = 'auto',
+              nlist: Optional[int] = None, nprobe: int = 8, source: str = '') -> 'EmbeddingIndex':
+        """Записывает индекс из нормированных векторов (kind: flat, ivf или auto по размеру корпуса);
+        source - inputs_hash примеров, из которых посчитаны векторы"""
+        if kind == 'auto':
+            kind = 'ivf' if len(vectors) >= IVF_MIN_VECTORS else 'flat'
+        meta = {'model': model_id, 'dim': int(vectors.shape[1]), 'kind': kind, 'nprobe': nprobe,
+                'rows': len(vectors), 'inputs_hash': source}
+
+        centroids = None
+        if kind == 'ivf':
+            nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+            centroids = _kmeans(vectors.astype(np.float32), nlist)
+            meta['nlist'] = nlist
+            np.save(path + '.ivf.npy', centroids)
+            _assign(vectors, centroids).tofile(path + '.lists.tmp')
+            os.replace(path + '.lists.tmp', path + '.lists')
+
+        vectors.astype(np.float16).tofile(path + '.f16.tmp')
+        os.replace(path + '.f16.tmp', path + '.f16')
+        index = cls(path, meta, centroids)
+        index._write_meta()
+        return index
+
+    @classmethod
+    def open(cls, path: str = EMBEDDING_INDEX_PATH) -> Optional['EmbeddingIndex']:
+        """Открывает индекс; None, если он не построен (семантический поиск тогда выключен)"""
+        try:
+            with open(path + '.json', 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            centroids = np.load(path + '.ivf.npy') if meta.get('kind') == 'ivf' else None
+            return cls(path, meta, centroids)
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            return None
+
+    def add(self, vectors: np.ndarray):
+        """Добавляет векторы новых примеров в хвост в памяти"""
+        stored, lists, tail = self._state
+        self._state = (stored, lists, np.concatenate((tail, vectors.astype(np.float16))))
+
+    def append_to_file(self, vectors: np.ndarray, source: str):
+        """Дописывает векторы в файлы индекса (инкрементальное обновление из voicaj_trainer.py).
+        Метаданные пишутся последними: после сбоя число строк не совпадет, и индекс пересоберется."""
+        if self.centroids is not None:
+            with open(self.path + '.lists', 'ab') as f:
+                f.write(_assign(vectors, self.centroids).tobytes())
+        with open(self.path + '.f16', 'ab') as f:
+            f.write(vectors.astype(np.float16).tobytes())
+        self._open()
+        self.meta.update(rows=self.stored, inputs_hash=source)
+        self._write_meta()
+
+    def _candidates(self, lists, query: np.ndarray) -> Optional[np.ndarray]:
+        """Номера векторов файла из nprobe ближайших списков IVF (None - плоский перебор)"""
+        if lists is None:
+            return None
+        order, bounds = lists
+        probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        return np.sort(np.concatenate([order[bounds[probe]:bounds[probe + 1]] for probe in probes]))
+
+    def search(self, query: np.ndarray, k: int = 5, min_score: float = EMBEDDING_MIN_SCORE,
+               chunk_rows: int = 16384) -> List[Tuple[int, float]]:
+        """До k ближайших векторов по косинусу: [(номер, косинус)] по убыванию"""
+        vectors, lists, tail = self._state
+        if not len(vectors) + len(tail) or k <= 0:
+            return []
+        query = query.astype(np.float32)
+        candidates = self._candidates(lists, query)
+        if candidates is None:
+            scores = np.empty(len(vectors), dtype=np.float32)
+            for start in range(0, len(vectors), chunk_rows):
+                scores[start:start + chunk_rows] = vectors[start:start + chunk_rows].astype(np.float32) @ query
+            ids = np.arange(len(vectors))
+        else:
+            scores = vectors[candidates].astype(np.float32) @ query
+            ids = candidates
+        if len(tail):
+            scores = np.concatenate((scores, tail.astype(np.float32) @ query))
+            ids = np.concatenate((ids, np.arange(len(vectors), len(vectors) + len(tail))))
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(ids[row]), float(scores[row])) for row in top if scores[row] >= min_score]
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_rows: int = 16384) -> np.ndarray:
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk_rows):
+        chunk = vectors[start:start + chunk_rows].astype(np.float32)
+        assignment[start:start + chunk_rows] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignment
+
+
+def _embed_texts(embedder: 'MeanPoolEmbedder', texts: Sequence[Optional[str]], batch_size: int = 32) -> np.ndarray:
+    """Эмбеддинги пачками; у пустых текстов нулевой вектор"""
+    vectors = embedder.encode([text or '' for text in texts], batch_size)
+    vectors[[not text for text in texts]] = 0.0
+    return vectors
+
+
+class SemanticSearch:
+    """Семантический поиск похожих примеров: модель эмбеддингов + индекс, синхронный с training_data"""
+
+    def __init__(self, index: EmbeddingIndex, embedder: MeanPoolEmbedder):
+        self.index = index
+        self.embedder = embedder
+
+    @classmethod
+    def open(cls, training_data: Sequence[Dict[str, Any]],
+             path: str = EMBEDDING_INDEX_PATH) -> Optional['SemanticSearch']:
+        """Поиск по построенному индексу; None, если индекса нет или он собран по другим данным
+        (другой порядок или состав примеров - например, после сжатия журнала обучения).
+        Примеры, добавленные после сборки, досчитываются в память при открытии."""
+        index = EmbeddingIndex.open(path)
+        if index is None:
+            return None
+        if not index.matches(training_data):
+            print(f"⚠️ Индекс эмбеддингов собран по другим данным обучения ({index.stored} векторов на "
+                  f"{len(training_data)} примеров), семантический поиск выключен; пересоберите: "
+                  f"python voicaj_trainer.py build-embeddings")
+            return None
+        search = cls(index, MeanPoolEmbedder.load(index.meta['model']))
+        missing = [training_data[row].get('input') for row in range(len(index), len(training_data))]
+        if missing:
+            index.add(_embed_texts(search.embedder, missing))
+        return search
+
+    def add(self, text: Optional[str]):
+        """Эмбеддинг нового примера обратной связи (пример без текста - нулевой вектор)"""
+        self.index.add(_embed_texts(self.embedder, [text]))
+
+    def query(self, text: str, k: int = 5, min_score: float = EMBEDDING_MIN_SCORE) -> List[Tuple[int, float]]:
+        return self.index.search(self.embedder.encode([text])[0], k, min_score)
+
+
+def build_embedding_index(examples: Sequence[Dict[str, Any]], path: str = EMBEDDING_INDEX_PATH,
+                          model_id: str = LM_MODEL_NAME, kind: str = 'auto', batch_size: int = 32,
+                          max_length: int = 64, update: bool = False) -> Tuple[EmbeddingIndex, int, float]:
+    """Эмбеддинги входов обучения пачками; возвращает индекс, число посчитанных векторов и скорость (текстов/с).
+    При update досчитываются только примеры, которых еще нет в файле индекса той же модели;
+    если строки файла уже не совпадают с началом examples, индекс собирается заново."""
+    index = EmbeddingIndex.open(path) if update else None
+    if index is not None and (index.meta['model'] != model_id or not index.matches(examples)):
+        index = None
+    start_row = index.stored if index is not None else 0
+
+    embedder = MeanPoolEmbedder.load(model_id, max_length)
+    texts = [examples[row].get('input') for row in range(start_row, len(examples))]
+    start = time.perf_counter()
+    vectors = _embed_texts(embedder, texts, batch_size)
+    rate = len(texts) / max(time.perf_counter() - start, 1e-9)
+    source = inputs_hash(examples, len(examples))
+    if index is None:
+        index = EmbeddingIndex.build(path, vectors, model_id, kind, source=source)
+    elif len(vectors):
+        index.append_to_file(vectors, source)
+    return index, len(texts), rate
+
+
+def benchmark_search(dim: int, sizes: Sequence[int], queries: int = 200, k: int = 5,
+                     seed: int = 0) -> List[Dict[str, Any]]:
+    """Задержка поиска (мс на запрос) плоского и IVF индекса в зависимости от размера корпуса.
+
+    Корпус - синтетические векторы вокруг случайных тем, запрос - зашумленная копия одного
+    из векторов; ivf_recall - доля запросов, для которых IVF нашел тот же лучший вектор, что и перебор.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            topics = _normalize(rng.standard_normal((max(size // 50, 1), dim)).astype(np.float32))
+            vectors = _normalize(topics[rng.integers(0, len(topics), size)]
+                                 + 0.5 * rng.standard_normal((size, dim)).astype(np.float32) / np.sqrt(dim))
+            probes = _normalize(vectors[rng.integers(0, size, queries)]
+                                + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32) / np.sqrt(dim))
+            row = {'size': size}
+            for kind in ('flat', 'ivf'):
+                index = EmbeddingIndex.build(os.path.join(directory, f"{kind}_{size}"), vectors, 'benchmark', kind)
+                start = time.perf_counter()
+                found = [index.search(probe, k, -1.0) for probe in probes]
+                row[f'{kind}_ms'] = (time.perf_counter() - start) * 1000 / queries
+                if kind == 'flat':
+                    exact = [result[0][0] for result in found]
+                else:
+                    row['ivf_recall'] = float(np.mean([result[0][0] == truth for result, truth in zip(found, exact)]))
+                del index
+            rows.append(row)
+    return rows
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import io
+import uuid
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from type_classifier import VOICAJ_TYPES
+from field_confidence import ESCALATED_FIELDS, valid_field
+
+# Fix console encoding for Windows
+if sys.platform.startswith('win'):
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+# Этапы обработки обратной связи (progress = номер этапа / число этапов)
+FEEDBACK_STAGES = ['validate', 'persist', 'index', 'done']
+
+# Состояние заданий - в SQLite рядом с журналом обучения: опрос статуса может попасть на
+# другой воркер, чем тот, что принял задание
+FEEDBACK_JOBS_PATH = "voicaj_feedback_jobs.db"
+
+# Предел очереди воркера: при переполнении POST /api/feedback отвечает 503
+FEEDBACK_QUEUE_SIZE = 1000
+
+_JOB_FIELDS = ('id', 'status', 'stage', 'progress', 'error', 'created_at', 'finished_at')
+
+
+class FeedbackQueueFull(Exception):
+    """Очередь обратной связи переполнена"""
+
+
+class FeedbackQueue:
+    """Очередь обратной связи: эндпоинт ставит задание, фоновый воркер обучает модель"""
+
+    def __init__(self, llm, path: str = FEEDBACK_JOBS_PATH, max_finished_jobs: int = 1000,
+                 max_queued: int = FEEDBACK_QUEUE_SIZE):
+        self.llm = llm
+        self.path = path
+        self.max_finished_jobs = max_finished_jobs
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение с базой заданий (WAL, ожидание блокировки, схема при первом открытии)"""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS feedback_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress REAL NOT NULL,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                finished_at TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS feedback_jobs_finished ON feedback_jobs (finished_at)')
+        return conn
+
+    def start(self):
+        """Запускает фоновый воркер (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="feedback-worker", daemon=True)
+                self._worker.start()
+
+    def submit(self, user_input: str, model_output: List[Dict], feedback: str) -> str:
+        """Ставит обратную связь в очередь и сразу возвращает id задания;
+        FeedbackQueueFull, если очередь переполнена"""
+        self.start()
+        job_id = str(uuid.uuid4())
+        conn = self._connect()
+        try:
+            conn.execute('INSERT INTO feedback_jobs VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (job_id, 'queued', None, 0.0, None, datetime.now().isoformat(), None))
+            try:
+                self._queue.put_nowait((job_id, user_input, model_output, feedback))
+            except queue.Full:
+                conn.execute('DELETE FROM feedback_jobs WHERE id = ?', (job_id,))
+                raise FeedbackQueueFull(f"Очередь обратной связи переполнена ({self._queue.maxsize} заданий)")
+            self._evict_finished(conn)
+        finally:
+            conn.close()
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Состояние задания (с любого воркера) и размер очереди этого воркера"""
+        conn = self._connect()
+        try:
+            row = conn.execute(f"SELECT {', '.join(_JOB_FIELDS)} FROM feedback_jobs WHERE id = ?",
+                               (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        result = dict(zip(_JOB_FIELDS, row))
+        if result['status'] == 'queued':
+            result['queue_size'] = self._queue.qsize()
+        return result
+
+    def _update(self, job_id: str, **fields):
+        assignments = ', '.join(f'{field} = ?' for field in fields)
+        conn = self._connect()
+        try:
+            conn.execute(f'UPDATE feedback_jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+        finally:
+            conn.close()
+
+    def _set_stage(self, job_id: str, stage: str):
+        progress = FEEDBACK_STAGES.index(stage) / (len(FEEDBACK_STAGES) - 1)
+        self._update(job_id, status='running', stage=stage, progress=round(progress, 2))
+
+    def _evict_finished(self, conn: sqlite3.Connection):
+        """Ограничивает историю заданий: удаляем самые старые завершенные"""
+        conn.execute('''
+            DELETE FROM feedback_jobs WHERE finished_at IS NOT NULL AND id NOT IN (
+                SELECT id FROM feedback_jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT ?
+            )
+        ''', (self.max_finished_jobs,))
+
+    def _validate(self, user_input: Any, model_output: Any, feedback: Any):
+        if not isinstance(user_input, str) or not user_input.strip():
+            raise ValueError('user_input должен быть непустой строкой')
+        if not isinstance(feedback, str) or not feedback.strip():
+            raise ValueError('feedback должен быть непустой строкой')
+        if not isinstance(model_output, list):
+            raise ValueError('model_output должен быть списком объектов')
+        for obj in model_output:
+            if not isinstance(obj, dict) or obj.get('type') not in VOICAJ_TYPES:
+                raise ValueError(f"Каждый объект model_output должен содержать type из {', '.join(VOICAJ_TYPES)}")
+            # Поля необязательны, но заданные проверяются так же, как ответы LLM
+            for field in ESCALATED_FIELDS:
+                if obj.get(field) is not None and not valid_field(field, obj[field]):
+                    raise ValueError(f'Недопустимое значение поля {field}: {obj[field]!r}')
+
+    def _run(self):
+        while True:
+            job_id, user_input, model_output, feedback = self._queue.get()
+            try:
+                self._set_stage(job_id, 'validate')
+                self._validate(user_input, model_output, feedback)
+
+                # Сначала фиксируем пример на диске, затем обновляем память
+                self._set_stage(job_id, 'persist')
+                training_example = self.llm.build_training_example(user_input, model_output, feedback)
+                self.llm.training_store.append(training_example)
+
+                self._set_stage(job_id, 'index')
+                self.llm.add_training_example(training_example)
+
+                self._update(job_id, status='done', stage='done', progress=1.0,
+                             finished_at=datetime.now().isoformat())
+                print(f"🎓 Обратная связь {job_id[:8]} обработана")
+            except Exception as e:
+                self._update(job_id, status='failed', error=str(e), finished_at=datetime.now().isoformat())
+                print(f"❌ Ошибка обработки обратной связи {job_id[:8]}: {e}")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+from type_classifier import PRIORITY_LEVELS
+from distillation import PROMPT_PLACEHOLDERS
+
+# Поля объекта, для которых считается уверенность (тип не эскалируется: его выбирает каскад модель -> правила)
+ESCALATED_FIELDS = ('title', 'description', 'tags', 'priority', 'dueDate')
+
+# Из похожих примеров берутся только метки (теги, приоритет). Заголовок и описание - свободный текст
+# про чужой запрос: при сходстве ~0.5 сосед говорит о другом ("выучить японский" -> "Поиск IT работы
+# в Токио"), поэтому их дописывает только LLM. Срок привязан к дате запроса и тоже не берется
+RETRIEVABLE_FIELDS = ('tags', 'priority')
+
+# Поле ниже этого порога уходит на следующий уровень, но только у объекта со средней уверенностью ниже
+# OBJECT_CONFIDENCE_THRESHOLD (или сложного по правилам запроса, в котором не уверен классификатор типов)
+FIELD_CONFIDENCE_THRESHOLD = 0.5
+OBJECT_CONFIDENCE_THRESHOLD = 0.6
+
+# Уверенность заголовка и описания по источнику: шаблон таблицы (text_templates.py), слова из запроса, заглушка
+TEMPLATE_CONFIDENCE = 0.8
+KEYWORD_TITLE_CONFIDENCE = 0.45
+GENERIC_CONFIDENCE = 0.3
+
+# Поле, которое дописала LLM и которое прошло проверку схемы
+LLM_FIELD_CONFIDENCE = 0.6
+
+_DUE_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}')
+
+
+def object_confidence(confidence: Dict[str, float]) -> float:
+    """Уверенность объекта - средняя по его полям"""
+    return sum(confidence.values()) / len(confidence) if confidence else 0.0
+
+
+def fields_to_escalate(confidence: Dict[str, float], force: bool = False) -> List[str]:
+    """Неуверенные поля неуверенного объекта (force - объект неуверенный независимо от средней)"""
+    if not force and object_confidence(confidence) >= OBJECT_CONFIDENCE_THRESHOLD:
+        return []
+    return [field for field in ESCALATED_FIELDS if confidence.get(field, 0.0) < FIELD_CONFIDENCE_THRESHOLD]
+
+
+def valid_field(field: str, value: Any) -> bool:
+    """Значение поля пригодно для ответа (те же проверки, что и для дистилляции ответов LLM)"""
+    if field in ('title', 'description'):
+        return isinstance(value, str) and bool(value.strip()) and value not in PROMPT_PLACEHOLDERS
+    if field == 'tags':
+        return isinstance(value, list) and bool(value) and all(isinstance(tag, str) and tag for tag in value)
+    if field == 'priority':
+        return value in PRIORITY_LEVELS
+    if field == 'dueDate':
+        return isinstance(value, str) and _DUE_DATE_RE.fullmatch(value) is not None
+    return isinstance(value, str) and bool(value)
+
+
+def retrieve_fields(similar: Sequence[Tuple[Dict[str, Any], float]], task_type: str,
+                    fields: Sequence[str]) -> Dict[str, Tuple[Any, float]]:
+    """Поля из самого похожего примера с объектом того же типа: {поле: (значение, сходство)}"""
+    found: Dict[str, Tuple[Any, float]] = {}
+    for example, score in sorted(similar, key=lambda pair: pair[1], reverse=True):
+        expected = example.get('expected')
+        if not isinstance(expected, list):
+            continue
+        item: Optional[Dict[str, Any]] = next(
+            (item for item in expected if isinstance(item, dict) and item.get('type') == task_type), None)
+        if item is None:
+            continue
+        for field in fields:
+            if field not in found and field in RETRIEVABLE_FIELDS and valid_field(field, item.get(field)):
+                found[field] = (item[field], score)
+        if len(found) == len(fields):
+            break
+    return found
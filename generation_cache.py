@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+# Кэш генераций LLM переживает перезапуски и выкладки: SQLite в WAL, общий для всех воркеров
+GENERATION_CACHE_PATH = 'voicaj_llm_cache.db'
+
+# Предел суммарного размера ответов в кэше; при превышении вытесняются давно не читанные
+# записи до EVICT_TO от предела, чтобы не вытеснять на каждой записи
+GENERATION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+EVICT_TO = 0.9
+
+# Детерминированное (жадное) декодирование: ответ зависит только от модели, промпта и
+# параметров, поэтому его можно кэшировать. С выборкой (False) кэш не используется
+LLM_DETERMINISTIC = True
+
+
+def decoding_params(max_new_tokens: int, repetition_penalty: float,
+                    deterministic: bool = LLM_DETERMINISTIC) -> Dict[str, Any]:
+    """Параметры генерации; в детерминированном режиме - без выборки"""
+    params = {'max_new_tokens': max_new_tokens, 'repetition_penalty': repetition_penalty,
+              'do_sample': not deterministic}
+    if not deterministic:
+        params['temperature'] = 0.1
+    return params
+
+
+def model_id(model_name: str, adapter_path: Optional[str] = None) -> str:
+    """Идентификатор весов: имя базовой модели и хеш файла адаптеров, если он есть"""
+    if adapter_path is None or not os.path.exists(adapter_path):
+        return model_name
+    digest = hashlib.blake2b(digest_size=8)
+    with open(adapter_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return f"{model_name}+lora:{digest.hexdigest()}"
+
+
+def generation_key(model: str, prompt: str, params: Dict[str, Any]) -> str:
+    """Ключ кэша: модель, хеш промпта и параметры декодирования"""
+    prompt_hash = hashlib.blake2b(prompt.encode('utf-8'), digest_size=16).hexdigest()
+    payload = json.dumps({'model': model, 'prompt': prompt_hash, 'params': params}, sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class GenerationCache:
+    """Постоянный кэш ответов LLM с вытеснением по размеру (LRU по времени последнего чтения)"""
+
+    def __init__(self, path: str = GENERATION_CACHE_PATH, max_bytes: int = GENERATION_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение с базой кэша (WAL, ожидание блокировки, схема при первом открытии)"""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        # auto_vacuum действует только для новой базы: место после вытеснения возвращается файлу
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS generations (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS generations_accessed ON generations (accessed)')
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Сохраненный ответ или None; чтение продлевает жизнь записи"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT response FROM generations WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE generations SET accessed = ? WHERE key = ?', (time.time(), key))
+        finally:
+            conn.close()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return row[0] if row is not None else None
+
+    def put(self, key: str, model: str, response: str):
+        """Сохраняет ответ и вытесняет старые записи, если кэш превысил предел"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?, ?)',
+                         (key, model, response, len(response.encode('utf-8')), now, now))
+            total = conn.execute('SELECT total(size) FROM generations').fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn)
+        finally:
+            conn.close()
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Оставляет самые свежие записи общим размером не больше EVICT_TO от предела"""
+        removed = conn.execute('''
+            DELETE FROM generations WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS kept FROM generations
+                ) WHERE kept > ?
+            )
+        ''', (int(self.max_bytes * EVICT_TO),)).rowcount
+        conn.execute('PRAGMA incremental_vacuum')
+        with self._lock:
+            self.evicted += removed
+        print(f"🧹 Кэш генераций LLM: вытеснено {removed} записей")
+
+    def clear(self) -> int:
+        """Удаляет все записи; возвращает их число"""
+        conn = self._connect()
+        try:
+            removed = conn.execute('DELETE FROM generations').rowcount
+            conn.execute('PRAGMA incremental_vacuum')
+        finally:
+            conn.close()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Число записей, их размер и попадания этого процесса"""
+        conn = self._connect()
+        try:
+            entries, size = conn.execute('SELECT count(*), total(size) FROM generations').fetchone()
+        finally:
+            conn.close()
+        with self._lock:
+            return {'entries': entries, 'bytes': int(size), 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evicted': self.evicted}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Кэш генераций LLM")
+    parser.add_argument("--path", default=GENERATION_CACHE_PATH, help="Файл кэша")
+    parser.add_argument("--clear", action="store_true", help="Очистить кэш")
+    args = parser.parse_args()
+
+    cache = GenerationCache(args.path)
+    if args.clear:
+        print(f"🗑️ Удалено записей: {cache.clear()}")
+    stats = cache.stats()
+    print(f"📦 {args.path}: {stats['entries']} записей, {stats['bytes'] / 1024:.1f} КБ "
+          f"из {stats['max_bytes'] / 1024 / 1024:.0f} МБ")
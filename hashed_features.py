@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+import zlib
+from collections import namedtuple
+from typing import List, Dict, Sequence
+
+import numpy as np
+
+# Разреженная пачка признаков в формате CSR: строка i - это indices/values[indptr[i]:indptr[i + 1]]
+SparseBatch = namedtuple('SparseBatch', ['indices', 'values', 'indptr'])
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Предел кеша признаков слов; при переполнении кеш просто очищается
+TOKEN_CACHE_SIZE = 100000
+
+
+class HashedFeaturizer:
+    """Хешированные n-граммы слов и символов без словаря (hashing trick)"""
+
+    def __init__(self, n_features: int = 2 ** 17, word_ngrams: int = 2, char_ngrams: tuple = (3, 5)):
+        self.n_features = n_features
+        self.word_ngrams = word_ngrams
+        self.char_ngrams = tuple(char_ngrams)
+        self._token_cache: Dict[str, tuple] = {}
+
+    def config(self) -> dict:
+        return {'n_features': self.n_features, 'word_ngrams': self.word_ngrams, 'char_ngrams': list(self.char_ngrams)}
+
+    def _hash(self, feature: str) -> int:
+        # Индекс 0 зарезервирован под смещение (bias), поэтому строка никогда не бывает пустой
+        return 1 + zlib.crc32(feature.encode('utf-8')) % (self.n_features - 1)
+
+    def _token_features(self, token: str) -> tuple:
+        """Хеши слова и его символьных n-грамм (кешируются: словарь запросов невелик)"""
+        cached = self._token_cache.get(token)
+        if cached is None:
+            padded = f'<{token}>'
+            low, high = self.char_ngrams
+            features = ['w:' + token]
+            for n in range(low, high + 1):
+                features.extend('c:' + padded[i:i + n] for i in range(len(padded) - n + 1))
+            cached = tuple(self._hash(feature) for feature in features)
+            if len(self._token_cache) >= TOKEN_CACHE_SIZE:
+                self._token_cache.clear()
+            self._token_cache[token] = cached
+        return cached
+
+    def hashed(self, text: str) -> List[int]:
+        """Индексы признаков текста с повторами: слова с их символьными n-граммами и пары слов"""
+        tokens = TOKEN_RE.findall(text.lower())
+        indices = []
+        for token in tokens:
+            indices.extend(self._token_features(token))
+        cache = self._token_cache
+        for n in range(2, self.word_ngrams + 1):
+            for i in range(len(tokens) - n + 1):
+                # Ключ с пробелом не пересекается со словами (\w+) в том же кеше
+                ngram = ' '.join(tokens[i:i + n])
+                index = cache.get(ngram)
+                if index is None:
+                    index = cache[ngram] = self._hash('w:' + ngram)
+                indices.append(index)
+        return indices
+
+    def transform(self, texts: Sequence[str]) -> SparseBatch:
+        """Векторизует пачку текстов: вхождения n-грамм с весом 1/sqrt(длины) плюс bias
+
+        Повторы признака не сворачиваются: sparse_dot и sparse_update суммируют их сами,
+        так что строка эквивалентна счетчикам n-грамм без сортировки на каждый запрос.
+        """
+        indices, lengths = [], []
+        for text in texts:
+            hashed = self.hashed(text)
+            indices.append(0)  # bias
+            indices.extend(hashed)
+            lengths.append(len(hashed) + 1)
+
+        lengths = np.array(lengths, dtype=np.int64)
+        indptr = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        values = np.repeat(1.0 / np.sqrt(np.maximum(lengths - 1, 1)), lengths).astype(np.float32)
+        values[indptr[:-1]] = 1.0
+        return SparseBatch(np.array(indices, dtype=np.int64), values, indptr)
+
+
+def stack_batches(batches: Sequence[SparseBatch]) -> SparseBatch:
+    """Склеивает несколько разреженных пачек в одну (строки идут подряд)"""
+    offsets = np.cumsum([0] + [len(batch.indices) for batch in batches])
+    indptr = np.concatenate([[0]] + [batch.indptr[1:] + offset for batch, offset in zip(batches, offsets)])
+    return SparseBatch(
+        np.concatenate([batch.indices for batch in batches]),
+        np.concatenate([batch.values for batch in batches]),
+        indptr.astype(np.int64)
+    )
+
+
+def _densify(batch: SparseBatch, start: int, stop: int):
+    """Строки start:stop как плотная матрица по их собственным признакам: (столбцы W, матрица)"""
+    low, high = batch.indptr[start], batch.indptr[stop]
+    columns, inverse = np.unique(batch.indices[low:high], return_inverse=True)
+    rows = np.repeat(np.arange(stop - start), np.diff(batch.indptr[start:stop + 1]))
+    dense = np.zeros((stop - start, len(columns)), dtype=np.float32)
+    np.add.at(dense, (rows, inverse), batch.values[low:high])
+    return columns, dense
+
+
+def sparse_dot(batch: SparseBatch, weights: np.ndarray, chunk_rows: int = 256) -> np.ndarray:
+    """Оценки всех классов для всей пачки: X @ W матричным произведением по затронутым строкам W"""
+    n_rows = len(batch.indptr) - 1
+    scores = np.empty((n_rows, weights.shape[1]), dtype=np.float32)
+    for start in range(0, n_rows, chunk_rows):
+        stop = min(start + chunk_rows, n_rows)
+        columns, dense = _densify(batch, start, stop)
+        scores[start:stop] = dense @ weights[columns]
+    return scores
+
+
+def sparse_update(weights: np.ndarray, batch: SparseBatch, gradient: np.ndarray, learning_rate: float):
+    """Шаг SGD: W -= lr * X^T @ G, затрагивая только строки W признаков пачки"""
+    columns, dense = _densify(batch, 0, len(batch.indptr) - 1)
+    weights[columns] -= learning_rate * (dense.T @ gradient)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import io
+import json
+import glob
+import gzip
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен, по умолчанию используем gzip
+    zstandard = None
+
+# Fix console encoding for Windows
+if sys.platform.startswith('win'):
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+
+class HistoryArchiver:
+    """Перенос старых разговоров из горячей базы в сжатый архив по датам"""
+
+    def __init__(self, db_path: str = "chat_history.db", archive_dir: str = "history_archive",
+                 max_age_days: int = 90, batch_size: int = 500, compression: str = "auto",
+                 vacuum_pages: int = 256, pause: float = 0.05):
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.max_age_days = max_age_days
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.pause = pause  # Пауза между пачками, чтобы писатели успевали захватить блокировку
+
+        if compression == "auto":
+            compression = "zstd" if zstandard is not None else "gzip"
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("Для сжатия zstd нужен пакет zstandard")
+        self.compression = compression
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открывает соединение с горячей базой (WAL, ожидание блокировки)"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS archive_index (
+                session_id TEXT NOT NULL,
+                day TEXT NOT NULL,
+                path TEXT NOT NULL,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (session_id, day)
+            )
+        ''')
+        return conn
+
+    def _archive_path(self, day: str) -> str:
+        """Путь к архивному файлу дня: history_archive/ГГГГ/ММ/ГГГГ-ММ-ДД.jsonl.gz"""
+        extension = "jsonl.zst" if self.compression == "zstd" else "jsonl.gz"
+        return os.path.join(self.archive_dir, day[:4], day[5:7], f"{day}.{extension}")
+
+    def _append_rows(self, path: str, rows: List[Dict[str, Any]]):
+        """Дописывает строки в архив отдельным сжатым фрагментом и сбрасывает на диск"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode('utf-8')
+
+        # И gzip, и zstd допускают конкатенацию фрагментов - файл только дописывается
+        if self.compression == "zstd":
+            payload = zstandard.ZstdCompressor(level=10).compress(payload)
+        else:
+            payload = gzip.compress(payload, compresslevel=6)
+
+        with open(path, 'ab') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def archive_old_conversations(self) -> Dict[str, int]:
+        """Переносит разговоры старше max_age_days в архив небольшими пачками"""
+        cutoff = (datetime.utcnow() - timedelta(days=self.max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+        stats = {"archived": 0, "batches": 0, "vacuumed_pages": 0}
+
+        conn = self._connect()
+        try:
+            while True:
+                # Выборка идет вне пишущей транзакции: сжатие и fsync архива не держат блокировку
+                # базы, а в короткой транзакции остаются только индекс архива и удаление.
+                # Сбой между записью архива и удалением оставит строки в обоих местах -
+                # следующий запуск допишет их повторно, при чтении дубликаты отбрасываются по id.
+                rows = conn.execute('''
+                    SELECT id, session_id, user_message, ai_response, timestamp
+                    FROM conversations
+                    WHERE timestamp < ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (cutoff, self.batch_size)).fetchall()
+                if not rows:
+                    break
+
+                by_day: Dict[str, List[Dict[str, Any]]] = {}
+                for row_id, session_id, user_message, ai_response, timestamp in rows:
+                    by_day.setdefault(str(timestamp)[:10], []).append({
+                        "id": row_id,
+                        "session_id": session_id,
+                        "user_message": user_message,
+                        "ai_response": ai_response,
+                        "timestamp": timestamp
+                    })
+                for day, day_rows in by_day.items():
+                    self._append_rows(self._archive_path(day), day_rows)
+
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    # Строки, которые успел удалить другой архиватор, в индексе не учитываются
+                    counts: Dict[Tuple[str, str], int] = {}
+                    for day, day_rows in by_day.items():
+                        for row in day_rows:
+                            if conn.execute('DELETE FROM conversations WHERE id = ?', (row["id"],)).rowcount:
+                                key = (row["session_id"], day)
+                                counts[key] = counts.get(key, 0) + 1
+                    conn.executemany('''
+                        INSERT INTO archive_index (session_id, day, path, message_count)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT (session_id, day)
+                        DO UPDATE SET message_count = message_count + excluded.message_count
+                    ''', [(session_id, day, self._archive_path(day), count)
+                          for (session_id, day), count in counts.items()])
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+
+                stats["archived"] += sum(counts.values())
+                stats["batches"] += 1
+                stats["vacuumed_pages"] += self.incremental_vacuum(conn)
+                time.sleep(self.pause)
+        finally:
+            conn.close()
+
+        return stats
+
+    def incremental_vacuum(self, conn: Optional[sqlite3.Connection] = None) -> int:
+        """Возвращает освободившиеся страницы файловой системе небольшими порциями"""
+        own_conn = conn is None
+        if own_conn:
+            conn = self._connect()
+        try:
+            # 2 = INCREMENTAL; старые базы без него нужно один раз перевести через --convert
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                return 0
+
+            freed = 0
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            while free_pages > 0:
+                # executescript прогоняет pragma до конца (execute освобождает лишь одну страницу)
+                conn.executescript(f'PRAGMA incremental_vacuum({self.vacuum_pages});')
+                remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                if remaining >= free_pages:
+                    break
+                freed += free_pages - remaining
+                free_pages = remaining
+                time.sleep(self.pause)
+            return freed
+        finally:
+            if own_conn:
+                conn.close()
+
+    def convert_to_incremental(self):
+        """Разово переводит существующую базу в режим auto_vacuum=INCREMENTAL (полный VACUUM)"""
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        finally:
+            conn.close()
+
+    def load_archived_session(self, session_id: str) -> List[Dict[str, Any]]:
+        """Находит архивные сообщения сессии через индекс"""
+        conn = self._connect()
+        try:
+            paths = [row[0] for row in conn.execute(
+                'SELECT DISTINCT path FROM archive_index WHERE session_id = ? ORDER BY day',
+                (session_id,)
+            )]
+        finally:
+            conn.close()
+
+        messages: Dict[int, Dict[str, Any]] = {}
+        for path in paths:
+            for row in self._read_rows(path):
+                if row["session_id"] == session_id:
+                    messages[row["id"]] = row
+
+        return sorted(messages.values(), key=lambda row: (row["timestamp"], row["id"]))
+
+    def iter_archived_rows(self, date_from: Optional[str] = None,
+                           date_to: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Архивные сообщения всех сессий по дням в порядке (timestamp, id).
+        Границы - в формате столбца timestamp, конец не включается. В памяти держится один день;
+        повторы пачек после сбоя отбрасываются по (session_id, id)."""
+        by_day: Dict[str, List[str]] = {}
+        for path in glob.glob(os.path.join(self.archive_dir, '*', '*', '*.jsonl.*')):
+            by_day.setdefault(os.path.basename(path)[:10], []).append(path)
+
+        for day in sorted(by_day):
+            if (date_from and day < date_from[:10]) or (date_to and day > date_to[:10]):
+                continue
+            rows: Dict[tuple, Dict[str, Any]] = {}
+            for path in by_day[day]:
+                for row in self._read_rows(path):
+                    timestamp = str(row["timestamp"])
+                    if (date_from and timestamp < date_from) or (date_to and timestamp >= date_to):
+                        continue
+                    rows[(row["session_id"], row["id"])] = row
+            yield from sorted(rows.values(), key=lambda row: (str(row["timestamp"]), row["id"]))
+
+    def _read_rows(self, path: str):
+        """Построчно читает архивный файл любого поддерживаемого формата"""
+        if not os.path.exists(path):
+            return
+
+        if path.endswith('.zst'):
+            if zstandard is None:
+                raise ValueError(f"Для чтения {path} нужен пакет zstandard")
+            raw = open(path, 'rb')
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        else:
+            raw = None
+            stream = gzip.open(path, 'rb')
+
+        try:
+            for line in io.TextIOWrapper(stream, encoding='utf-8'):
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            stream.close()
+            if raw is not None:
+                raw.close()
+
+
+def start_retention_worker(archivers: List[HistoryArchiver], interval_seconds: int = 3600) -> threading.Thread:
+    """Запускает фоновый поток, периодически архивирующий старую историю"""
+    def worker():
+        while True:
+            # Базы (шарды) обходятся по очереди - в общий архив пишет только этот поток
+            for archiver in archivers:
+                try:
+                    stats = archiver.archive_old_conversations()
+                    if stats["archived"]:
+                        print(f"🗄️ {archiver.db_path}: архивировано сообщений: {stats['archived']}, "
+                              f"освобождено страниц: {stats['vacuumed_pages']}")
+                except Exception as e:
+                    print(f"❌ Ошибка архивации истории {archiver.db_path}: {e}")
+            time.sleep(interval_seconds)
+
+    thread = threading.Thread(target=worker, name="history-retention", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Архивация старой истории разговоров")
+    parser.add_argument("--db", default="chat_history.db", help="Путь к горячей базе")
+    parser.add_argument("--archive-dir", default="history_archive", help="Каталог архива")
+    parser.add_argument("--days", type=int, default=90, help="Архивировать разговоры старше N дней")
+    parser.add_argument("--compression", choices=["auto", "gzip", "zstd"], default="auto")
+    parser.add_argument("--convert", action="store_true", help="Перевести базу в auto_vacuum=INCREMENTAL")
+    parser.add_argument("--session", help="Показать архивные сообщения сессии")
+    args = parser.parse_args()
+
+    archiver = HistoryArchiver(args.db, args.archive_dir, args.days, compression=args.compression)
+
+    if args.convert:
+        archiver.convert_to_incremental()
+        print("✅ База переведена в режим incremental vacuum")
+
+    if args.session:
+        for row in archiver.load_archived_session(args.session):
+            print(json.dumps(row, ensure_ascii=False))
+    else:
+        stats = archiver.archive_old_conversations()
+        print(f"✅ Архивировано: {stats['archived']} сообщений в {stats['batches']} пачках, "
+              f"освобождено страниц: {stats['vacuumed_pages']}")
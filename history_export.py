@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import io
+import json
+import zlib
+import sqlite3
+import argparse
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterator, Iterable, Optional, List, Dict, Any
+
+from history_shards import HistoryShards
+from history_archive import HistoryArchiver
+
+# Fix console encoding for Windows
+if sys.platform.startswith('win'):
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+EXPORT_KINDS = ('conversations', 'objects')
+
+
+def _parse_bound(value: Optional[str], is_end: bool) -> Optional[str]:
+    """Приводит границу диапазона к формату столбца timestamp ('ГГГГ-ММ-ДД ЧЧ:ММ:СС', UTC).
+    Дата без времени - целый день (дата окончания включительно); время со смещением
+    переводится в UTC, как пишет CURRENT_TIMESTAMP SQLite. Неверный формат - ValueError."""
+    if not value:
+        return None
+    try:
+        moment = datetime.combine(date.fromisoformat(value), time())
+        if is_end:
+            moment += timedelta(days=1)
+    except ValueError:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _iter_conversations(db_paths: List[str], archive_dir: Optional[str], date_from: Optional[str],
+                        date_to: Optional[str], fetch_size: int) -> Iterator[tuple]:
+    """Построчно читает разговоры из архива и всех баз, не загружая выборку в память"""
+    if archive_dir:
+        # Архив общий для всех шардов и старше горячих баз, поэтому идет первым
+        for row in HistoryArchiver(archive_dir=archive_dir).iter_archived_rows(date_from, date_to):
+            yield row["id"], row["session_id"], row["user_message"], row["ai_response"], row["timestamp"]
+
+    query = 'SELECT id, session_id, user_message, ai_response, timestamp FROM conversations WHERE 1 = 1'
+    params = []
+    if date_from:
+        query += ' AND timestamp >= ?'
+        params.append(date_from)
+    if date_to:
+        query += ' AND timestamp < ?'
+        params.append(date_to)
+    query += ' ORDER BY timestamp, id'
+
+    for db_path in db_paths:
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+
+def _parse_objects(ai_response: str) -> List[Dict[str, Any]]:
+    """Достает объекты Voicaj из сохраненного ответа (JSON режим хранит список объектов)"""
+    try:
+        parsed = json.loads(ai_response)
+    except (TypeError, ValueError):
+        return []
+    if isinstance(parsed, dict):
+        parsed = [parsed]
+    if not isinstance(parsed, list):
+        return []
+    return [obj for obj in parsed if isinstance(obj, dict) and 'type' in obj]
+
+
+def iter_export_records(db_paths: List[str], kind: str = 'conversations', date_from: Optional[str] = None,
+                        date_to: Optional[str] = None, object_type: Optional[str] = None,
+                        fetch_size: int = 500, archive_dir: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Выдает записи выгрузки: разговоры целиком или отдельные извлеченные объекты.
+    Тип выгрузки и даты проверяются сразу при вызове (ValueError), а не на первой записи потока.
+    С archive_dir в выгрузку попадают и архивные разговоры (history_archive.py)."""
+    if kind not in EXPORT_KINDS:
+        raise ValueError(f"Неизвестный тип выгрузки: {kind}")
+    rows = _iter_conversations(db_paths, archive_dir, _parse_bound(date_from, False), _parse_bound(date_to, True),
+                               fetch_size)
+    return _export_records(rows, kind, object_type)
+
+
+def _export_records(rows: Iterator[tuple], kind: str, object_type: Optional[str]) -> Iterator[Dict[str, Any]]:
+    for row_id, session_id, user_message, ai_response, timestamp in rows:
+        objects = _parse_objects(ai_response)
+
+        if kind == 'conversations':
+            # Фильтр по типу оставляет разговоры, в которых есть объект этого типа
+            if object_type and not any(obj.get('type') == object_type for obj in objects):
+                continue
+            yield {
+                "id": row_id,
+                "session_id": session_id,
+                "timestamp": timestamp,
+                "user_message": user_message,
+                "ai_response": objects if objects else ai_response
+            }
+        else:
+            for index, obj in enumerate(objects):
+                if object_type and obj.get('type') != object_type:
+                    continue
+                yield {
+                    "conversation_id": row_id,
+                    "object_index": index,
+                    "session_id": session_id,
+                    "timestamp": timestamp,
+                    "user_message": user_message,
+                    "object": obj
+                }
+
+
+def iter_ndjson(records: Iterable[Dict[str, Any]], compress: bool = False,
+                chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Кодирует записи в NDJSON порциями, при необходимости сжимая gzip на лету"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31 - формат gzip
+    buffer = []
+    buffered = 0
+
+    for record in records:
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= chunk_size:
+            data = b"".join(buffer)
+            buffer, buffered = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+
+    data = b"".join(buffer)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Потоковая выгрузка истории в NDJSON")
+    parser.add_argument("--db", default="chat_history.db", help="Базовый путь к базе истории")
+    parser.add_argument("--shards", type=int, default=1, help="Число шардов истории")
+    parser.add_argument("--kind", choices=EXPORT_KINDS, default="conversations")
+    parser.add_argument("--from", dest="date_from", help="Начало периода (ГГГГ-ММ-ДД или ISO)")
+    parser.add_argument("--to", dest="date_to", help="Конец периода включительно")
+    parser.add_argument("--type", dest="object_type", help="Тип объекта Voicaj (task, habit, ...)")
+    parser.add_argument("--archive-dir", default="history_archive", help="Каталог архива (пусто - без архива)")
+    parser.add_argument("--gzip", action="store_true", help="Сжимать вывод gzip")
+    parser.add_argument("-o", "--output", help="Файл вывода (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    records = iter_export_records(HistoryShards(args.db, args.shards).all_paths(), args.kind,
+                                  args.date_from, args.date_to, args.object_type, archive_dir=args.archive_dir)
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in iter_ndjson(records, compress=args.gzip):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+        else:
+            output.flush()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import io
+import time
+import uuid
+import zlib
+import sqlite3
+import argparse
+import tempfile
+import multiprocessing
+from typing import List, Dict
+
+# Fix console encoding for Windows
+if sys.platform.startswith('win'):
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+
+class HistoryShards:
+    """Распределение истории разговоров по нескольким файлам SQLite по хешу session_id"""
+
+    def __init__(self, base_path: str = "chat_history.db", shard_count: int = 1):
+        if shard_count < 1:
+            raise ValueError("Количество шардов должно быть не меньше 1")
+        self.base_path = base_path
+        self.shard_count = shard_count
+
+    def shard_path(self, index: int) -> str:
+        """Путь к файлу шарда: chat_history.db -> chat_history.shard03.db"""
+        if self.shard_count == 1:
+            return self.base_path  # Без шардирования - прежний единственный файл
+        root, ext = os.path.splitext(self.base_path)
+        return f"{root}.shard{index:02d}{ext or '.db'}"
+
+    def shard_index(self, session_id: str) -> int:
+        """Номер шарда сессии (crc32 стабилен между процессами, в отличие от hash())"""
+        return zlib.crc32(session_id.encode('utf-8')) % self.shard_count
+
+    def path_for(self, session_id: str) -> str:
+        """Путь к базе, в которой хранится сессия"""
+        return self.shard_path(self.shard_index(session_id))
+
+    def all_paths(self) -> List[str]:
+        """Пути ко всем шардам"""
+        return [self.shard_path(i) for i in range(self.shard_count)]
+
+
+def rebalance(base_path: str, old_count: int, new_count: int, batch_size: int = 1000) -> Dict[str, int]:
+    """Переносит разговоры из раскладки old_count шардов в раскладку new_count шардов.
+
+    Строки сохраняют свои id (по ним архив history_archive.py отбрасывает повторы), поэтому
+    перенос идемпотентен: после сбоя между копией и удалением повторный запуск пропускает
+    строки, уже лежащие в целевом шарде, и дочищает исходный."""
+    source = HistoryShards(base_path, old_count)
+    target = HistoryShards(base_path, new_count)
+    stats = {"moved": 0, "kept": 0, "renumbered": 0}
+
+    for path in target.all_paths():
+        init_history_db(path)
+
+    # Фиксируем границы до переноса, чтобы не обходить повторно уже перенесенные строки.
+    # Счетчик AUTOINCREMENT больше любого id, выданного шардом, включая уже архивированные
+    max_ids, sequences = {}, {}
+    for source_path in source.all_paths():
+        if os.path.exists(source_path):
+            conn = sqlite3.connect(source_path, timeout=30)
+            try:
+                max_ids[source_path] = conn.execute('SELECT COALESCE(MAX(id), 0) FROM conversations').fetchone()[0]
+                sequence = conn.execute(
+                    "SELECT seq FROM sqlite_sequence WHERE name = 'conversations'"
+                ).fetchone() if _has_table(conn, 'sqlite_sequence') else None
+                sequences[source_path] = max(sequence[0] if sequence else 0, max_ids[source_path])
+            finally:
+                conn.close()
+
+    for source_path, max_id in max_ids.items():
+        conn = sqlite3.connect(source_path, timeout=30)
+        try:
+            _move_archive_index(conn, source_path, target)
+
+            last_id = 0
+            while True:
+                rows = conn.execute('''
+                    SELECT id, session_id, user_message, ai_response, timestamp
+                    FROM conversations
+                    WHERE id > ? AND id <= ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, max_id, batch_size)).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+
+                # Группируем строки пачки по целевому шарду
+                moves: Dict[str, List[tuple]] = {}
+                for row in rows:
+                    target_path = target.path_for(row[1])
+                    if os.path.abspath(target_path) == os.path.abspath(source_path):
+                        stats["kept"] += 1
+                    else:
+                        moves.setdefault(target_path, []).append(row)
+
+                # Сначала фиксируем копию в целевом шарде, затем удаляем из исходного
+                # (транзакция на две базы WAL не атомарна - от сбоя защищает идемпотентность)
+                for target_path, moved_rows in moves.items():
+                    target_conn = sqlite3.connect(target_path, timeout=30)
+                    try:
+                        stats["renumbered"] += _copy_rows(target_conn, moved_rows, sequences[source_path])
+                        target_conn.commit()
+                    finally:
+                        target_conn.close()
+
+                    conn.executemany('DELETE FROM conversations WHERE id = ?', [(row[0],) for row in moved_rows])
+                    conn.commit()
+                    stats["moved"] += len(moved_rows)
+        finally:
+            conn.close()
+
+    return stats
+
+
+def _has_table(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def _copy_rows(conn: sqlite3.Connection, rows: List[tuple], sequence: int) -> int:
+    """Вставляет строки (id, session_id, user_message, ai_response, timestamp) с исходными id,
+    пропуская уже перенесенные. Возвращает число строк, получивших новый id."""
+    # Новые сообщения в целевом шарде получат id больше любого id исходного шарда и не совпадут
+    # с архивными id перенесенных сессий
+    if not conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'conversations'",
+                        (sequence,)).rowcount:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('conversations', ?)", (sequence,))
+
+    renumbered = 0
+    for row in rows:
+        existing = conn.execute('SELECT session_id FROM conversations WHERE id = ?', (row[0],)).fetchone()
+        if existing is None:
+            conn.execute('''
+                INSERT INTO conversations (id, session_id, user_message, ai_response, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+            ''', row)
+        elif existing[0] != row[1] and not conn.execute('''
+            SELECT 1 FROM conversations
+            WHERE session_id = ? AND user_message = ? AND ai_response = ? AND timestamp = ?
+        ''', row[1:]).fetchone():
+            # Шарды выдают id независимо, и id может быть занят другой сессией. Сессия целиком
+            # живет в одном шарде, поэтому новый id (больше sequence) не совпадет с ее архивными
+            conn.execute('''
+                INSERT INTO conversations (session_id, user_message, ai_response, timestamp)
+                VALUES (?, ?, ?, ?)
+            ''', row[1:])
+            renumbered += 1
+    return renumbered
+
+
+def _move_archive_index(conn: sqlite3.Connection, source_path: str, target: HistoryShards):
+    """Переносит записи индекса архива (history_archive.py) вслед за сессиями"""
+    if not _has_table(conn, 'archive_index'):
+        return
+
+    moves: Dict[str, List[tuple]] = {}
+    for row in conn.execute('SELECT session_id, day, path, message_count FROM archive_index'):
+        target_path = target.path_for(row[0])
+        if os.path.abspath(target_path) != os.path.abspath(source_path):
+            moves.setdefault(target_path, []).append(row)
+
+    for target_path, rows in moves.items():
+        target_conn = sqlite3.connect(target_path, timeout=30)
+        try:
+            target_conn.execute('''
+                CREATE TABLE IF NOT EXISTS archive_index (
+                    session_id TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    message_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (session_id, day)
+                )
+            ''')
+            # Запись сессии за день есть только в одном шарде; совпадение ключа означает повторный
+            # запуск после сбоя, и счетчик не удваивается
+            target_conn.executemany('''
+                INSERT INTO archive_index (session_id, day, path, message_count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (session_id, day)
+                DO UPDATE SET message_count = MAX(message_count, excluded.message_count)
+            ''', rows)
+            target_conn.commit()
+        finally:
+            target_conn.close()
+
+        conn.executemany('DELETE FROM archive_index WHERE session_id = ? AND day = ?', [row[:2] for row in rows])
+        conn.commit()
+
+
+def init_history_db(path: str):
+    """Создает таблицу conversations в базе истории (шарде), если ее еще нет"""
+    conn = sqlite3.connect(path)
+    try:
+        # Работает только для новой базы; старую переводит history_archive.py --convert
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # WAL - читатели и архивация не блокируют запись новых сообщений
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                user_message TEXT NOT NULL,
+                ai_response TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations (timestamp)')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _bench_worker(args):
+    """Процесс-писатель для бенчмарка: вставляет rows сообщений, по транзакции на сообщение"""
+    base_path, shard_count, rows = args
+    shards = HistoryShards(base_path, shard_count)
+    connections = {}
+    try:
+        for _ in range(rows):
+            session_id = str(uuid.uuid4())
+            path = shards.path_for(session_id)
+            if path not in connections:
+                connections[path] = sqlite3.connect(path, timeout=60)
+            conn = connections[path]
+            conn.execute('''
+                INSERT INTO conversations (session_id, user_message, ai_response)
+                VALUES (?, ?, ?)
+            ''', (session_id, "завтра нужно отправить отчёт руководителю", '[{"type": "task"}]'))
+            conn.commit()
+    finally:
+        for conn in connections.values():
+            conn.close()
+
+
+def benchmark(shard_counts: List[int], workers: int = 8, rows: int = 500) -> List[Dict[str, float]]:
+    """Измеряет пропускную способность конкурентной вставки в зависимости от числа шардов"""
+    results = []
+    for shard_count in shard_counts:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            base_path = os.path.join(tmp_dir, "chat_history.db")
+            for path in HistoryShards(base_path, shard_count).all_paths():
+                init_history_db(path)
+
+            start = time.perf_counter()
+            with multiprocessing.Pool(workers) as pool:
+                pool.map(_bench_worker, [(base_path, shard_count, rows)] * workers)
+            elapsed = time.perf_counter() - start
+
+            total = workers * rows
+            results.append({"shards": shard_count, "rows": total, "seconds": elapsed, "rows_per_sec": total / elapsed})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Шардирование истории разговоров")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebalance_parser = subparsers.add_parser("rebalance", help="Перераспределить историю между шардами")
+    rebalance_parser.add_argument("--db", default="chat_history.db", help="Базовый путь к базе истории")
+    rebalance_parser.add_argument("--from-shards", type=int, default=1, help="Текущее число шардов")
+    rebalance_parser.add_argument("--to-shards", type=int, required=True, help="Новое число шардов")
+
+    bench_parser = subparsers.add_parser("bench", help="Бенчмарк конкурентной вставки")
+    bench_parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    bench_parser.add_argument("--workers", type=int, default=8)
+    bench_parser.add_argument("--rows", type=int, default=500, help="Вставок на процесс")
+
+    args = parser.parse_args()
+
+    if args.command == "rebalance":
+        stats = rebalance(args.db, args.from_shards, args.to_shards)
+        print(f"✅ Перенесено: {stats['moved']} (с новым id: {stats['renumbered']}), осталось на месте: {stats['kept']}")
+    else:
+        print(f"📊 Конкурентная вставка: {args.workers} процессов x {args.rows} сообщений")
+        for result in benchmark(args.shards, args.workers, args.rows):
+            print(f"  шардов: {result['shards']:>2}  {result['rows_per_sec']:>9.0f} вставок/с  ({result['seconds']:.2f} с)")
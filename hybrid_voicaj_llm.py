@@ -1,250 +1,260 @@
+import os
 import sys
 import io
+import copy
 import json
+import sqlite3
 import re
+import time
+import threading
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import torch
 from transformers import (
     AutoTokenizer, 
-    AutoModelForCausalLM, 
-    pipeline
+    AutoModelForCausalLM
 )
 
+from training_store import TrainingStore
+from rule_engine import RuleEngine, RULES_SNAPSHOT_PATH, SIMILAR_TOP_K, RULE_TABLE_CONFIDENCE
+from type_classifier import (
+    TypeClassifier, TYPE_MODEL_PATH, TYPE_CONFIDENCE_THRESHOLD,
+    PRIORITY_MODEL_PATH, PRIORITY_LEVELS, PRIORITY_CONFIDENCE_THRESHOLD, example_priority
+)
+from tag_predictor import TagPredictor, TAG_MODEL_PATH
+from online_learning import OnlineLearner
+from distillation import DistillationLog, analysis_prompt, needs_llm
+from lm_finetune import LM_ADAPTER_PATH, load_adapter
+from embedding_index import SemanticSearch, EMBEDDING_INDEX_PATH
+from date_grammar import DateTimeExtractor, due_date
+from request_clock import reference_clock
+from field_confidence import (
+    FIELD_CONFIDENCE_THRESHOLD, OBJECT_CONFIDENCE_THRESHOLD, TEMPLATE_CONFIDENCE, KEYWORD_TITLE_CONFIDENCE,
+    GENERIC_CONFIDENCE, LLM_FIELD_CONFIDENCE, object_confidence, fields_to_escalate, retrieve_fields, valid_field
+)
+from text_templates import TemplateTable, TEMPLATES_PATH
+from request_coalescing import SingleFlight, normalize_request
+from generation_cache import GenerationCache, decoding_params, generation_key, model_id
+from llm_admission import AdmissionController, LLMOverloaded
+from inference_backends import LLM_BACKEND, EagerBackend, open_backend
+
 # Исправляем кодировку для Windows
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
-sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+if sys.platform.startswith('win'):
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+# Генеративная модель для сложных случаев (обучена для структурированного вывода)
+LLM_MODEL_NAME = "microsoft/DialoGPT-small"
+
+# После неудачной загрузки LLM (нет сети или весов) следующая попытка - не раньше чем через столько
+# секунд; до тех пор запросы сразу получают ответ без LLM, а не ждут загрузку заново
+LLM_INIT_RETRY_SECONDS = 300
 
 class HybridVoicajLLM:
     """Гибридная система: Rule-based + LLM для сложных случаев"""
     
-    def __init__(self):
+    def __init__(self, training_path: str = 'voicaj_training_data.json'):
         print("🤖 Инициализация гибридной системы...")
         
-        # Текущая дата
-        self.current_date = datetime.now()
+        # Опорное время запроса и разбор сроков
+        self.clock = reference_clock
+        self.date_extractor = DateTimeExtractor()
         
-        # Загружаем данные обучения
+        # Шаблоны заголовков и описаний (таблица правится без изменения кода)
+        self.templates = TemplateTable.load(TEMPLATES_PATH)
+        
+        # Загружаем данные обучения (снимок + журнал дозаписи)
+        self.training_store = TrainingStore(training_path, corpus_path=os.path.splitext(training_path)[0] + '.corpus')
         self.training_data = self.load_training_data()
         
+        # Скомпилированные правила и индекс похожих примеров (из снимка, если он актуален)
+        start = time.perf_counter()
+        self.rules = RuleEngine.load_or_build(
+            RULES_SNAPSHOT_PATH, self.training_data,
+            [self.training_store.snapshot_path, self.training_store.log_path]
+        )
+        print(f"⚙️ Правила готовы за {(time.perf_counter() - start) * 1000:.1f} мс")
+        
+        # Быстрые модели (обучаются при первом запуске, если их еще нет); неуверенные ответы отдают правилам
+        self.type_classifier = TypeClassifier.load_or_train(TYPE_MODEL_PATH, self.training_data)
+        self.tag_predictor = TagPredictor.load_or_train(TAG_MODEL_PATH, self.training_data)
+        self.priority_classifier = TypeClassifier.load_or_train(
+            PRIORITY_MODEL_PATH, self.training_data, PRIORITY_LEVELS, example_priority
+        )
+        
+        # Онлайн-дообучение моделей на обратной связи
+        self.online_learner = OnlineLearner(self, self.training_data)
+        
+        # Семантический поиск похожих примеров включается, если индекс эмбеддингов построен
+        # (voicaj_trainer.py build-embeddings); без него работает лексический TF-IDF
+        self.semantic_search = SemanticSearch.open(self.training_data, EMBEDDING_INDEX_PATH)
+        if self.semantic_search is not None:
+            print(f"🧭 Семантический поиск: {len(self.semantic_search.index)} векторов")
+        
+        # Удачные ответы LLM копятся для дистилляции в быстрые модели (voicaj_trainer.py distill)
+        self.distillation_log = DistillationLog()
+        
+        # Одновременные одинаковые запросы ждут одно вычисление
+        self.inflight = SingleFlight()
+        
         # Инициализируем LLM только при необходимости
-        self.llm_model = None
         self.llm_tokenizer = None
-        self.llm_generator = None
+        self.llm_backend = None
+        self._llm_model_id = None
+        self._llm_init_lock = threading.Lock()
+        self._llm_init_failed_at = None
         
-        # Удалены старые паттерны - используем новую логику в _detect_types
+        # Ответы LLM сохраняются на диск: повторный сложный запрос не запускает модель (generation_cache.py)
+        self.generation_cache = GenerationCache()
         
-        # Теги и ключевые слова
-        self.tags_keywords = {
-            'работа': ['работа', 'офис', 'коллеги', 'проект', 'встреча', 'программировать', 'код', 'разработка', 'клиент', 'презентация', 'карьера', 'бизнес', 'отчёт', 'руководитель'],
-            'семья': ['семья', 'дети', 'родители', 'родственники', 'встретиться с родителями', 'мама', 'папа'],
-            'здоровье': ['здоровье', 'врач', 'лекарство', 'больница', 'устал', 'усталым', 'подавлен', 'терапевт'],
-            'спорт': ['спорт', 'тренировка', 'фитнес', 'зал', 'бегать', 'бег', 'беговая', 'утренний бег'],
-            'технологии': ['программировать', 'код', 'разработка', 'компьютер', 'технологии', 'сайт', 'портфолио'],
-            'настроение': ['настроение', 'чувствую', 'эмоции', 'отлично', 'хорошо', 'плохо', 'волнуюсь', 'нервничаю', 'люблю'],
-            'учеба': ['учеба', 'экзамен', 'математика', 'изучать', 'обучение', 'курс', 'лекция', 'презентация', 'вуз'],
-            'покупки': ['покупки', 'купить', 'магазин', 'товар', 'продукт', 'продукты', 'костюм', 'подарок']
-        }
+        # Допуск к LLM: ограниченная очередь, сверх нее - ответ без LLM или 429 (llm_admission.py)
+        self.llm_admission = AdmissionController()
         
-        self.priority_keywords = {
-            'high': ['срочно', 'важно', 'критично', 'немедленно', 'сегодня', 'завтра'],
-            'medium': ['на этой неделе', 'в ближайшее время'],
-            'low': ['когда-нибудь', 'не спеша', 'в свободное время', 'срочность низкая', 'неважно']
-        }
+        # Удалены старые паттерны - используем новую логику в _detect_types
+        
+        # Таблицы тегов, приоритетов и типов - в rule_engine.py; в снимке правил они сведены к основам слов
         
         print("✅ Гибридная система готова!")
+
+    @property
+    def current_date(self) -> datetime:
+        """Опорный момент текущего запроса (request_clock.py), а не время запуска"""
+        return self.clock.now()
     
     def load_training_data(self) -> List[Dict]:
         """Загружает данные обучения"""
-        try:
-            with open('voicaj_training_data.json', 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
+        training_data = self.training_store.load()
+        if not training_data:
             print("⚠️ Файл обучения не найден")
-            return []
+        return training_data
     
     def is_complex_request(self, text: str) -> bool:
-        """Определяет, является ли запрос сложным для LLM"""
-        text_lower = text.lower()
-        
-        # Простые случаи - обрабатываем rule-based
-        simple_patterns = [
-            r'завтра.*отправить.*отчёт',
-            r'послезавтра.*отправить.*отчёт',
-            r'завтра.*сходить.*продукт',
-            r'послезавтра.*сходить.*продукт',
-            r'презентация.*вуз',
-            r'код.*работа'
-        ]
-        
-        for pattern in simple_patterns:
-            if re.search(pattern, text_lower):
-                return False
-        
-        # Сложные случаи - нужна LLM
-        complex_indicators = [
-            len(text.split()) > 15,  # Длинный текст
-            'и' in text_lower and text.count('и') > 2,  # Много союзов
-            any(word in text_lower for word in ['одновременно', 'параллельно', 'также', 'кроме того']),
-            text.count(',') > 3,  # Много запятых
-        ]
-        
-        return any(complex_indicators)
+        """Определяет, является ли запрос сложным для LLM (с учетом уверенности быстрых моделей)"""
+        return needs_llm(self.rules, self.type_classifier, text)
     
-    def init_llm(self):
-        """Инициализирует LLM только при необходимости"""
-        if self.llm_model is not None:
-            return
-            
+    def init_llm(self) -> bool:
+        """Инициализирует LLM только при необходимости; False - LLM сейчас недоступна.
+        
+        Загружает один поток, остальные в это время отвечают без LLM. После ошибки загрузки
+        новая попытка - не раньше чем через LLM_INIT_RETRY_SECONDS.
+        """
+        if self.llm_backend is not None:
+            return True
+        failed_at = self._llm_init_failed_at
+        if failed_at is not None and time.monotonic() - failed_at < LLM_INIT_RETRY_SECONDS:
+            return False
+        if not self._llm_init_lock.acquire(blocking=False):
+            return False
+        try:
+            if self.llm_backend is None:
+                self._load_llm()
+        finally:
+            self._llm_init_lock.release()
+        return self.llm_backend is not None
+    
+    def _load_llm(self):
+        """Загружает токенизатор и бэкенд LLM; при ошибке запоминает время неудачи"""
         print("🧠 Инициализация LLM для сложных случаев...")
         
         try:
-            # Используем модель, специально обученную для структурированного вывода
-            model_name = "microsoft/DialoGPT-small"
+            model_name = LLM_MODEL_NAME
             
             self.llm_tokenizer = AutoTokenizer.from_pretrained(model_name)
-            self.llm_model = AutoModelForCausalLM.from_pretrained(model_name)
             
-            if self.llm_tokenizer.pad_token is None:
-                self.llm_tokenizer.pad_token = self.llm_tokenizer.eos_token
+            # Граф из `voicaj_trainer.py export-lm`, если он собран для этих же весов
+            backend = None
+            if LLM_BACKEND != 'eager':
+                try:
+                    backend = open_backend(LLM_BACKEND, self.llm_model_id)
+                except ValueError as e:
+                    print(f"⚠️ Бэкенд {LLM_BACKEND} недоступен: {e}; используем eager")
             
-            # Создаем генератор с более строгими параметрами
-            self.llm_generator = pipeline(
-                "text-generation",
-                model=self.llm_model,
-                tokenizer=self.llm_tokenizer,
-                max_new_tokens=300,
-                temperature=0.1,  # Очень низкая температура для детерминированности
-                do_sample=True,
-                pad_token_id=self.llm_tokenizer.eos_token_id,
-                eos_token_id=self.llm_tokenizer.eos_token_id,
-                repetition_penalty=1.2,  # Штраф за повторения
-                length_penalty=1.0
-            )
+            if backend is None:
+                model = AutoModelForCausalLM.from_pretrained(model_name)
+                # Адаптеры из `voicaj_trainer.py finetune-lm`, если они обучены для этой же базы
+                if load_adapter(model, LM_ADAPTER_PATH, model_name):
+                    print(f"🧩 Подключены адаптеры LoRA: {LM_ADAPTER_PATH}")
+                backend = EagerBackend(model)
             
-            print("✅ LLM инициализирована!")
+            self.llm_backend = backend
+            self._llm_init_failed_at = None
+            print(f"✅ LLM инициализирована! (бэкенд {backend.name})")
             
         except Exception as e:
-            print(f"❌ Ошибка инициализации LLM: {e}")
-            self.llm_model = None
+            print(f"❌ Ошибка инициализации LLM: {e}; следующая попытка через {LLM_INIT_RETRY_SECONDS} с")
+            self.llm_backend = None
+            self._llm_init_failed_at = time.monotonic()
     
-    def rule_based_analysis(self, text: str) -> List[Dict[str, Any]]:
-        """Rule-based анализ (быстрый и точный для простых случаев)"""
-        print("⚡ Используем rule-based анализ...")
-        
-        detected_types = self._detect_types(text.lower())
-        if not detected_types:
-            detected_types = ['task']
-        
-        # Берем только первый тип для простоты
-        task_type = detected_types[0]
-        result = self._create_object(text, task_type)
-        
-        return [result] if result else []
+    @property
+    def llm_model_id(self) -> str:
+        """Идентификатор весов LLM для ключа кэша (база и хеш адаптеров), без загрузки модели"""
+        if self._llm_model_id is None:
+            self._llm_model_id = model_id(LLM_MODEL_NAME, LM_ADAPTER_PATH)
+        return self._llm_model_id
     
-    def llm_analysis(self, text: str) -> List[Dict[str, Any]]:
-        """LLM анализ для сложных случаев с улучшенной логикой"""
-        print("🧠 Используем LLM анализ...")
-        
-        self.init_llm()
+    def _generate(self, prompt: str, max_new_tokens: int, repetition_penalty: float) -> Optional[str]:
+        """Продолжение промпта от LLM или None, если модель недоступна.
+        
+        В детерминированном режиме ответ сначала ищется в кэше генераций по модели, хешу
+        промпта и параметрам декодирования; при попадании модель даже не загружается.
+        """
+        params = decoding_params(max_new_tokens, repetition_penalty)
+        key = None if params['do_sample'] else generation_key(self.llm_model_id, prompt, params)
+        if key is not None:
+            try:
+                cached = self.generation_cache.get(key)
+            except sqlite3.Error as e:
+                print(f"⚠️ Кэш генераций недоступен: {e}")
+                key = cached = None
+            if cached is not None:
+                print("📦 Ответ LLM из кэша генераций")
+                return cached
+        
+        # Загрузка модели - вне слота допуска: место в очереди занимает только генерация
+        if not self.init_llm():
+            return None
+        with self.llm_admission.slot():
+            output_ids = self.llm_backend.generate(
+                self.llm_tokenizer.encode(prompt),
+                eos_token_id=self.llm_tokenizer.eos_token_id,
+                **params
+            )
+        generated = self.llm_tokenizer.decode(output_ids, skip_special_tokens=True)
+        if key is not None:
+            try:
+                self.generation_cache.put(key, self.llm_model_id, generated)
+            except sqlite3.Error as e:
+                print(f"⚠️ Не удалось сохранить ответ в кэш генераций: {e}")
+        return generated
+    
+    def llm_analysis(self, text: str, detected_types: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """LLM анализ всего запроса (сложные запросы с несколькими намерениями - несколько объектов).
         
-        if self.llm_model is None:
-            print("❌ LLM недоступна, используем rule-based")
-            return self.rule_based_analysis(text)
+        Пустой список, если LLM недоступна или не дала валидного JSON; при переполненной
+        очереди к LLM - LLMOverloaded.
+        """
+        print("🧠 Используем LLM анализ...")
         
         try:
             # Определяем типы задач из текста
-            detected_types = self._detect_types(text.lower())
             if not detected_types:
-                detected_types = ['task']
+                detected_types = self._detect_types(text.lower()) or ['task']
             
-            # Создаем умный промпт на основе обнаруженных типов
-            current_date = self.current_date.strftime("%Y-%m-%d")
-            tomorrow = (self.current_date + timedelta(days=1)).strftime("%Y-%m-%d")
+            # Промпт с объектами-заглушками; на нем же дообучается LLM (lm_finetune.format_example)
+            prompt = analysis_prompt(text, detected_types, self.current_date)
             
-            # Адаптируем промпт под конкретные типы
-            if 'mood_entry' in detected_types and 'task' in detected_types:
-                prompt = f"""User: {text}
-
-Assistant: I'll create both a mood entry and a task for you.
-
-Mood Entry:
-{{
-    "title": "Emotional state",
-    "type": "mood_entry",
-    "description": "Current emotional state and feelings",
-    "tags": ["настроение", "эмоции"],
-    "priority": "high",
-    "dueDate": "{current_date} 18:00"
-}}
-
-Task:
-{{
-    "title": "Task to complete",
-    "type": "task",
-    "description": "Specific task that needs to be done",
-    "tags": ["задача"],
-    "priority": "high",
-    "dueDate": "{tomorrow} 18:00"
-}}"""
-            elif 'habit' in detected_types:
-                prompt = f"""User: {text}
-
-Assistant: I'll create a habit for you.
-
-{{
-    "title": "New habit",
-    "type": "habit",
-    "description": "Regular activity to develop",
-    "tags": ["привычка"],
-    "priority": "medium",
-    "dueDate": "{tomorrow} 18:00"
-}}"""
-            elif 'goal' in detected_types:
-                prompt = f"""User: {text}
-
-Assistant: I'll create a long-term goal for you.
-
-{{
-    "title": "Long-term goal",
-    "type": "goal",
-    "description": "Important long-term objective",
-    "tags": ["цель"],
-    "priority": "medium",
-            "dueDate": "2025-12-31 23:59"
-}}"""
-            else:
-                # Простая задача
-                prompt = f"""User: {text}
-
-Assistant: I'll create a task for you.
-
-{{
-    "title": "Task",
-    "type": "task",
-    "description": "Specific task to complete",
-    "tags": ["задача"],
-    "priority": "high",
-    "dueDate": "{tomorrow} 18:00"
-}}"""
+            # Генерируем ответ (или берем из кэша генераций)
+            response = self._generate(prompt, max_new_tokens=200, repetition_penalty=1.3)
+            if response is None:
+                print("❌ LLM недоступна")
+                return []
             
-            # Генерируем ответ
-            result = self.llm_generator(
-                prompt,
-                max_new_tokens=200,
-                temperature=0.1,
-                do_sample=True,
-                pad_token_id=self.llm_tokenizer.eos_token_id,
-                eos_token_id=self.llm_tokenizer.eos_token_id,
-                repetition_penalty=1.3,
-                length_penalty=1.0
-            )
-            
-            response = result[0]['generated_text'][len(prompt):].strip()
+            response = response.strip()
             print(f"🔍 LLM ответ: {response[:100]}...")
             
             # Извлекаем JSON объекты
             json_objects = []
+            raw_objects = []  # Как их выдала LLM, до дополнения быстрым контуром
             
             # Ищем все JSON объекты в ответе
             json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
@@ -258,6 +268,7 @@ Assistant: I'll create a task for you.
                         json_str += '}'
                     
                     obj = json.loads(json_str)
+                    raw_objects.append(copy.deepcopy(obj))
                     
                     # Валидируем и улучшаем объект
                     improved_obj = self._validate_and_improve_object(obj, text)
@@ -269,14 +280,22 @@ Assistant: I'll create a task for you.
             
             if json_objects:
                 print(f"✅ LLM сгенерировал {len(json_objects)} валидных объектов!")
+                try:
+                    # Для дистилляции - только собственные ответы LLM: в улучшенных объектах часть
+                    # полей подставлена быстрым контуром, и модели учились бы на своих же предсказаниях
+                    self.distillation_log.record(text, raw_objects)
+                except OSError as e:
+                    print(f"⚠️ Не удалось сохранить ответ LLM для дистилляции: {e}")
                 return json_objects
             else:
-                print("⚠️ LLM не сгенерировал валидный JSON, используем rule-based")
-                return self.rule_based_analysis(text)
+                print("⚠️ LLM не сгенерировал валидный JSON")
+                return []
             
+        except LLMOverloaded:
+            raise
         except Exception as e:
             print(f"❌ Ошибка LLM анализа: {e}")
-            return self.rule_based_analysis(text)
+            return []
     
     def _validate_and_improve_object(self, obj: Dict, original_text: str) -> Dict:
         """Валидирует и улучшает JSON объект"""
@@ -312,64 +331,32 @@ Assistant: I'll create a task for you.
         
         return obj
     
-    def find_similar_examples(self, user_input: str) -> List[Dict[str, Any]]:
-        """Находит похожие примеры из данных обучения"""
-        similar = []
-        input_lower = user_input.lower()
-        
-        # Сначала ищем точные совпадения фраз
-        for example in self.training_data:
-            if 'input' in example:
-                example_input = example['input'].lower()
-                
-                # Проверяем точное совпадение
-                if input_lower == example_input:
-                    return [example]
-                
-                # Проверяем частичное совпадение (80% слов)
-                input_words = set(input_lower.split())
-                example_words = set(example_input.split())
-                common_words = input_words & example_words
-                
-                if len(common_words) >= len(input_words) * 0.8:  # 80% совпадение
-                    similar.append(example)
-        
-        # Если нет точных совпадений, ищем по ключевым словам
-        if not similar:
-            key_words = ['отчёт', 'руководитель', 'презентация', 'код', 'программирование', 'работа', 'вуз', 'учеба', 'задача', 'срочность', 'написание']
-            
-            for example in self.training_data:
-                if 'input' in example:
-                    example_input = example['input'].lower()
-                    
-                    # Проверяем точные совпадения ключевых слов
-                    input_keywords = [word for word in key_words if word in input_lower]
-                    example_keywords = [word for word in key_words if word in example_input]
-                    
-                    # Если есть совпадения ключевых слов
-                    if input_keywords and example_keywords:
-                        common_keywords = set(input_keywords) & set(example_keywords)
-                        if len(common_keywords) >= 1:  # Минимум 1 общий ключевой термин
-                            similar.append(example)
-                            
-        return similar[:1]  # Возвращаем только 1 наиболее похожий пример
+    def analyze_text(self, text: str, debug: bool = False):
+        """Основной метод анализа: быстрый контур и эскалация только неуверенных полей (см. analyze).
+        
+        Одинаковые запросы, пришедшие одновременно (повторы клиента при медленной сети),
+        считаются один раз: остальные ждут первый и получают копию его результата.
+        С debug=True возвращает пару (объекты, отладочный раздел analyze).
+        """
+        # Исправляем кодировку если нужно
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+        
+        # Срок зависит от дня запроса, поэтому день входит в ключ
+        key = (normalize_request(text), self.current_date.date())
+        result, shared = self.inflight.do(key, lambda: self._analyze_text(text))
+        if shared:
+            print(f"🔗 Ответ общий с одновременным таким же запросом: {text[:50]}...")
+            result = copy.deepcopy(result)
+        return result if debug else result[0]
     
-    def analyze_text(self, text: str) -> List[Dict[str, Any]]:
-        """Основной метод анализа - выбирает между rule-based и LLM"""
+    def _analyze_text(self, text: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Анализ одного запроса с заглушкой на случай ошибки"""
         try:
-            # Исправляем кодировку если нужно
-            if isinstance(text, bytes):
-                text = text.decode('utf-8')
-            
             print(f"🔍 Анализируем: {text[:50]}...")
-            
-            # Определяем сложность запроса
-            if self.is_complex_request(text):
-                print("🧠 Сложный запрос - используем LLM")
-                return self.llm_analysis(text)
-            else:
-                print("⚡ Простой запрос - используем rule-based")
-                return self.rule_based_analysis(text)
+            return self.analyze(text)
+        except LLMOverloaded:
+            raise
         except Exception as e:
             print(f"❌ Ошибка анализа: {e}")
             return [{
@@ -379,757 +366,300 @@ Assistant: I'll create a task for you.
                 "tags": ["задача"],
                 "priority": "medium",
                 "dueDate": (self.current_date + timedelta(days=1)).strftime("%Y-%m-%d 18:00")
-            }]
+            }], {'route': 'error', 'error': str(e)}
     
     def _detect_types(self, text: str) -> List[str]:
-        """Определяет типы задач в тексте с улучшенной логикой"""
-        detected = set()
-        text_lower = text.lower()
-        
-        # Расширенные паттерны для определения типов
-        
-        # MOOD_ENTRY - эмоциональные состояния
-        mood_patterns = [
-            'чувствую', 'волнуюсь', 'переживаю', 'устал', 'устала', 'грустно', 'радостно',
-            'злой', 'злая', 'раздражен', 'раздражена', 'спокоен', 'спокойна', 'тревожно',
-            'беспокоюсь', 'нервничаю', 'переживаю', 'настроение', 'эмоции', 'состояние',
-            'депрессия', 'стресс', 'тревога', 'паника', 'счастье', 'радость', 'восторг',
-            'разочарован', 'разочарована', 'обижен', 'обижена', 'одинок', 'одинока',
-            'очень радуюсь', 'горжусь', 'испытываю', 'сильную тревогу', 'панику',
-            'огромную благодарность', 'счастье от', 'поддержки друзей', 'волнуюсь перед',
-            'важным экзаменом', 'не могу уснуть', 'публичным выступлением'
-        ]
-        
-        # HABIT - привычки и регулярные действия
-        habit_patterns = [
-            'каждый день', 'ежедневно', 'регулярно', 'привычка', 'привык', 'начинаю',
-            'хочу начать', 'планирую начать', 'буду делать', 'каждое утро', 'каждый вечер',
-            'каждую неделю', 'каждый месяц', 'тренировка', 'зарядка', 'бег', 'бегать',
-            'читать каждый день', 'изучать каждый день', 'учиться каждый день', 
-            'практиковать каждый день', 'медитировать', 'йога', 'программировать каждый день',
-            'спорт', 'фитнес', 'тренироваться', 'заниматься спортом'
-        ]
-        
-        # GOAL - долгосрочные цели
-        goal_patterns = [
-            'хочу создать', 'хочу открыть', 'хочу стать', 'хочу достичь', 'цель',
-            'мечтаю', 'планирую', 'когда-нибудь', 'в будущем', 'через год', 'через 5 лет',
-            'стартап', 'бизнес', 'карьера', 'профессия', 'навык', 'мастерство',
-            'достижение', 'амбиции', 'стремление', 'желание', 'намерение',
-            'когда-нибудь прочитать', 'когда-нибудь изучить', 'когда-нибудь научиться',
-            'в будущем хочу', 'в будущем планирую', 'через несколько лет',
-            'хочу путешествовать', 'путешествовать по', 'изучить разные культуры',
-            'стать профессиональным', 'фотографом', 'мечтаю стать'
-        ]
-        
-        # TASK - конкретные задачи
-        task_patterns = [
-            'нужно', 'должен', 'должна', 'обязательно', 'срочно', 'важно',
-            'встреча', 'презентация', 'отчет', 'документ', 'письмо', 'звонок',
-            'покупки', 'магазин', 'продукты', 'еда', 'лекарства', 'аптека',
-            'врач', 'больница', 'поликлиника', 'медицина', 'здоровье',
-            'работа', 'офис', 'проект', 'задача', 'дело', 'план',
-            'учеба', 'экзамен', 'курс', 'лекция', 'семинар', 'конференция',
-            'путешествие', 'поездка', 'отпуск', 'билеты', 'отель', 'виза',
-            'ремонт', 'уборка', 'стирка', 'готовка', 'дом', 'квартира'
-        ]
-        
-        # Проверяем паттерны в порядке приоритета
-        
-        # 0. Специальные случаи для точного определения
-        if 'изучить' in text_lower and ('язык программирования' in text_lower or 'python' in text_lower or 'javascript' in text_lower):
-            return ['habit']
-        if 'когда-нибудь' in text_lower and ('прочитать' in text_lower or 'прочесть' in text_lower):
-            return ['goal']
-        if 'важно изучить' in text_lower and 'язык' in text_lower:
-            return ['habit']
-        if 'планирую изучить' in text_lower and ('фреймворк' in text_lower or 'технологию' in text_lower):
-            return ['habit']
-        if 'хочу получить сертификат' in text_lower or 'получить сертификат' in text_lower:
-            return ['goal']
-        if 'подготовиться к собеседованию' in text_lower or 'собеседование' in text_lower:
-            return ['task']
-        
-        # 1. Сначала проверяем конкретные задачи (приоритет для смешанных запросов)
-        for pattern in task_patterns:
-            if pattern in text_lower:
-                # Если есть и эмоции, и задачи - приоритет задачам
-                if any(p in text_lower for p in mood_patterns):
-                    # Специальная проверка для эмоций перед экзаменом
-                    if 'очень нервничаю' in text_lower and 'экзамен' in text_lower:
-                        return ['mood_entry']  # Эмоции перед экзаменом = настроение
-                    return ['task']  # Смешанный запрос = задача
-                return ['task']
-        
-        # 2. Затем проверяем эмоциональные состояния (только если нет задач)
-        for pattern in mood_patterns:
-            if pattern in text_lower:
-                # Специальная проверка для смешанных запросов
-                if 'собеседование' in text_lower:
-                    return ['task']  # Собеседования = задачи
-                elif 'экзамен' in text_lower and ('очень нервничаю' in text_lower or 'волнуюсь' in text_lower):
-                    return ['mood_entry']  # Эмоции перед экзаменом = настроение
-                return ['mood_entry']
-        
-        # 3. Проверяем привычки
-        for pattern in habit_patterns:
-            if pattern in text_lower:
-                return ['habit']
-        
-        # 4. Проверяем долгосрочные цели
-        for pattern in goal_patterns:
-            if pattern in text_lower:
-                return ['goal']
-        
-        # 5. Дополнительная логика для сложных случаев
-        if 'и' in text_lower and len(text.split()) > 5:
-            # Сложный запрос - может содержать несколько типов
-            types = []
-            if any(p in text_lower for p in mood_patterns):
-                types.append('mood_entry')
-            if any(p in text_lower for p in habit_patterns):
-                types.append('habit')
-            if any(p in text_lower for p in goal_patterns):
-                types.append('goal')
-            if any(p in text_lower for p in task_patterns):
-                types.append('task')
-            
-            if types:
-                return types[:2]  # Максимум 2 типа для сложных запросов
-        
-        # По умолчанию - задача
-        return ['task']
-    
-    def _create_object(self, text: str, task_type: str) -> Dict[str, Any]:
-        """Создает объект задачи с улучшенной логикой"""
-        obj = {
-            "title": self._extract_title(text, task_type),
-            "type": task_type,
-            "description": self._extract_description(text, task_type),
-            "tags": self._extract_tags(text),
-            "priority": self._extract_priority(text),
-            "dueDate": self._extract_due_date(text)
-        }
-        
-        # Дополнительно улучшаем объект
-        improved_obj = self._validate_and_improve_object(obj, text)
-        return improved_obj if improved_obj else obj
+        """Определяет типы задач в тексте: классификатор n-грамм, правила - запасной вариант"""
+        types = self.type_classifier.predict([text], min_confidence=TYPE_CONFIDENCE_THRESHOLD)[0]
+        if types:
+            return types
+        return self.rules.detect_types(text)
     
     def _extract_title(self, text: str, task_type: str) -> str:
-        """Извлекает заголовок с улучшенной логикой"""
-        text_lower = text.lower()
-        print(f"🔍 DEBUG: Извлекаем заголовок для '{text}' типа '{task_type}'")
-        
-        if task_type == 'task':
-            if 'отчёт' in text_lower and 'руководитель' in text_lower:
-                print(f"✅ DEBUG: Найдено совпадение 'отчёт руководитель'")
-                return "Отправка отчёта руководителю"
-            elif 'презентация' in text_lower and 'инвестор' in text_lower:
-                return "Презентация для инвесторов"
-            elif 'отчёт' in text_lower and 'начальник' in text_lower:
-                return "Отправка отчёта руководителю"
-            elif 'отчет' in text_lower and 'начальник' in text_lower:
-                return "Отправка отчёта руководителю"
-            elif 'презентация' in text_lower and 'клиент' in text_lower:
-                return "Презентация для клиента"
-            elif 'продукт' in text_lower or 'магазин' in text_lower:
-                return "Покупка продуктов"
-            elif 'презентация' in text_lower and 'вуз' in text_lower:
-                return "Презентация по вузу"
-            elif 'код' in text_lower and 'работа' in text_lower:
-                return "Написание кода по работе"
-            elif 'встреча' in text_lower and 'команда' in text_lower:
-                return "Встреча с командой"
-            elif 'собеседование' in text_lower:
-                return "Собеседование"
-            elif 'переезд' in text_lower:
-                return "Подготовка к переезду"
-            elif 'операция' in text_lower and 'мама' in text_lower:
-                return "Поддержка мамы во время операции"
-            elif 'врач' in text_lower or 'больница' in text_lower:
-                return "Визит к врачу"
-            elif 'встреча' in text_lower and 'клиент' in text_lower:
-                return "Встреча с клиентом"
-            elif 'отчёт' in text_lower:
-                return "Подготовка отчёта"
-            elif 'презентация' in text_lower:
-                return "Подготовка презентации"
-            elif 'встреча' in text_lower:
-                return "Встреча"
-            elif 'звонок' in text_lower:
-                return "Звонок"
-            elif 'письмо' in text_lower:
-                return "Написание письма"
-            elif 'документ' in text_lower:
-                return "Подготовка документа"
-            elif 'покупки' in text_lower:
-                return "Покупки"
-            elif 'ремонт' in text_lower:
-                return "Ремонт"
-            elif 'уборка' in text_lower:
-                return "Уборка"
-            elif 'готовка' in text_lower:
-                return "Готовка"
-            elif 'стирка' in text_lower:
-                return "Стирка"
-            elif 'экзамен' in text_lower:
-                return "Подготовка к экзамену"
-            elif 'курс' in text_lower:
-                return "Прохождение курса"
-            elif 'лекция' in text_lower:
-                return "Посещение лекции"
-            elif 'конференция' in text_lower:
-                return "Участие в конференции"
-            elif 'отпуск' in text_lower:
-                return "Планирование отпуска"
-            elif 'поездка' in text_lower:
-                return "Планирование поездки"
-            elif 'билеты' in text_lower:
-                return "Покупка билетов"
-            elif 'отель' in text_lower:
-                return "Бронирование отеля"
-            elif 'виза' in text_lower:
-                return "Оформление визы"
-            else:
-                # Попробуем извлечь ключевые слова из текста
-                words = text.split()
-                if len(words) >= 3:
-                    # Берем первые 2-3 значимых слова
-                    key_words = []
-                    for word in words[:5]:  # Проверяем первые 5 слов
-                        if len(word) > 3 and word.lower() not in ['нужно', 'должен', 'должна', 'обязательно', 'срочно', 'важно', 'завтра', 'послезавтра', 'сегодня']:
-                            key_words.append(word)
-                            if len(key_words) >= 2:
-                                break
-                    
-                    if key_words:
-                        return " ".join(key_words).title()
-                
-                print(f"⚠️ DEBUG: Не найдено совпадение, возвращаем 'Задача'")
-                return "Задача"
-        elif task_type == 'mood_entry':
-            if 'волнуюсь' in text_lower or 'переживаю' in text_lower or 'стресс' in text_lower:
-                return "Эмоциональное состояние"
-            elif 'устал' in text_lower or 'усталым' in text_lower or 'усталость' in text_lower:
-                return "Состояние усталости"
-            elif 'отлично' in text_lower or 'хорошо' in text_lower:
-                return "Отличное настроение"
-            elif 'грустно' in text_lower or 'плохо' in text_lower:
-                return "Плохое настроение"
-            elif 'тревога' in text_lower or 'беспокоюсь' in text_lower:
-                return "Состояние тревоги"
-            else:
-                return "Запись настроения"
-        elif task_type == 'habit':
-            if 'бегать' in text_lower:
-                return "Утренний бег"
-            elif 'программировать' in text_lower or 'python' in text_lower or 'изучать' in text_lower:
-                return "Изучение Python"
-            elif 'английский' in text_lower or 'язык' in text_lower:
-                return "Изучение языка"
-            elif 'читать' in text_lower:
-                return "Ежедневное чтение"
-            elif 'тренировка' in text_lower or 'спорт' in text_lower:
-                return "Регулярные тренировки"
-            elif 'медитировать' in text_lower or 'йога' in text_lower:
-                return "Медитация"
-            else:
-                return "Новая привычка"
-        elif task_type == 'goal':
-            if 'стартап' in text_lower or 'бизнес' in text_lower or 'открыть' in text_lower:
-                return "Открытие бизнеса"
-            elif 'приложение' in text_lower:
-                return "Создание приложения"
-            elif 'фотограф' in text_lower:
-                return "Становление фотографом"
-            elif 'токио' in text_lower:
-                return "Переезд в Токио"
-            elif 'карьера' in text_lower or 'профессия' in text_lower:
-                return "Развитие карьеры"
-            elif 'навык' in text_lower or 'мастерство' in text_lower:
-                return "Развитие навыков"
-            elif 'дом' in text_lower or 'квартира' in text_lower:
-                return "Покупка жилья"
-            elif 'путешествие' in text_lower or 'поездка' in text_lower:
-                return "Планирование путешествия"
-            else:
-                return "Долгосрочная цель"
-        
-        return "Запись"
+        """Заголовок по таблице шаблонов (voicaj_templates.json)"""
+        return self._extract_title_scored(text, task_type)[0]
     
-    def _extract_description(self, text: str, task_type: str) -> str:
-        """Извлекает описание с улучшенной логикой"""
-        text_lower = text.lower()
-        
-        if task_type == 'task':
-            if 'отчёт' in text_lower and 'руководитель' in text_lower:
-                return "Подготовить и отправить отчёт руководителю о выполненных задачах"
-            elif 'презентация' in text_lower and 'инвестор' in text_lower:
-                return "Подготовить материалы и репетировать речь для важной презентации перед инвесторами"
-            elif 'презентация' in text_lower and 'клиент' in text_lower:
-                return "Подготовить материалы и репетировать речь для важной презентации клиенту"
-            elif 'продукт' in text_lower or 'магазин' in text_lower:
-                return "Сходить в магазин и купить продукты на неделю"
-            elif 'презентация' in text_lower and 'вуз' in text_lower:
-                return "Подготовить презентацию по вузу для демонстрации результатов обучения"
-            elif 'код' in text_lower and 'работа' in text_lower:
-                return "Выполнить задачу по написанию кода для работы"
-            elif 'встреча' in text_lower and 'команда' in text_lower:
-                return "Провести встречу с командой разработки для обсуждения проекта"
-            elif 'собеседование' in text_lower:
-                return "Подготовиться к собеседованию и выбрать подходящую одежду"
-            elif 'переезд' in text_lower:
-                return "Упаковать вещи и договориться с грузчиками для переезда"
-            elif 'операция' in text_lower and 'мама' in text_lower:
-                return "Быть рядом с мамой во время операции и оказать поддержку"
-            else:
-                return f"Выполнить: {text}"
-        elif task_type == 'mood_entry':
-            if 'волнуюсь' in text_lower or 'переживаю' in text_lower:
-                return "Испытываю сильное волнение и тревогу"
-            elif 'устал' in text_lower or 'усталым' in text_lower:
-                return "Испытываю усталость и нуждаюсь в отдыхе"
-            elif 'отлично' in text_lower:
-                return "Чувствую себя отлично, полон энергии и позитива"
-            else:
-                return "Запись о текущем эмоциональном состоянии"
-        elif task_type == 'habit':
-            if 'бегать' in text_lower:
-                return "Регулярно бегать каждое утро для поддержания физической формы"
-            elif 'программировать' in text_lower:
-                return "Регулярно программировать каждый день для развития навыков"
-            elif 'английский' in text_lower or 'язык' in text_lower:
-                return "Регулярно изучать английский язык для развития навыков"
-            elif 'читать' in text_lower:
-                return "Регулярно читать для развития и самообразования"
-            else:
-                return "Развить новую полезную привычку"
-        elif task_type == 'goal':
-            if 'стартап' in text_lower:
-                return "Создать стартап в сфере искусственного интеллекта с привлечением инвестиций"
-            elif 'приложение' in text_lower:
-                return "Создать мобильное приложение с качественным дизайном"
-            elif 'фотограф' in text_lower:
-                return "Стать профессиональным фотографом и открыть собственную студию"
-            elif 'токио' in text_lower:
-                return "Выучить японский язык и переехать в Токио для работы в IT компании"
-            else:
-                return "Достичь важной долгосрочной цели"
-        
-        return f"Описание: {text}"
+    @staticmethod
+    def _keyword_title(text: str) -> Optional[str]:
+        """Заголовок из первых значимых слов запроса (когда ни один шаблон не подошел)"""
+        words = text.split()
+        if len(words) < 3:
+            return None
+        # Берем первые 2-3 значимых слова
+        key_words = []
+        for word in words[:5]:  # Проверяем первые 5 слов
+            if len(word) > 3 and word.lower() not in ['нужно', 'должен', 'должна', 'обязательно', 'срочно', 'важно', 'завтра', 'послезавтра', 'сегодня']:
+                key_words.append(word)
+                if len(key_words) >= 2:
+                    break
+        return " ".join(key_words).title() if key_words else None
     
     def _extract_tags(self, text: str) -> List[str]:
-        """Извлекает теги с улучшенной логикой"""
-        # Ищем похожие примеры
-        similar_examples = self.find_similar_examples(text)
-        
-        for example in similar_examples:
-            if 'expected' in example and isinstance(example['expected'], list):
-                for item in example['expected']:
-                    if 'tags' in item and isinstance(item['tags'], list):
-                        return item['tags']
-        
-        # Если не нашли в обучении, используем улучшенные правила
-        tags = []
-        text_lower = text.lower()
-        
-        # Расширенная логика извлечения тегов
-        tag_mappings = {
-            'работа': ['работа', 'офис', 'коллеги', 'проект', 'встреча', 'программировать', 'код', 'разработка', 'клиент', 'презентация', 'карьера', 'бизнес', 'отчёт', 'руководитель', 'поставщик', 'команда', 'совещание', 'интервью', 'кандидат', 'тестирование', 'приложение', 'коммерческое предложение', 'продажи', 'собеседование', 'google'],
-            'семья': ['семья', 'дети', 'родители', 'родственники', 'встретиться с родителями', 'мама', 'папа', 'день рождения', 'свадьба', 'молодожены'],
-            'здоровье': ['здоровье', 'врач', 'лекарство', 'больница', 'устал', 'усталым', 'подавлен', 'терапевт', 'лечение', 'похудеть', 'диета', 'бросить курить', 'усталость', 'операция'],
-            'спорт': ['спорт', 'тренировка', 'фитнес', 'зал', 'бегать', 'бег', 'беговая', 'утренний бег', 'тренироваться', 'физическая форма'],
-            'технологии': ['программировать', 'код', 'разработка', 'компьютер', 'технологии', 'сайт', 'портфолио', 'IT', 'программирование'],
-            'настроение': ['настроение', 'чувствую', 'эмоции', 'отлично', 'хорошо', 'плохо', 'волнуюсь', 'нервничаю', 'люблю', 'переживаю', 'тревога', 'стресс'],
-            'учеба': ['учеба', 'экзамен', 'математика', 'изучать', 'обучение', 'курс', 'лекция', 'испанский', 'язык', 'презентация', 'вуз', 'магистратура', 'искусственный интеллект', 'мотивационное письмо', 'английский', 'японский'],
-            'покупки': ['покупки', 'купить', 'магазин', 'товар', 'продукт', 'продукты', 'костюм', 'подарок', 'цветы', 'торт', 'мебель', 'билеты'],
-            'дом': ['дом', 'квартира', 'переезд', 'мебель', 'недвижимость', 'грузчики'],
-            'путешествия': ['путешествия', 'отпуск', 'Европа', 'отель', 'виза', 'самолет', 'транспорт', 'горы', 'поход', 'поход в горы', 'токио'],
-            'хобби': ['хобби', 'гитара', 'музыка', 'играть', 'занятия'],
-            'красота': ['красота', 'маникюр', 'массаж', 'расслабление', 'уход'],
-            'организация': ['организация', 'упаковка', 'вещи', 'подготовка'],
-            'дизайн': ['дизайн', 'интерфейс', 'ui', 'ux', 'графика', 'визуал'],
-            'подарки': ['подарки', 'подарок', 'поздравление', 'сюрприз'],
-            'новое место': ['новое место', 'новая работа', 'адаптация', 'коллектив'],
-            'кулинария': ['кулинария', 'готовка', 'рецепты', 'шеф-повар', 'кухня'],
-            'музыка': ['музыка', 'пианино', 'гитара', 'инструменты', 'мелодия'],
-            'отчёт': ['отчёт', 'отчёты', 'отправить отчёт', 'руководитель'],
-            'презентация': ['презентация', 'презентации', 'клиент', 'демонстрация', 'инвесторы'],
-            'переговоры': ['переговоры', 'поставщик', 'обсуждение', 'условия'],
-            'совещание': ['совещание', 'команда', 'встреча команды'],
-            'система': ['система', 'база данных', 'обновление', 'проверка'],
-            'проект': ['проект', 'техническое задание', 'требования'],
-            'hr': ['hr', 'интервью', 'кандидат', 'найм'],
-            'qa': ['qa', 'тестирование', 'баги', 'проверка'],
-            'продажи': ['продажи', 'коммерческое предложение', 'клиент', 'расценки'],
-            'стартап': ['стартап', 'стартапы', 'инвестиции', 'MVP', 'соучредитель'],
-            'медитация': ['медитация', 'приложение', 'wellness', 'здоровье'],
-            'фотография': ['фотография', 'фотограф', 'студия', 'творчество'],
-            'привычка': ['привычка', 'привычки', 'регулярно', 'ежедневно', 'каждый день']
-        }
-        
-        # Ищем совпадения
-        for tag, keywords in tag_mappings.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    if tag not in tags:
-                        tags.append(tag)
-                    break
-        
-        # Если тегов мало, добавляем дополнительные на основе контекста
-        if len(tags) < 2:
-            if 'завтра' in text_lower or 'послезавтра' in text_lower:
-                if 'задача' not in tags:
-                    tags.append('задача')
-            if 'хочу' in text_lower or 'начну' in text_lower:
-                if 'привычка' not in tags:
-                    tags.append('привычка')
-            if 'чувствую' in text_lower or 'волнуюсь' in text_lower:
-                if 'настроение' not in tags:
-                    tags.append('настроение')
-        
-        return tags[:4] if tags else ["задача"]  # Максимум 4 тега
+        """Извлекает теги: многометочная модель, правила - запасной вариант"""
+        tags = self.tag_predictor.predict([text])[0]
+        if tags:
+            return tags
+        return self.rules.extract_tags(self.training_data, text)
     
     def _extract_priority(self, text: str) -> str:
-        """Извлекает приоритет с улучшенной логикой"""
-        text_lower = text.lower()
-        
-        # Расширенные ключевые слова для приоритетов (в порядке приоритета)
-        priority_keywords = {
-            'low': ['когда-нибудь', 'не спеша', 'в свободное время', 'срочность низкая', 'неважно', 'не важно', 'неприоритетно', 'в будущем', 'мечтаю', 'мечтаю стать'],
-            'high': ['срочно', 'критично', 'немедленно', 'критическая', 'неотложно', 'срочная', 'важно', 'важная', 'критично важно', 'критично важно завершить', 'нужно', 'надо', 'требуется', 'организовать', 'подготовить', 'подготовиться'],
-            'medium': ['на этой неделе', 'в ближайшее время', 'встреча', 'презентация', 'отчёт', 'хочу', 'планирую', 'изучить', 'фреймворк', 'технологию', 'отправить']
-        }
-        
-        # Проверяем наличие ключевых слов
-        for priority, keywords in priority_keywords.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    return priority
-        
-        # Дополнительная логика на основе контекста (в порядке приоритета)
-        if 'срочно' in text_lower or 'критично' in text_lower:
-            return 'high'
-        elif 'когда-нибудь' in text_lower or 'не спеша' in text_lower or 'в будущем' in text_lower:
-            return 'low'
-        elif 'напоминание' in text_lower or 'будильник' in text_lower:
-            return 'high'  # Напоминания и будильники = high приоритет
-        elif 'отправить отчёт' in text_lower or 'отправить отчет' in text_lower:
-            return 'medium'  # Отправка отчётов = medium приоритет
-        elif 'завтра нужно отправить' in text_lower:
-            return 'medium'  # Обычные задачи отправки завтра = medium
-        elif 'нужно' in text_lower and 'отправить' in text_lower:
-            return 'medium'  # Обычные задачи отправки = medium
-        elif 'изучить' in text_lower and ('фреймворк' in text_lower or 'технологию' in text_lower):
-            return 'medium'  # Изучение технологий = medium приоритет
-        elif 'планирую изучить' in text_lower or ('планирую' in text_lower and 'изучить' in text_lower):
-            return 'medium'  # Планирование изучения = medium приоритет
-        elif 'волнуюсь' in text_lower or 'тревога' in text_lower or 'паника' in text_lower or 'нервничаю' in text_lower:
-            return 'high'  # Тревога и паника = high приоритет
-        elif 'волнуюсь перед' in text_lower or 'не могу уснуть' in text_lower:
-            return 'high'  # Сильная тревога = high приоритет
-        elif 'испытываю сильную' in text_lower and ('тревогу' in text_lower or 'панику' in text_lower):
-            return 'high'  # Сильная тревога/паника = high приоритет
-        elif 'очень нервничаю' in text_lower or 'очень волнуюсь' in text_lower:
-            return 'high'  # Сильное волнение = high приоритет
-        elif 'собеседование' in text_lower:
-            return 'high'  # Собеседования = high приоритет
-        elif 'важно' in text_lower and ('встреча' in text_lower or 'презентация' in text_lower):
-            return 'high'  # Важные встречи/презентации = high
-        elif 'важная' in text_lower and ('встреча' in text_lower or 'презентация' in text_lower):
-            return 'high'  # Важные встречи/презентации = high
-        elif 'важно' in text_lower and ('проект' in text_lower or 'дедлайн' in text_lower):
-            return 'high'  # Важные проекты с дедлайном = high
-        elif 'до 12:00' in text_lower or 'до 12' in text_lower:
-            return 'high'  # Задачи с дедлайном до полудня = high
-        elif 'проект' in text_lower and ('до' in text_lower or 'дедлайн' in text_lower):
-            return 'high'  # Проекты с дедлайном = high
-        elif 'нужно' in text_lower and ('организовать' in text_lower or 'подготовить' in text_lower):
-            return 'high'  # Важные организационные задачи = high
-        elif 'встреча' in text_lower or 'презентация' in text_lower:
-            return 'medium'  # Обычные встречи/презентации = medium
-        elif 'важно' in text_lower:
-            return 'high'
-        elif 'хочу' in text_lower or 'планирую' in text_lower:
-            return 'medium'
-        elif 'мечтаю' in text_lower:
-            return 'low'  # Мечты = low приоритет
-        elif 'радуюсь' in text_lower or 'счастье' in text_lower or 'благодарность' in text_lower:
-            return 'medium'  # Положительные эмоции = medium приоритет
-        else:
-            return 'medium'
+        """Извлекает приоритет: классификатор приоритета, правила - запасной вариант"""
+        priority = self.priority_classifier.predict([text], max_types=1, min_confidence=PRIORITY_CONFIDENCE_THRESHOLD)[0]
+        if priority:
+            return priority[0]
+        return self.rules.extract_priority(text)
     
     def _extract_due_date(self, text: str) -> str:
-        """Извлекает дату выполнения с улучшенной логикой"""
-        text_lower = text.lower()
-        
-        # Определяем конкретное время из текста
-        time_patterns = {
-            # Точные времена HH:MM
-            '6:30': '06:30',
-            '6:30 утра': '06:30',
-            '6:30 утром': '06:30',
-            '7:15': '07:15',
-            '7:15 утра': '07:15',
-            '7:15 утром': '07:15',
-            '8:30': '08:30',
-            '8:30 утра': '08:30',
-            '9:45': '09:45',
-            '9:45 утра': '09:45',
-            '10:15': '10:15',
-            '10:15 утра': '10:15',
-            '11:45': '11:45',
-            '11:45 утра': '11:45',
-            '12:15': '12:15',
-            '12:15 дня': '12:15',
-            '13:45': '13:45',
-            '13:45 дня': '13:45',
-            '14:15': '14:15',
-            '14:15 дня': '14:15',
-            '15:30': '15:30',
-            '15:30 дня': '15:30',
-            '16:45': '16:45',
-            '16:45 дня': '16:45',
-            '17:15': '17:15',
-            '17:15 дня': '17:15',
-            '18:30': '18:30',
-            '18:30 вечера': '18:30',
-            '19:45': '19:45',
-            '19:45 вечера': '19:45',
-            '20:15': '20:15',
-            '20:15 вечера': '20:15',
-            '21:30': '21:30',
-            '21:30 вечера': '21:30',
-            '21:45': '21:45',
-            '21:45 вечера': '21:45',
-            '22:15': '22:15',
-            '22:15 вечера': '22:15',
-            '23:30': '23:30',
-            '23:30 вечера': '23:30',
-            
-            # Форматы "в HH:MM"
-            'в 6:30': '06:30',
-            'в 6:30 утра': '06:30',
-            'в 7:15': '07:15',
-            'в 7:15 утра': '07:15',
-            'в 8:30': '08:30',
-            'в 8:30 утра': '08:30',
-            'в 9:45': '09:45',
-            'в 9:45 утра': '09:45',
-            'в 10:15': '10:15',
-            'в 10:15 утра': '10:15',
-            'в 11:45': '11:45',
-            'в 11:45 утра': '11:45',
-            'в 12:15': '12:15',
-            'в 12:15 дня': '12:15',
-            'в 13:45': '13:45',
-            'в 13:45 дня': '13:45',
-            'в 14:15': '14:15',
-            'в 14:15 дня': '14:15',
-            'в 15:30': '15:30',
-            'в 15:30 дня': '15:30',
-            'в 16:45': '16:45',
-            'в 16:45 дня': '16:45',
-            'в 17:15': '17:15',
-            'в 17:15 дня': '17:15',
-            'в 18:30': '18:30',
-            'в 18:30 вечера': '18:30',
-            'в 19:45': '19:45',
-            'в 19:45 вечера': '19:45',
-            'в 20:15': '20:15',
-            'в 20:15 вечера': '20:15',
-            'в 21:30': '21:30',
-            'в 21:30 вечера': '21:30',
-            'в 21:45': '21:45',
-            'в 21:45 вечера': '21:45',
-            'в 22:15': '22:15',
-            'в 22:15 вечера': '22:15',
-            'в 23:30': '23:30',
-            'в 23:30 вечера': '23:30',
-            
-            # Старые паттерны (сохраняем для совместимости)
-            'до 12 дня': '12:00',
-            'до 12': '12:00',
-            '12 дня': '12:00',
-            '12:00': '12:00',
-            '12': '12:00',
-            'в 13': '13:00',
-            'в 14': '14:00',
-            'в 15': '15:00',
-            'в 16': '16:00',
-            'в 17': '17:00',
-            'в 18': '18:00',
-            'в 19': '19:00',
-            'в 20': '20:00',
-            'в 21': '21:00',
-            'в 22': '22:00',
-            'в 23': '23:00',
-            'в 10': '10:00',
-            'в 11': '11:00',
-            'в 7:00': '07:00',
-            'в 8:00': '08:00',
-            'в 9:00': '09:00',
-            'в 10:00': '10:00',
-            'в 11:00': '11:00',
-            'в 12:00': '12:00',
-            'в 13:00': '13:00',
-            'в 14:00': '14:00',
-            'в 15:00': '15:00',
-            'в 16:00': '16:00',
-            'в 17:00': '17:00',
-            'в 18:00': '18:00',
-            'в 19:00': '19:00',
-            'в 20:00': '20:00',
-            'в 21:00': '21:00',
-            'в 22:00': '22:00',
-            'в 23:00': '23:00',
-            'в 8': '08:00',
-            'в 9': '09:00',
-            'в 9:30': '09:30',
-            'в 10:30': '10:30',
-            'в 11:30': '11:30',
-            'в 12:30': '12:30',
-            'в 13:30': '13:30',
-            'в 14:30': '14:30',
-            'в 15:30': '15:30',
-            'в 16:30': '16:30',
-            'в 17:30': '17:30',
-            'в 18:30': '18:30',
-            'в 19:30': '19:30',
-            'в 20:30': '20:30',
-            'в 21:30': '21:30',
-            'в 22:30': '22:30',
-            'в 23:30': '23:30',
-            '8 утра': '08:00',
-            '9 утра': '09:00',
-            '10 утра': '10:00',
-            '11 утра': '11:00',
-            '12 дня': '12:00',
-            '13 дня': '13:00',
-            '14 дня': '14:00',
-            '15 дня': '15:00',
-            '16 дня': '16:00',
-            '17 дня': '17:00',
-            '18 вечера': '18:00',
-            '19 вечера': '19:00',
-            '20 вечера': '20:00',
-            '21 вечера': '21:00',
-            '22 вечера': '22:00',
-            '23 вечера': '23:00',
-            'в 8 утра': '08:00',
-            'в 9 утра': '09:00',
-            'в 10 утра': '10:00',
-            'в 11 утра': '11:00',
-            'в 12 дня': '12:00',
-            'в 13 дня': '13:00',
-            'в 14 дня': '14:00',
-            'в 15 дня': '15:00',
-            'в 16 дня': '16:00',
-            'в 17 дня': '17:00',
-            'в 18 вечера': '18:00',
-            'в 19 вечера': '19:00',
-            'в 20 вечера': '20:00',
-            'в 21 вечера': '21:00',
-            'в 22 вечера': '22:00',
-            'в 23 вечера': '23:00',
-            '13:00': '13:00',
-            '14:00': '14:00',
-            '15:00': '15:00',
-            '16:00': '16:00',
-            '17:00': '17:00',
-            '18:00': '18:00',
-            '19:00': '19:00',
-            '20:00': '20:00',
-            '21:00': '21:00',
-            '22:00': '22:00',
-            '23:00': '23:00',
-            '10:00': '10:00',
-            '11:00': '11:00',
-            '08:00': '08:00',
-            '09:00': '09:00',
-            '09:30': '09:30',
-            '10:30': '10:30',
-            '11:30': '11:30',
-            '12:30': '12:30',
-            '13:30': '13:30',
-            '14:30': '14:30',
-            '15:30': '15:30',
-            '16:30': '16:30',
-            '17:30': '17:30',
-            '18:30': '18:30',
-            '19:30': '19:30',
-            '20:30': '20:30',
-            '21:30': '21:30',
-            '22:30': '22:30',
-            '23:30': '23:30',
-            '00:30': '00:30',
-            'утром': '10:00',
-            'утро': '10:00',
-            'днем': '14:00',
-            'день': '14:00',
-            'вечером': '18:00',
-            'вечер': '18:00',
-            'ночью': '22:00',
-            'ночь': '22:00',
-            'до 10': '10:00',
-            'до 14': '14:00',
-            'до 18': '18:00',
-            'до 20': '20:00'
+        """Извлекает дату выполнения грамматикой сроков (date_grammar.py)"""
+        due, _ = due_date(self.date_extractor.extract(text), self.clock.anchors())
+        return due
+    
+    def _detect_types_scored(self, text: str) -> Tuple[List[str], float]:
+        """Типы и уверенность: вероятность классификатора, если он уверен, иначе правила"""
+        confidence = float(self.type_classifier.confidence([text])[0])
+        if confidence >= TYPE_CONFIDENCE_THRESHOLD:
+            return self.type_classifier.predict([text], min_confidence=TYPE_CONFIDENCE_THRESHOLD)[0], confidence
+        return self.rules.detect_types(text), RULE_TABLE_CONFIDENCE
+    
+    def _extract_title_scored(self, text: str, task_type: str) -> Tuple[str, float]:
+        """Заголовок и уверенность: шаблон таблицы, слова запроса (для задач) или заглушка"""
+        title, matched = self.templates.title(text, task_type)
+        if matched:
+            return title, TEMPLATE_CONFIDENCE
+        if task_type == 'task':
+            keyword_title = self._keyword_title(text)
+            if keyword_title:
+                return keyword_title, KEYWORD_TITLE_CONFIDENCE
+        return title, GENERIC_CONFIDENCE
+    
+    def _extract_description_scored(self, text: str, task_type: str) -> Tuple[str, float]:
+        """Описание и уверенность: шаблон таблицы или заглушка (в том числе пересказ запроса)"""
+        description, matched = self.templates.description(text, task_type)
+        return description, TEMPLATE_CONFIDENCE if matched else GENERIC_CONFIDENCE
+    
+    def _extract_tags_scored(self, text: str) -> Tuple[List[str], float]:
+        """Теги и уверенность: средняя вероятность тегов модели, иначе уверенность правил"""
+        tags, confidence = self.tag_predictor.predict_scored([text])[0]
+        if tags:
+            return tags, confidence
+        return self.rules.extract_tags_scored(self.training_data, text)
+    
+    def _extract_priority_scored(self, text: str) -> Tuple[str, float]:
+        """Приоритет и уверенность: вероятность классификатора, иначе уверенность правил"""
+        confidence = float(self.priority_classifier.confidence([text])[0])
+        if confidence >= PRIORITY_CONFIDENCE_THRESHOLD:
+            return self.priority_classifier.predict([text], max_types=1)[0][0], confidence
+        return self.rules.extract_priority_scored(text)
+    
+    def _extract_due_date_scored(self, text: str) -> Tuple[str, float]:
+        """Срок и уверенность разбора (date_grammar.due_date)"""
+        return due_date(self.date_extractor.extract(text), self.clock.anchors())
+    
+    def _create_object_scored(self, text: str, task_type: str,
+                              type_confidence: float) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """Объект быстрого контура и уверенность каждого поля"""
+        fields = {
+            'title': self._extract_title_scored(text, task_type),
+            'description': self._extract_description_scored(text, task_type),
+            'tags': self._extract_tags_scored(text),
+            'priority': self._extract_priority_scored(text),
+            'dueDate': self._extract_due_date_scored(text)
         }
-        
-        # Ищем конкретное время в тексте
-        specific_time = None
-        print(f"🔍 DEBUG: Ищем время в тексте '{text_lower}'")
-        for pattern, time in time_patterns.items():
-            if pattern in text_lower:
-                specific_time = time
-                print(f"✅ DEBUG: Найдено время '{pattern}' -> '{time}'")
-                break
-        
-        if not specific_time:
-            print(f"⚠️ DEBUG: Время не найдено, используем стандартное 18:00")
-        
-        # Определяем дату
-        if 'срочно' in text_lower:
-            date = self.current_date
-        elif 'послезавтра' in text_lower:
-            date = self.current_date + timedelta(days=2)
-        elif 'завтра' in text_lower:
-            date = self.current_date + timedelta(days=1)
-        elif 'сегодня' in text_lower:
-            date = self.current_date
-        elif 'следующей неделе' in text_lower or 'следующей недели' in text_lower:
-            date = self.current_date + timedelta(days=7)
-        elif 'этой неделе' in text_lower:
-            date = self.current_date + timedelta(days=3)
-        elif 'когда-нибудь' in text_lower:
-            date = self.current_date + timedelta(days=1)
+        obj = {'title': fields['title'][0], 'type': task_type}
+        obj.update((field, value) for field, (value, _) in fields.items() if field != 'title')
+        confidence = {'type': type_confidence}
+        confidence.update((field, score) for field, (_, score) in fields.items())
+        return obj, confidence
+    
+    def _similar_scored(self, text: str) -> List[Tuple[Dict[str, Any], float]]:
+        """Похожие примеры со сходством: семантические (если индекс есть) и TF-IDF"""
+        similar = self.rules.similar_examples(self.training_data, text, SIMILAR_TOP_K)
+        if self.semantic_search is not None:
+            similar.extend((self.training_data[index], score)
+                           for index, score in self.semantic_search.query(text, SIMILAR_TOP_K))
+        return similar
+    
+    def _llm_fields(self, text: str, obj: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+        """Просит LLM дописать только неуверенные поля объекта: известные поля идут в промпт
+        готовым JSON, модель продолжает его с первого неуверенного поля"""
+        known = {field: value for field, value in obj.items() if field not in fields}
+        head = json.dumps(known, ensure_ascii=False, indent=4)[:-2] + f',\n    "{fields[0]}": '
+        prompt = f"User: {text}\n\nAssistant: {head}"
+        try:
+            generated = self._generate(prompt, max_new_tokens=120, repetition_penalty=1.3)
+            if generated is None:
+                return {}
+            end = generated.find('}')
+            completed = json.loads(head + (generated[:end + 1] if end >= 0 else generated + '}'))
+        except LLMOverloaded:
+            raise
+        except Exception as e:
+            print(f"⚠️ LLM не дописала поля {fields}: {e}")
+            return {}
+        return {field: completed[field] for field in fields if valid_field(field, completed.get(field))}
+    
+    def _fast_fields(self, text: str, task_type: str, type_confidence: float, force: bool,
+                     timings: Dict[str, float]) -> Tuple[Dict[str, Any], Dict[str, float], Dict[str, str], List[str]]:
+        """Объект быстрого контура, его неуверенные поля, уточненные по похожим примерам, уверенность
+        и источник каждого поля и список эскалированных полей"""
+        start = time.perf_counter()
+        obj, confidence = self._create_object_scored(text, task_type, type_confidence)
+        sources = {field: 'fast' for field in confidence}
+        escalated = fields_to_escalate(confidence, force=force)
+        timings['fast'] += (time.perf_counter() - start) * 1000
+        
+        if escalated:
+            start = time.perf_counter()
+            for field, (value, score) in retrieve_fields(self._similar_scored(text), task_type, escalated).items():
+                if score > confidence[field]:
+                    obj[field], confidence[field], sources[field] = value, score, 'retrieval'
+            timings['retrieval'] += (time.perf_counter() - start) * 1000
+        return obj, confidence, sources, escalated
+    
+    def _analyze_fields(self, text: str, task_type: str, type_confidence: float, force: bool,
+                        timings: Dict[str, float], use_llm: bool = True) -> Tuple[Dict[str, Any], Dict[str, Any], bool]:
+        """Объект с эскалацией неуверенных полей: похожие примеры, затем LLM для оставшихся.
+        Возвращает объект, его отладочную запись и признак ответа без LLM из-за перегрузки"""
+        obj, confidence, sources, escalated = self._fast_fields(text, task_type, type_confidence, force, timings)
+        degraded = False
+        remaining = [field for field in escalated if confidence[field] < FIELD_CONFIDENCE_THRESHOLD]
+        if remaining and use_llm:
+            start = time.perf_counter()
+            try:
+                filled = self._llm_fields(text, obj, remaining)
+            except LLMOverloaded as e:
+                # Очередь к LLM полна: при политике 'reject' - 429, иначе ответ без LLM
+                if self.llm_admission.policy == 'reject':
+                    raise
+                print(f"⏳ {e}; отвечаем без LLM")
+                filled, degraded = {}, True
+            for field, value in filled.items():
+                obj[field], confidence[field], sources[field] = value, LLM_FIELD_CONFIDENCE, 'llm'
+            # В журнал дистилляции не пишем: тип и прочие поля объекта взяты из быстрого контура,
+            # а поля LLM дописаны при условии на них
+            timings['llm'] += (time.perf_counter() - start) * 1000
+        
+        entry = {
+            'type': task_type,
+            'confidence': {field: round(score, 3) for field, score in confidence.items()},
+            'object_confidence': round(object_confidence(confidence), 3),
+            'source': sources,
+            'escalated': escalated
+        }
+        return obj, entry, degraded
+    
+    def llm_route(self, text: str) -> Optional[str]:
+        """Маршрут запроса при текущих правилах и моделях без вызова LLM (как в analyze): 'llm' -
+        весь запрос в LLM, 'fields' - поля, неуверенные и после поиска похожих, None - без LLM"""
+        detected_types, type_confidence = self._detect_types_scored(text.lower())
+        if self.is_complex_request(text):
+            return 'llm'
+        task_type = detected_types[0] if detected_types else 'task'
+        _, confidence, _, escalated = self._fast_fields(text, task_type, type_confidence, False,
+                                                        {'fast': 0.0, 'retrieval': 0.0})
+        return 'fields' if any(confidence[field] < FIELD_CONFIDENCE_THRESHOLD for field in escalated) else None
+    
+    def analyze(self, text: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Анализ с уверенностью по полям.
+        
+        Сложный запрос (несколько намерений по эвристикам правил), в котором не уверен
+        классификатор типов, целиком уходит в LLM (llm_analysis): только она возвращает
+        несколько объектов. Остальные запросы и сложные, на которые LLM не ответила, идут
+        по полям: быстрый контур (модели и правила) строит объект и оценивает каждое поле;
+        если объект неуверенный (средняя ниже OBJECT_CONFIDENCE_THRESHOLD), его поля ниже
+        FIELD_CONFIDENCE_THRESHOLD уходят в поиск похожих примеров, а оставшиеся
+        неуверенными - в LLM (если очередь к ней не полна, см. llm_admission.py).
+        Второй элемент - отладочный раздел API: маршрут, уверенность и источник каждого
+        поля и время каждого уровня.
+        """
+        timings = {'fast': 0.0, 'retrieval': 0.0, 'llm': 0.0}
+        degraded = False
+        start = time.perf_counter()
+        detected_types, type_confidence = self._detect_types_scored(text.lower())
+        complex_request = self.is_complex_request(text)
+        timings['fast'] += (time.perf_counter() - start) * 1000
+        
+        objects = []
+        if complex_request:
+            start = time.perf_counter()
+            try:
+                objects = self.llm_analysis(text, detected_types)
+            except LLMOverloaded as e:
+                if self.llm_admission.policy == 'reject':
+                    raise
+                print(f"⏳ {e}; отвечаем без LLM")
+                degraded = True
+            timings['llm'] += (time.perf_counter() - start) * 1000
+        
+        if objects:
+            route = 'llm'
+            entries = [{'type': obj.get('type'), 'source': 'llm'} for obj in objects]
         else:
-            date = self.current_date + timedelta(days=1)
-        
-        # Используем конкретное время или стандартное
-        time = specific_time if specific_time else "18:00"
-        
-        return date.strftime(f"%Y-%m-%d {time}")
+            # Берем только первый тип для простоты
+            task_type = detected_types[0] if detected_types else 'task'
+            obj, entry, fields_degraded = self._analyze_fields(text, task_type, type_confidence, complex_request,
+                                                               timings, use_llm=not degraded)
+            route = 'fields' if entry['escalated'] else 'fast'
+            objects, entries, degraded = [obj], [entry], degraded or fields_degraded
+        
+        debug = {
+            'route': route,
+            'objects': entries,
+            'timings_ms': {tier: round(ms, 3) for tier, ms in timings.items()},
+            'llm_degraded': degraded,
+            'thresholds': {'field': FIELD_CONFIDENCE_THRESHOLD, 'object': OBJECT_CONFIDENCE_THRESHOLD}
+        }
+        return objects, debug
     
-    def improve_from_feedback(self, user_input: str, model_output: List[Dict], feedback: str) -> List[Dict]:
-        """Улучшает модель на основе обратной связи"""
-        print(f"🎓 Обучение на основе обратной связи: {feedback[:50]}...")
-        
-        # Добавляем пример в данные обучения
-        training_example = {
+    def build_training_example(self, user_input: str, model_output: List[Dict], feedback: str) -> Dict[str, Any]:
+        """Формирует пример обучения из обратной связи"""
+        return {
             "input": user_input,
             "expected": model_output,
             "feedback": feedback,
             "timestamp": datetime.now().isoformat()
         }
-        
+    
+    def add_training_example(self, training_example: Dict[str, Any]):
+        """Добавляет пример в данные обучения в памяти и обновляет зависящие от них структуры"""
         self.training_data.append(training_example)
+        self.rules.add_example(training_example)
+        if self.semantic_search is not None:
+            self.semantic_search.add(training_example.get('input'))
+        self.online_learner.learn(training_example)
+    
+    def start_online_learning(self, checkpoint_interval: float = 300.0):
+        """Периодическая публикация дообученных моделей и их сохранение на диск"""
+        self.online_learner.start_checkpointer(checkpoint_interval)
+    
+    def start_hot_reload(self, interval_seconds: float = 2.0):
+        """Подхватывает примеры, принятые другими воркерами, без перезапуска"""
+        self.training_store.start_watcher(self._apply_new_examples, self._reload_training_data, interval_seconds)
+    
+    def _apply_new_examples(self, examples: List[Dict[str, Any]]):
+        """Применяет только новые примеры (дельту журнала)"""
+        for example in examples:
+            self.add_training_example(example)
+        print(f"🔄 Подхвачено новых примеров обучения: {len(examples)}")
+    
+    def _reload_training_data(self, examples: List[Dict[str, Any]]):
+        """Полная перезагрузка, когда корпус был заменен целиком"""
+        self.training_data = examples
+        self.rules.reindex(examples)
+        if self.semantic_search is not None:
+            self.semantic_search = SemanticSearch.open(examples, EMBEDDING_INDEX_PATH)
+        print(f"🔄 Данные обучения перезагружены: {len(examples)} примеров")
+    
+    def improve_from_feedback(self, user_input: str, model_output: List[Dict], feedback: str) -> List[Dict]:
+        """Улучшает модель на основе обратной связи"""
+        print(f"🎓 Обучение на основе обратной связи: {feedback[:50]}...")
+        
+        # Добавляем пример в данные обучения
+        training_example = self.build_training_example(user_input, model_output, feedback)
+        self.add_training_example(training_example)
         
-        # Сохраняем данные обучения
+        # Дописываем пример в журнал обучения (без перезаписи всего файла)
         try:
-            with open('voicaj_training_data.json', 'w', encoding='utf-8') as f:
-                json.dump(self.training_data, f, ensure_ascii=False, indent=2)
+            self.training_store.append(training_example)
             print("✅ Данные обучения обновлены")
         except Exception as e:
             print(f"❌ Ошибка сохранения: {e}")
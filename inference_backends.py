@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+import torch
+from torch import nn
+
+try:
+    import onnxruntime
+except ImportError:  # ONNX Runtime необязателен, без него доступны eager и traced
+    onnxruntime = None
+
+# Чем выполнять генеративную модель: 'eager' - PyTorch как есть, 'traced' - граф TorchScript,
+# 'onnx' - сессия ONNX Runtime. Графы собираются заранее (voicaj_trainer.py export-lm);
+# если графа нет или он собран для других весов, используется eager
+LLM_BACKEND = 'eager'
+BACKENDS = ('eager', 'traced', 'onnx')
+LLM_EXPORT_PATHS = {'traced': 'voicaj_llm.traced.pt', 'onnx': 'voicaj_llm.onnx'}
+
+# Длина входа при трассировке; ось последовательности в графе динамическая
+EXPORT_EXAMPLE_LENGTH = 16
+ONNX_OPSET = 17
+
+# При выборке токена - как в transformers по умолчанию
+SAMPLING_TOP_K = 50
+
+
+def apply_repetition_penalty(logits: np.ndarray, ids: Sequence[int], penalty: float) -> np.ndarray:
+    """Штраф за повтор как в transformers: логиты уже встречавшихся токенов уменьшаются по модулю"""
+    if penalty == 1.0 or not ids:
+        return logits
+    seen = np.unique(np.asarray(ids, dtype=np.int64))
+    scores = logits[seen]
+    logits[seen] = np.where(scores < 0, scores * penalty, scores / penalty)
+    return logits
+
+
+def next_token(logits: np.ndarray, ids: Sequence[int], repetition_penalty: float = 1.0,
+               do_sample: bool = False, temperature: float = 1.0,
+               rng: Optional[np.random.Generator] = None) -> int:
+    """Следующий токен по логитам последней позиции: жадно или выборкой из top-k"""
+    logits = apply_repetition_penalty(logits.astype(np.float64, copy=True), ids, repetition_penalty)
+    if not do_sample:
+        return int(np.argmax(logits))
+    logits = logits / max(temperature, 1e-5)
+    top = np.argpartition(-logits, SAMPLING_TOP_K)[:SAMPLING_TOP_K] if len(logits) > SAMPLING_TOP_K \
+        else np.arange(len(logits))
+    probabilities = np.exp(logits[top] - logits[top].max())
+    rng = rng or np.random.default_rng()
+    return int(top[rng.choice(len(top), p=probabilities / probabilities.sum())])
+
+
+class InferenceBackend:
+    """Способ выполнения генеративной модели: логиты последней позиции и генерация по ним.
+
+    Базовая генерация - цикл по токенам без кэша ключей и значений (граф принимает только
+    input_ids); eager переопределяет ее через model.generate с кэшем.
+    """
+
+    name = ''
+
+    def last_logits(self, input_ids: Sequence[int]) -> np.ndarray:
+        """Логиты следующего токена (размер словаря)"""
+        raise NotImplementedError
+
+    def generate(self, input_ids: Sequence[int], max_new_tokens: int, repetition_penalty: float = 1.0,
+                 do_sample: bool = False, temperature: float = 1.0,
+                 eos_token_id: Optional[int] = None) -> List[int]:
+        """Новые токены после input_ids (без промпта), до eos или max_new_tokens"""
+        ids = list(input_ids)
+        generated = []
+        for _ in range(max_new_tokens):
+            token = next_token(self.last_logits(ids), ids, repetition_penalty, do_sample, temperature)
+            if token == eos_token_id:
+                break
+            ids.append(token)
+            generated.append(token)
+        return generated
+
+
+class _LastLogits(nn.Module):
+    """Обертка для экспорта: input_ids -> логиты последней позиции, без кэша.
+
+    Причинная маска строится здесь (4D, аддитивная) и передается модели готовой: сборка
+    маски в transformers идет через vmap, который не трассируется.
+    """
+
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: torch.Tensor) -> torch.Tensor:
+        length = input_ids.shape[1]
+        allowed = torch.ones(length, length, dtype=torch.bool).tril()
+        mask = torch.zeros(length, length).masked_fill(~allowed, torch.finfo(torch.float32).min)
+        return self.model(input_ids=input_ids, attention_mask=mask[None, None], use_cache=False,
+                          return_dict=False)[0][:, -1, :]
+
+
+class EagerBackend(InferenceBackend):
+    """PyTorch как есть (прежнее поведение): model.generate с кэшем ключей и значений"""
+
+    name = 'eager'
+
+    def __init__(self, model: nn.Module):
+        self.model = model.eval()
+
+    def last_logits(self, input_ids: Sequence[int]) -> np.ndarray:
+        with torch.inference_mode():
+            logits = self.model(input_ids=torch.tensor([list(input_ids)]), use_cache=False).logits
+        return logits[0, -1].float().numpy()
+
+    def generate(self, input_ids: Sequence[int], max_new_tokens: int, repetition_penalty: float = 1.0,
+                 do_sample: bool = False, temperature: float = 1.0,
+                 eos_token_id: Optional[int] = None) -> List[int]:
+        inputs = torch.tensor([list(input_ids)])
+        params = {'temperature': temperature, 'top_k': SAMPLING_TOP_K} if do_sample else {}
+        with torch.inference_mode():
+            output = self.model.generate(inputs, attention_mask=torch.ones_like(inputs),
+                                         max_new_tokens=max_new_tokens, repetition_penalty=repetition_penalty,
+                                         do_sample=do_sample, eos_token_id=eos_token_id,
+                                         pad_token_id=eos_token_id, **params)
+        generated = output[0, inputs.shape[1]:].tolist()
+        return generated[:generated.index(eos_token_id)] if eos_token_id in generated else generated
+
+
+class TracedBackend(InferenceBackend):
+    """Граф TorchScript, снятый torch.jit.trace (без Python-кода модели при выполнении)"""
+
+    name = 'traced'
+
+    def __init__(self, path: str):
+        self.module = torch.jit.load(path, map_location='cpu').eval()
+
+    def last_logits(self, input_ids: Sequence[int]) -> np.ndarray:
+        with torch.inference_mode():
+            return self.module(torch.tensor([list(input_ids)])).float()[0].numpy()
+
+
+class OnnxBackend(InferenceBackend):
+    """Сессия ONNX Runtime на CPU"""
+
+    name = 'onnx'
+
+    def __init__(self, path: str, threads: int = 0):
+        if onnxruntime is None:
+            raise ValueError("Для бэкенда onnx нужен пакет onnxruntime")
+        options = onnxruntime.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def last_logits(self, input_ids: Sequence[int]) -> np.ndarray:
+        return self.session.run(None, {'input_ids': np.asarray([input_ids], dtype=np.int64)})[0][0]
+
+
+def _meta_path(path: str) -> str:
+    return path + '.json'
+
+
+def export_backend(model: nn.Module, kind: str, model_id: str, path: Optional[str] = None,
+                   example_length: int = EXPORT_EXAMPLE_LENGTH) -> str:
+    """Снимает граф модели (с навешенными адаптерами) для бэкенда kind и записывает рядом
+    метаданные с идентификатором весов; файл заменяется атомарно"""
+    if kind not in LLM_EXPORT_PATHS:
+        raise ValueError(f"Экспорт доступен для {', '.join(LLM_EXPORT_PATHS)}, а не для {kind}")
+    path = path or LLM_EXPORT_PATHS[kind]
+    wrapper = _LastLogits(model.eval())
+    example = torch.randint(0, model.config.vocab_size, (1, example_length))
+    tmp_path = path + '.tmp'
+    with torch.no_grad():
+        if kind == 'traced':
+            traced = torch.jit.trace(wrapper, example, check_trace=False)
+            torch.jit.save(torch.jit.freeze(traced.eval()), tmp_path)
+    if kind == 'onnx':
+        try:
+            import onnx  # noqa: F401 - нужен экспортеру torch.onnx
+        except ImportError as e:
+            raise ValueError("Для экспорта в ONNX нужен пакет onnx") from e
+        torch.onnx.export(wrapper, (example,), tmp_path, input_names=['input_ids'], output_names=['logits'],
+                          dynamic_axes={'input_ids': {1: 'sequence'}}, opset_version=ONNX_OPSET, dynamo=False)
+    os.replace(tmp_path, path)
+    meta = {'model_id': model_id, 'kind': kind, 'created': datetime.now().isoformat()}
+    with open(_meta_path(path), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def open_backend(kind: str, model_id: str, path: Optional[str] = None, threads: int = 0) -> InferenceBackend:
+    """Готовый граф для бэкенда traced или onnx; ValueError, если его нет или он собран для других весов"""
+    if kind not in LLM_EXPORT_PATHS:
+        raise ValueError(f"Неизвестный бэкенд с графом: {kind}")
+    path = path or LLM_EXPORT_PATHS[kind]
+    try:
+        with open(_meta_path(path), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        raise ValueError(f"граф {path} не собран (voicaj_trainer.py export-lm --backend {kind})") from e
+    if meta.get('model_id') != model_id:
+        raise ValueError(f"граф {path} собран для {meta.get('model_id')}, а загружены веса {model_id}")
+    return TracedBackend(path) if kind == 'traced' else OnnxBackend(path, threads)
+
+
+def benchmark_backends(backends: Sequence[InferenceBackend], prompts: Sequence[List[int]], max_new_tokens: int = 32,
+                       repetition_penalty: float = 1.3, eos_token_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Задержка, пропускная способность и совпадение с первым бэкендом (эталоном) на одних промптах.
+
+    Декодирование жадное, поэтому совпадение ожидается токен в токен; logit_diff - наибольшее
+    расхождение логитов первого шага с эталоном.
+    """
+    rows = []
+    reference_outputs, reference_logits = None, None
+    for backend in backends:
+        backend.generate(prompts[0], 2, repetition_penalty, eos_token_id=eos_token_id)  # прогрев
+        latencies, outputs = [], []
+        for prompt in prompts:
+            start = time.perf_counter()
+            outputs.append(backend.generate(prompt, max_new_tokens, repetition_penalty, eos_token_id=eos_token_id))
+            latencies.append(time.perf_counter() - start)
+        logits = [backend.last_logits(prompt) for prompt in prompts]
+        if reference_outputs is None:
+            reference_outputs, reference_logits = outputs, logits
+        tokens = sum(len(output) for output in outputs)
+        rows.append({
+            'backend': backend.name,
+            'mean_ms': float(np.mean(latencies)) * 1000,
+            'p95_ms': float(np.percentile(latencies, 95)) * 1000,
+            'tokens_per_second': tokens / max(sum(latencies), 1e-9),
+            'parity': float(np.mean([output == expected for output, expected in zip(outputs, reference_outputs)])),
+            'logit_diff': float(max(np.abs(value - expected).max() for value, expected in zip(logits, reference_logits)))
+        })
+    return rows
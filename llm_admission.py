@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+# Сколько генераций LLM идет одновременно (модель на CPU, параллельные прогоны только мешают друг другу)
+LLM_MAX_CONCURRENCY = 1
+
+# Предел очереди к LLM и ожидаемого ожидания в ней: дальше запрос не ставится в очередь,
+# поэтому потоки сервера не заканчиваются на ожидании модели и быстрые запросы обслуживаются сразу
+LLM_MAX_QUEUE = 4
+LLM_MAX_WAIT_SECONDS = 15.0
+
+# Что делать с запросом сверх пределов: 'degrade' - ответ быстрого контура без LLM,
+# 'reject' - ответ 429 с Retry-After
+LLM_OVERLOAD_POLICY = 'degrade'
+
+# Начальная оценка длительности генерации и вес нового замера в скользящем среднем
+LLM_SERVICE_ESTIMATE = 5.0
+SERVICE_EWMA_WEIGHT = 0.2
+
+
+class LLMOverloaded(Exception):
+    """Очередь к LLM переполнена; retry_after - через сколько секунд имеет смысл повторить"""
+
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(f"LLM перегружена ({reason}), повторите через {retry_after} с")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """Допуск к LLM: не больше max_concurrency генераций и ограниченная очередь.
+
+    Запрос, которому пришлось бы ждать дольше max_wait секунд (по скользящему среднему
+    длительности генерации) или встать в полную очередь, сразу получает LLMOverloaded,
+    а не занимает поток сервера. Запросы, которым LLM не нужна, сюда не попадают и
+    поэтому не ждут за сложными.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE,
+                 max_wait: float = LLM_MAX_WAIT_SECONDS, policy: str = LLM_OVERLOAD_POLICY):
+        if policy not in ('degrade', 'reject'):
+            raise ValueError(f"Неизвестная политика перегрузки: {policy}")
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.policy = policy
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.peak_queue = 0
+        self.total_wait = 0.0
+        self.service_time = LLM_SERVICE_ESTIMATE
+        self._cond = threading.Condition()
+
+    def _estimated_wait_locked(self) -> float:
+        """Ожидание нового запроса: все, кто впереди, делят max_concurrency мест"""
+        if self.running < self.max_concurrency and not self.queued:
+            return 0.0
+        return (self.queued + 1) * self.service_time / self.max_concurrency
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Место для одной генерации; при перегрузке - LLMOverloaded без ожидания"""
+        with self._cond:
+            wait = self._estimated_wait_locked()
+            if self.queued >= self.max_queue or wait > self.max_wait:
+                self.rejected += 1
+                reason = 'очередь заполнена' if self.queued >= self.max_queue else f'ожидание ~{wait:.0f} с'
+                raise LLMOverloaded(max(1, math.ceil(wait)), reason)
+            self.queued += 1
+            self.peak_queue = max(self.peak_queue, self.queued)
+            enqueued = time.monotonic()
+            while self.running >= self.max_concurrency:
+                self._cond.wait()
+            self.queued -= 1
+            self.running += 1
+            self.admitted += 1
+            self.total_wait += time.monotonic() - enqueued
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self._cond:
+                self.running -= 1
+                self.service_time += SERVICE_EWMA_WEIGHT * (elapsed - self.service_time)
+                self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики очереди для /api/metrics"""
+        with self._cond:
+            return {
+                'running': self.running,
+                'queued': self.queued,
+                'peak_queue': self.peak_queue,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'avg_wait_ms': round(self.total_wait * 1000 / max(self.admitted, 1), 1),
+                'service_ms': round(self.service_time * 1000, 1),
+                'estimated_wait_ms': round(self._estimated_wait_locked() * 1000, 1),
+                'limits': {'concurrency': self.max_concurrency, 'queue': self.max_queue,
+                           'wait_seconds': self.max_wait, 'policy': self.policy}
+            }
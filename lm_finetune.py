@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import math
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from torch import nn
+
+from distillation import analysis_prompt
+
+LM_MODEL_NAME = "microsoft/DialoGPT-small"
+LM_ADAPTER_PATH = "voicaj_lm_adapter.pt"
+LM_CHECKPOINT_DIR = "voicaj_lm_checkpoints"
+
+# Имя маленькой локальной модели (build_tiny_model + ByteTokenizer) в конфигурациях адаптеров и индексов
+TINY_MODEL_ID = "tiny-gpt2"
+
+# Проекции внимания и MLP у GPT-2 (DialoGPT): адаптеры навешиваются на модули с такими именами
+LORA_TARGETS = ('c_attn', 'c_proj', 'c_fc')
+
+# Метка токена, который не участвует в потере (промпт и паддинг)
+IGNORE_INDEX = -100
+
+
+class LoRALinear(nn.Module):
+    """Низкоранговый адаптер поверх замороженного линейного слоя: y = base(x) + (x A^T B^T) * alpha / r
+
+    Поддерживает nn.Linear (веса out x in) и Conv1D из transformers, которым собран GPT-2 (веса in x out).
+    B инициализируется нулями, так что до обучения модель с адаптером совпадает с исходной.
+    """
+
+    def __init__(self, base: nn.Module, rank: int = 8, alpha: float = 16.0, dropout: float = 0.05):
+        super().__init__()
+        self.base = base
+        if isinstance(base, nn.Linear):
+            out_features, in_features = base.weight.shape
+        else:
+            in_features, out_features = base.weight.shape
+        self.lora_a = nn.Parameter(torch.empty(rank, in_features))
+        self.lora_b = nn.Parameter(torch.zeros(out_features, rank))
+        nn.init.kaiming_uniform_(self.lora_a, a=math.sqrt(5))
+        self.scaling = alpha / rank
+        self.dropout = nn.Dropout(dropout)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.base(x) + (self.dropout(x) @ self.lora_a.t() @ self.lora_b.t()) * self.scaling
+
+
+def apply_lora(model: nn.Module, rank: int = 8, alpha: float = 16.0, dropout: float = 0.05,
+               targets: Sequence[str] = LORA_TARGETS) -> List[str]:
+    """Замораживает модель и заменяет целевые линейные слои адаптерами; возвращает имена замененных модулей"""
+    for parameter in model.parameters():
+        parameter.requires_grad = False
+
+    replaced = []
+    for name, module in list(model.named_modules()):
+        for child_name, child in list(module.named_children()):
+            if child_name in targets and hasattr(child, 'weight') and child.weight.dim() == 2:
+                setattr(module, child_name, LoRALinear(child, rank, alpha, dropout))
+                replaced.append(f"{name}.{child_name}" if name else child_name)
+    return replaced
+
+
+def adapter_state_dict(model: nn.Module) -> Dict[str, torch.Tensor]:
+    """Только обучаемые веса адаптеров (база не сохраняется)"""
+    return {key: value.detach().clone() for key, value in model.state_dict().items() if '.lora_' in key}
+
+
+def _atomic_save(payload: Dict[str, Any], path: str):
+    tmp_path = path + '.tmp'
+    torch.save(payload, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def save_adapter(model: nn.Module, path: str, config: Dict[str, Any]):
+    """Атомарно сохраняет адаптеры вместе с их конфигурацией (база, ранг, alpha, цели)"""
+    _atomic_save({'config': config, 'state': adapter_state_dict(model)}, path)
+
+
+def load_adapter(model: nn.Module, path: str = LM_ADAPTER_PATH,
+                 base_model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Навешивает сохраненные адаптеры на модель; None, если файла нет или он обучен для другой базы"""
+    try:
+        payload = torch.load(path, map_location='cpu')
+    except (FileNotFoundError, OSError, RuntimeError):
+        return None
+    config = payload['config']
+    if base_model is not None and config.get('base_model') != base_model:
+        return None
+    apply_lora(model, config['rank'], config['alpha'], 0.0, config['targets'])
+    model.load_state_dict(payload['state'], strict=False)
+    model.eval()
+    return config
+
+
+class ByteTokenizer:
+    """Токенизатор по байтам UTF-8 для маленькой локальной модели (без загрузки словаря из сети)"""
+
+    vocab_size = 257
+    eos_token_id = 256
+
+    def encode(self, text: str) -> List[int]:
+        return list(text.encode('utf-8'))
+
+
+def build_tiny_model(vocab_size: int = ByteTokenizer.vocab_size, n_positions: int = 512,
+                     n_embd: int = 64, n_layer: int = 2, n_head: int = 2) -> nn.Module:
+    """Маленькая GPT-2 со случайными весами: та же архитектура, что у DialoGPT, для проверки обучения офлайн"""
+    from transformers import GPT2Config, GPT2LMHeadModel
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=vocab_size, n_positions=n_positions, n_embd=n_embd,
+                        n_layer=n_layer, n_head=n_head, bos_token_id=vocab_size - 1, eos_token_id=vocab_size - 1)
+    return GPT2LMHeadModel(config)
+
+
+def load_causal_lm(model_name: str = LM_MODEL_NAME):
+    """Модель и токенизатор по имени; TINY_MODEL_ID собирается локально без сети"""
+    if model_name == TINY_MODEL_ID:
+        return build_tiny_model(), ByteTokenizer()
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+    return AutoModelForCausalLM.from_pretrained(model_name), AutoTokenizer.from_pretrained(model_name)
+
+
+def format_example(example: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """Пример обучения в формате llm_analysis: (промпт с объектами-заглушками под типы примера,
+    продолжение с настоящими объектами). Даты заглушек - от даты примера."""
+    text, expected = example.get('input'), example.get('expected')
+    if not text or not isinstance(expected, list) or not expected:
+        return None
+    types = [obj.get('type') for obj in expected if isinstance(obj, dict)]
+    try:
+        today = datetime.fromisoformat(example['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        today = datetime.now()
+    prompt = analysis_prompt(text, types, today)
+    completion = "".join("\n\n" + json.dumps(obj, ensure_ascii=False, indent=4) for obj in expected)
+    return prompt, completion
+
+
+class StreamingExamples:
+    """Поток токенизированных примеров по корпусу обучения, эпоха за эпохой.
+
+    Примеры токенизируются по одному при чтении (корпус из mmap не разворачивается целиком);
+    порядок эпохи - перестановка от seed + номера эпохи, поэтому позицию (эпоха, индекс)
+    можно сохранить в чекпоинте и продолжить поток с того же места.
+    """
+
+    def __init__(self, examples: Sequence[Dict[str, Any]], tokenizer, max_length: int = 512,
+                 seed: int = 0, epoch: int = 0, position: int = 0):
+        self.examples = examples
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.seed = seed
+        self.epoch = epoch
+        self.position = position
+
+    def state(self) -> Dict[str, int]:
+        return {'epoch': self.epoch, 'position': self.position}
+
+    def _encode(self, example: Dict[str, Any]) -> Optional[Tuple[List[int], List[int]]]:
+        pair = format_example(example)
+        if pair is None:
+            return None
+        prompt_ids = self.tokenizer.encode(pair[0])
+        completion_ids = self.tokenizer.encode(pair[1]) + [self.tokenizer.eos_token_id]
+        input_ids = (prompt_ids + completion_ids)[:self.max_length]
+        # Потеря считается только по ответу ассистента
+        labels = ([IGNORE_INDEX] * len(prompt_ids) + completion_ids)[:self.max_length]
+        if all(label == IGNORE_INDEX for label in labels):
+            return None
+        return input_ids, labels
+
+    def __iter__(self):
+        if not len(self.examples):
+            return
+        while True:
+            order = np.random.default_rng(self.seed + self.epoch).permutation(len(self.examples))
+            while self.position < len(order):
+                index = int(order[self.position])
+                self.position += 1
+                encoded = self._encode(self.examples[index])
+                if encoded is not None:
+                    yield encoded
+            self.epoch += 1
+            self.position = 0
+
+
+def collate(batch: Sequence[Tuple[List[int], List[int]]], pad_token_id: int) -> Dict[str, torch.Tensor]:
+    """Дополняет микропачку до самого длинного примера"""
+    length = max(len(input_ids) for input_ids, _ in batch)
+    input_ids = torch.full((len(batch), length), pad_token_id, dtype=torch.long)
+    labels = torch.full((len(batch), length), IGNORE_INDEX, dtype=torch.long)
+    attention_mask = torch.zeros((len(batch), length), dtype=torch.long)
+    for row, (ids, row_labels) in enumerate(batch):
+        input_ids[row, :len(ids)] = torch.tensor(ids)
+        labels[row, :len(row_labels)] = torch.tensor(row_labels)
+        attention_mask[row, :len(ids)] = 1
+    return {'input_ids': input_ids, 'labels': labels, 'attention_mask': attention_mask}
+
+
+def configure_threads(threads: int = 0, interop_threads: int = 0) -> Tuple[int, int]:
+    """Потоки внутри операций (матричные произведения) и между операциями; 0 - значение torch по умолчанию"""
+    if threads > 0:
+        torch.set_num_threads(threads)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Пул между операциями задается один раз до первой параллельной работы в процессе
+            print(f"⚠️ Потоки между операциями уже заданы: {torch.get_num_interop_threads()}")
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+def finetune(model: nn.Module, tokenizer, examples: Sequence[Dict[str, Any]], adapter_path: str = LM_ADAPTER_PATH,
+             checkpoint_dir: str = LM_CHECKPOINT_DIR, base_model: str = LM_MODEL_NAME, steps: int = 200,
+             micro_batch: int = 4, grad_accum: int = 4, learning_rate: float = 2e-4, rank: int = 8,
+             alpha: float = 16.0, max_length: int = 512, checkpoint_every: int = 50, log_every: int = 10,
+             bf16: bool = False, seed: int = 0, resume: bool = True) -> Dict[str, Any]:
+    """Дообучение адаптеров LoRA на CPU с накоплением градиента и возобновляемыми чекпоинтами.
+
+    Шаг оптимизатора = grad_accum микропачек по micro_batch примеров. Чекпоинт (адаптеры,
+    состояние AdamW, шаг, позиция потока, состояние ГСЧ) пишется атомарно раз в checkpoint_every
+    шагов; при resume обучение продолжается с него. Итоговые адаптеры сохраняются в adapter_path.
+    """
+    config = {'base_model': base_model, 'rank': rank, 'alpha': alpha, 'targets': list(LORA_TARGETS)}
+    replaced = apply_lora(model, rank, alpha, targets=LORA_TARGETS)
+    parameters = [parameter for parameter in model.parameters() if parameter.requires_grad]
+    trainable = sum(parameter.numel() for parameter in parameters)
+    total = sum(parameter.numel() for parameter in model.parameters())
+    print(f"🧩 Адаптеры LoRA: {len(replaced)} слоев, обучается {trainable:,} из {total:,} параметров "
+          f"({trainable / total:.2%})")
+
+    optimizer = torch.optim.AdamW(parameters, lr=learning_rate, weight_decay=0.0)
+    stream = StreamingExamples(examples, tokenizer, max_length, seed)
+    step = 0
+    torch.manual_seed(seed)
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    checkpoint_path = os.path.join(checkpoint_dir, 'checkpoint.pt')
+    if resume and os.path.exists(checkpoint_path):
+        checkpoint = torch.load(checkpoint_path, map_location='cpu', weights_only=False)
+        if checkpoint['config'] == config:
+            model.load_state_dict(checkpoint['state'], strict=False)
+            optimizer.load_state_dict(checkpoint['optimizer'])
+            step = checkpoint['step']
+            stream = StreamingExamples(examples, tokenizer, max_length, seed, **checkpoint['stream'])
+            torch.set_rng_state(checkpoint['rng'])
+            print(f"⏯️ Продолжаем с шага {step} (эпоха {stream.epoch}, позиция {stream.position})")
+        else:
+            print("⚠️ Чекпоинт от другой конфигурации адаптеров, обучение начинается заново")
+
+    def save_checkpoint():
+        _atomic_save({'config': config, 'state': adapter_state_dict(model), 'optimizer': optimizer.state_dict(),
+                      'step': step, 'stream': stream.state(), 'rng': torch.get_rng_state()}, checkpoint_path)
+
+    pad_token_id = tokenizer.eos_token_id
+    batches = iter(stream)
+    start_step = step
+    seen_examples = seen_tokens = 0
+    losses = []
+    model.train()
+    started = time.perf_counter()
+
+    while step < steps:
+        optimizer.zero_grad(set_to_none=True)
+        step_loss = 0.0
+        for _ in range(grad_accum):
+            micro = [encoded for _, encoded in zip(range(micro_batch), batches)]
+            if not micro:
+                break
+            inputs = collate(micro, pad_token_id)
+            with torch.autocast('cpu', dtype=torch.bfloat16, enabled=bf16):
+                loss = model(**inputs).loss / grad_accum
+            loss.backward()
+            step_loss += loss.item()
+            seen_examples += len(micro)
+            seen_tokens += int(inputs['attention_mask'].sum())
+        if not seen_examples:
+            print("❌ В данных обучения нет примеров с ожидаемым ответом")
+            break
+
+        torch.nn.utils.clip_grad_norm_(parameters, 1.0)
+        optimizer.step()
+        step += 1
+        losses.append(step_loss)
+
+        if step % log_every == 0 or step == steps:
+            elapsed = time.perf_counter() - started
+            print(f"🏋️ Шаг {step}/{steps}: потеря {np.mean(losses[-log_every:]):.4f}, "
+                  f"{seen_examples / elapsed:.1f} примеров/с, {seen_tokens / elapsed:.0f} токенов/с")
+        if step % checkpoint_every == 0:
+            save_checkpoint()
+
+    elapsed = time.perf_counter() - started
+    save_checkpoint()
+    save_adapter(model, adapter_path, config)
+    model.eval()
+    return {
+        'steps': step - start_step,
+        'total_steps': step,
+        'examples': seen_examples,
+        'seconds': elapsed,
+        'examples_per_second': seen_examples / elapsed if elapsed else 0.0,
+        'tokens_per_second': seen_tokens / elapsed if elapsed else 0.0,
+        'first_loss': losses[0] if losses else None,
+        'last_loss': losses[-1] if losses else None,
+        'trainable_parameters': trainable
+    }
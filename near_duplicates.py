@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import zlib
+from typing import List, Dict, Any, Sequence, Tuple
+
+import numpy as np
+
+from training_corpus import tokenize
+from type_classifier import example_types
+
+# Сигнатура 64 хеша = 16 полос по 4: пара с Жаккаром 0.7 становится кандидатом с вероятностью ~0.98
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+
+# Минимальная оценка сходства Жаккара шинглов, с которой запросы считаются почти одинаковыми
+NEAR_DUP_THRESHOLD = 0.7
+
+# Множитель для хеша пары слов из хешей самих слов
+_PAIR_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def shingle_hashes(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Хеши шинглов всех текстов в формате CSR (значения, indptr): слова и пары соседних слов.
+
+    Слова хешируются один раз на корпус, хеш пары считается векторно из хешей слов.
+    Одиночные слова нужны коротким запросам, у которых пар слишком мало.
+    """
+    all_tokens, lengths = [], []
+    for text in texts:
+        tokens = tokenize(text or '')
+        all_tokens.extend(tokens)
+        lengths.append(len(tokens))
+
+    vocabulary = {token: index for index, token in enumerate(dict.fromkeys(all_tokens))}
+    token_hashes = np.array([zlib.crc32(token.encode('utf-8')) for token in vocabulary], dtype=np.uint64)
+    words = token_hashes[np.fromiter(map(vocabulary.__getitem__, all_tokens), dtype=np.int64, count=len(all_tokens))]
+    lengths = np.array(lengths, dtype=np.int64)
+    token_ptr = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=token_ptr[1:])
+
+    # Пара (i, i + 1) допустима, если оба слова из одного текста
+    same_text = np.ones(max(len(words) - 1, 0), dtype=bool)
+    same_text[token_ptr[1:-1][(token_ptr[1:-1] > 0) & (token_ptr[1:-1] < len(words))] - 1] = False
+    pairs = (words[:-1] * _PAIR_MULTIPLIER + words[1:])[same_text] if len(words) else words
+    pair_rows = np.repeat(np.arange(len(texts)), np.maximum(lengths - 1, 0))
+
+    rows = np.concatenate((np.repeat(np.arange(len(texts)), lengths), pair_rows))
+    values = np.concatenate((words, pairs))
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(lengths + np.maximum(lengths - 1, 0), out=indptr[1:])
+    return values[order], indptr
+
+
+class MinHasher:
+    """MinHash-сигнатуры для пачки текстов, посчитанные векторно по всем шинглам сразу"""
+
+    def __init__(self, num_permutations: int = MINHASH_PERMUTATIONS, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_permutations = num_permutations
+        # Хеширование умножением со сдвигом: (a * x + b) mod 2^64, старшие 32 бита; a нечетное
+        self.a = rng.integers(0, np.iinfo(np.uint64).max, num_permutations, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, np.iinfo(np.uint64).max, num_permutations, dtype=np.uint64)
+
+    def signatures(self, texts: Sequence[str], chunk_shingles: int = 1 << 16) -> Tuple[np.ndarray, np.ndarray]:
+        """Матрица сигнатур (n_texts x num_permutations) и маска текстов, у которых есть шинглы"""
+        values, indptr = shingle_hashes(texts)
+        lengths = np.diff(indptr)
+        result = np.full((len(texts), self.num_permutations), np.iinfo(np.uint32).max, dtype=np.uint32)
+        present = lengths > 0
+        rows = np.flatnonzero(present)
+
+        # Блоки целых строк, чтобы матрица хешей (шинглы x перестановки) не росла с корпусом
+        starts = indptr[rows]
+        bounds = np.searchsorted(starts, np.arange(0, len(values), chunk_shingles))
+        bounds = np.unique(np.r_[bounds, len(rows)])
+        shift = np.uint64(32)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            low, high = starts[start], indptr[rows[stop - 1] + 1]
+            # Перестановки по строкам, шинглы по столбцам: reduceat идет по непрерывной памяти
+            permuted = ((self.a[:, None] * values[None, low:high] + self.b[:, None]) >> shift).astype(np.uint32)
+            result[rows[start:stop]] = np.minimum.reduceat(permuted, starts[start:stop] - low, axis=1).T
+        return result, present
+
+
+def _connected_components(n: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Метки компонент связности (минимальный номер вершины) по списку ребер, без цикла по ребрам"""
+    labels = np.arange(n)
+    while True:
+        previous = labels.copy()
+        smallest = np.minimum(labels[left], labels[right])
+        np.minimum.at(labels, left, smallest)
+        np.minimum.at(labels, right, smallest)
+        # Перескок по указателям: метка метки, пока не перестанет меняться
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+        if np.array_equal(labels, previous):
+            return labels
+
+
+def near_duplicate_clusters(texts: Sequence[str], threshold: float = NEAR_DUP_THRESHOLD,
+                            num_permutations: int = MINHASH_PERMUTATIONS, bands: int = LSH_BANDS) -> List[List[int]]:
+    """Кластеры почти одинаковых запросов (только из двух и более примеров), индексы по возрастанию.
+
+    LSH по полосам сигнатуры дает кандидатов за O(n) на полосу: в каждой корзине члены
+    сверяются с первым элементом корзины по оценке Жаккара, прошедшие пары - ребра графа,
+    кластеры - его компоненты связности.
+    """
+    if not texts:
+        return []
+    signatures, present = MinHasher(num_permutations).signatures(texts)
+    rows_per_band = num_permutations // bands
+    candidates = np.flatnonzero(present)
+    left, right = [], []
+
+    for band in range(bands):
+        block = np.ascontiguousarray(signatures[candidates, band * rows_per_band:(band + 1) * rows_per_band])
+        keys = block.view(np.dtype((np.void, block.dtype.itemsize * rows_per_band))).ravel()
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+        # Первый элемент корзины для каждой позиции отсортированного списка
+        first = order[np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))]
+        members = order[~starts]
+        heads = first[~starts]
+        if not len(members):
+            continue
+        similarity = (signatures[candidates[members]] == signatures[candidates[heads]]).mean(axis=1)
+        matched = similarity >= threshold
+        left.append(candidates[heads[matched]])
+        right.append(candidates[members[matched]])
+
+    if not left or not sum(len(edges) for edges in left):
+        return []
+    labels = _connected_components(len(texts), np.concatenate(left), np.concatenate(right))
+    order = np.argsort(labels, kind='stable')
+    sorted_labels = labels[order]
+    bounds = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1], True])
+    return [order[low:high].tolist() for low, high in zip(bounds[:-1], bounds[1:]) if high - low > 1]
+
+
+def dedupe_near_duplicates(examples: Sequence[Dict[str, Any]], threshold: float = NEAR_DUP_THRESHOLD
+                           ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Сжатый корпус и отчет по кластерам.
+
+    Из кластера без противоречий остается последний пример (поздняя обратная связь - самая
+    точная). Кластер, члены которого размечены разными наборами типов, сохраняется целиком:
+    какой вариант верный, решает человек по отчету.
+    """
+    clusters = near_duplicate_clusters([example.get('input') or '' for example in examples], threshold)
+    dropped = set()
+    report = []
+    for cluster in clusters:
+        labels = {}
+        for index in cluster:
+            labels.setdefault(tuple(sorted(example_types(examples[index]))), []).append(index)
+        conflict = len(labels) > 1
+        keep = cluster if conflict else [cluster[-1]]
+        dropped.update(index for index in cluster if index not in keep)
+        report.append({
+            'size': len(cluster),
+            'kept': len(keep),
+            'conflict': conflict,
+            'inputs': [examples[index].get('input') for index in cluster],
+            'labels': {', '.join(types) or '-': len(indices) for types, indices in labels.items()}
+        })
+    compacted = [example for index, example in enumerate(examples) if index not in dropped]
+    return compacted, report
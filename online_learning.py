@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Sequence, Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from type_classifier import (
+    TypeClassifier, TYPE_MODEL_PATH, PRIORITY_MODEL_PATH, REFERENCE_FRACTION, example_types, example_priority,
+    training_pairs, reference_split
+)
+from tag_predictor import TagPredictor, TAG_MODEL_PATH, example_tags, tag_pairs
+
+# Модели на диск пишет один процесс - тот, кто держит эту блокировку; остальные воркеры
+# получают те же примеры через журнал обучения и только перечитывают его чекпоинты
+MODEL_WRITER_LOCK_PATH = "voicaj_models.writer.lock"
+
+
+def _accuracy(model, texts: Sequence[str], labels: Sequence[List[str]]) -> float:
+    """Доля примеров, у которых лучший класс модели входит в эталонные метки"""
+    predicted = model.predict(texts, max_types=1)
+    return sum(types[0] in expected for types, expected in zip(predicted, labels)) / len(texts)
+
+
+def _tag_f1(model, texts: Sequence[str], labels: Sequence[List[str]]) -> float:
+    """Микро-F1 тегов"""
+    predicted = model.predict(texts)
+    hits = sum(len(set(tags) & set(expected)) for tags, expected in zip(predicted, labels))
+    precision = hits / max(sum(len(tags) for tags in predicted), 1)
+    recall = hits / max(sum(len(expected) for expected in labels), 1)
+    return 2 * precision * recall / max(precision + recall, 1e-9)
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def _try_writer_lock(path: str):
+    """Неблокирующая эксклюзивная блокировка файла; открытый файл держит ее до конца процесса"""
+    try:
+        lock_file = open(path, 'a+b')
+    except OSError:
+        return None
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+class _ModelSlot:
+    """Описание одной быстрой модели: где она обслуживает запросы, куда сохраняется и как оценивается"""
+
+    def __init__(self, name: str, attribute: str, path: str, loader: Callable, label_fn: Callable,
+                 metric: Callable, pairs_fn: Callable, learning_rate: float):
+        self.name = name
+        self.attribute = attribute
+        self.path = path
+        self.loader = loader
+        self.label_fn = label_fn
+        self.metric = metric
+        self.pairs_fn = pairs_fn
+        self.learning_rate = learning_rate
+        self.candidate = None
+        self.pending = 0
+        self.dirty = False
+        self.reference = ([], [])
+        self.best = 0.0
+        self.mtime = _mtime(path)
+
+    def score(self, model) -> Optional[float]:
+        """Качество модели на эталоне (None, если эталон пуст)"""
+        texts, labels = self.reference
+        return self.metric(model, texts, labels) if texts else None
+
+
+class OnlineLearner:
+    """Онлайн-дообучение моделей типа, тегов и приоритета на обратной связи.
+
+    SGD идет на копии (кандидате), а запросы обслуживает опубликованная версия. Раз в
+    promote_every примеров кандидат проверяется на эталоне (reference_split - на нем рабочие
+    модели не обучаются) и, если качество не ниже лучшего достигнутого больше чем на tolerance,
+    подменяет рабочую модель одним присваиванием атрибута (чтения в других потоках не
+    блокируются). Иначе кандидат отбрасывается. Сравнение с лучшим результатом, а не с текущей
+    моделью, не дает качеству сползать на tolerance при каждой публикации.
+
+    Чекпоинты пишет только процесс, захвативший writer_lock_path: остальные воркеры учатся на
+    тех же примерах и перечитывают его модели, а не перезаписывают их своими.
+    """
+
+    def __init__(self, llm, training_data: Sequence[Dict[str, Any]], promote_every: int = 20,
+                 tolerance: float = 0.02, reference: float = REFERENCE_FRACTION, max_history: int = 100,
+                 writer_lock_path: str = MODEL_WRITER_LOCK_PATH):
+        self.llm = llm
+        self.promote_every = promote_every
+        self.tolerance = tolerance
+        self.reference_fraction = reference
+        self.max_history = max_history
+        self.writer_lock_path = writer_lock_path
+        self.history: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._checkpointer = None
+        self._writer = None
+
+        self.slots = [
+            _ModelSlot('types', 'type_classifier', TYPE_MODEL_PATH, TypeClassifier.load, example_types, _accuracy,
+                       lambda data: training_pairs(data, example_types), learning_rate=0.2),
+            _ModelSlot('tags', 'tag_predictor', TAG_MODEL_PATH, TagPredictor.load, example_tags, _tag_f1,
+                       tag_pairs, learning_rate=0.3),
+            _ModelSlot('priority', 'priority_classifier', PRIORITY_MODEL_PATH, TypeClassifier.load,
+                       example_priority, _accuracy,
+                       lambda data: training_pairs(data, example_priority), learning_rate=0.2)
+        ]
+
+        # Эталон - часть корпуса, на которой не обучаются рабочие модели: кандидат не должен
+        # терять качество на примерах, которых ни он, ни опубликованная модель не видели
+        _, reference = reference_split(training_data, reference)
+        for slot in self.slots:
+            slot.reference = slot.pairs_fn(reference)
+            serving = getattr(llm, slot.attribute)
+            slot.best = slot.score(serving) or 0.0
+            slot.candidate = serving.copy()
+
+    def learn(self, example: Dict[str, Any]):
+        """Шаг SGD по примеру для всех моделей, у которых в примере есть метки"""
+        text = example.get('input')
+        if not text:
+            return
+        # Примеры из доли эталона не обучают ни офлайн-, ни онлайн-модели
+        if reference_split([example], self.reference_fraction)[1]:
+            return
+        with self._lock:
+            for slot in self.slots:
+                labels = slot.label_fn(example)
+                if not labels:
+                    continue
+                slot.candidate.partial_fit([text], [labels], slot.learning_rate)
+                slot.pending += 1
+                if slot.pending >= self.promote_every:
+                    self._evaluate(slot)
+
+    def _evaluate(self, slot: _ModelSlot) -> Dict[str, Any]:
+        """Проверка кандидата на эталоне и публикация либо откат (под self._lock)"""
+        serving = getattr(self.llm, slot.attribute)
+        best_score = slot.best
+        candidate_score = slot.score(slot.candidate)
+        if candidate_score is None:
+            candidate_score = best_score
+
+        promoted = candidate_score >= best_score - self.tolerance
+        if promoted:
+            # Атомарная подмена: запросы, уже взявшие старую модель, спокойно доработают с ней
+            setattr(self.llm, slot.attribute, slot.candidate)
+            slot.dirty = True
+            slot.best = max(best_score, candidate_score)
+            slot.candidate = slot.candidate.copy()
+            print(f"🚀 Модель {slot.name} обновлена: {candidate_score:.3f} (лучший {best_score:.3f}, "
+                  f"{slot.pending} примеров)")
+        else:
+            slot.candidate = serving.copy()
+            print(f"🛑 Дрейф модели {slot.name}: {candidate_score:.3f} при лучшем {best_score:.3f}, "
+                  f"обновление по {slot.pending} примерам отклонено")
+
+        record = {
+            'model': slot.name,
+            'examples': slot.pending,
+            'best_score': round(best_score, 4),
+            'candidate_score': round(candidate_score, 4),
+            'promoted': promoted,
+            'timestamp': datetime.now().isoformat()
+        }
+        slot.pending = 0
+        self.history.append(record)
+        del self.history[:-self.max_history]
+        return record
+
+    def promote_pending(self) -> List[Dict[str, Any]]:
+        """Проверяет кандидатов с любым числом накопленных примеров"""
+        with self._lock:
+            return [self._evaluate(slot) for slot in self.slots if slot.pending]
+
+    def is_writer(self) -> bool:
+        """Этот процесс пишет чекпоинты (блокировка берется при первой возможности и не отпускается)"""
+        if self._writer is None:
+            self._writer = _try_writer_lock(self.writer_lock_path)
+        return self._writer is not None
+
+    def checkpoint(self) -> List[str]:
+        """Сохраняет опубликованные версии, изменившиеся с прошлого чекпоинта.
+        В процессе, который не пишет чекпоинты, публикации остаются в памяти до перечитывания."""
+        saved = []
+        if not self.is_writer():
+            return saved
+        with self._lock:
+            slots = [slot for slot in self.slots if slot.dirty]
+            for slot in slots:
+                slot.dirty = False
+        for slot in slots:
+            # Опубликованная модель больше не меняется (SGD идет по кандидату), пишем ее без блокировки
+            try:
+                getattr(self.llm, slot.attribute).save(slot.path)
+                slot.mtime = _mtime(slot.path)
+                saved.append(slot.path)
+            except OSError as e:
+                slot.dirty = True
+                print(f"⚠️ Не удалось сохранить модель {slot.name}: {e}")
+        return saved
+
+    def reload_changed(self) -> List[str]:
+        """Подхватывает модели, сохраненные другим процессом (voicaj_trainer.py или пишущий воркер);
+        свои чекпоинты не перечитываются - их mtime запоминается при сохранении"""
+        reloaded = []
+        with self._lock:
+            for slot in self.slots:
+                mtime = _mtime(slot.path)
+                if mtime <= slot.mtime:
+                    continue
+                model = slot.loader(slot.path)
+                slot.mtime = mtime
+                if model is None:
+                    continue
+                # Переобученная версия заменяет и рабочую модель, и незавершенного кандидата
+                setattr(self.llm, slot.attribute, model)
+                slot.best = slot.score(model) or 0.0
+                slot.candidate = model.copy()
+                slot.pending = 0
+                slot.dirty = False
+                reloaded.append(slot.name)
+        if reloaded:
+            print(f"🔁 Модели перечитаны с диска: {', '.join(reloaded)}")
+        return reloaded
+
+    def status(self) -> Dict[str, Any]:
+        """Накопленные примеры по моделям и последние решения о публикации"""
+        with self._lock:
+            return {
+                'writer': self._writer is not None,
+                'pending': {slot.name: slot.pending for slot in self.slots},
+                'best': {slot.name: round(slot.best, 4) for slot in self.slots},
+                'history': list(self.history[-10:])
+            }
+
+    def start_checkpointer(self, interval_seconds: float = 300.0):
+        """Фоновый поток: периодически публикует накопленное и сохраняет модели на диск"""
+        if self._checkpointer is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    self.reload_changed()
+                    self.promote_pending()
+                    saved = self.checkpoint()
+                    if saved:
+                        print(f"💾 Чекпоинт моделей: {', '.join(saved)}")
+                except Exception as e:
+                    print(f"❌ Ошибка чекпоинта моделей: {e}")
+
+        self._checkpointer = threading.Thread(target=run, name="model-checkpointer", daemon=True)
+        self._checkpointer.start()
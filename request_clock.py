@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterator, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from date_grammar import DayAnchors, day_anchors
+
+# Метка времени клиента принимается, если расходится с часами сервера не больше чем на столько;
+# иначе берется время сервера в часовом поясе клиента
+MAX_CLIENT_SKEW = timedelta(hours=12)
+
+# Сколько дней держать опорные даты: вокруг полуночи клиенты в разных поясах живут в соседних днях
+ANCHOR_CACHE_DAYS = 4
+
+# Опорный момент текущего запроса (у каждого потока или задачи свой)
+_request_time: ContextVar[Optional[datetime]] = ContextVar('voicaj_request_time', default=None)
+
+
+def parse_client_time(timestamp: Optional[str] = None, tz_name: Optional[str] = None,
+                      server_now: Optional[datetime] = None) -> datetime:
+    """Местное время клиента (без tzinfo) из метки ISO 8601 и имени пояса IANA.
+
+    Без пояса используется пояс метки или сервера. Неверный формат или неизвестный
+    пояс - ValueError (ответ 400 в API).
+    """
+    try:
+        zone = ZoneInfo(tz_name) if tz_name else None
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        raise ValueError(f"Неизвестный часовой пояс: {tz_name}") from e
+
+    server_now = server_now or datetime.now(timezone.utc)
+    reference = server_now
+    if timestamp:
+        client = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        if client.tzinfo is None:
+            client = client.replace(tzinfo=zone) if zone else client.astimezone()
+        if abs(client - server_now) <= MAX_CLIENT_SKEW:
+            reference = client
+        elif zone is None:
+            zone = client.tzinfo
+    return reference.astimezone(zone).replace(tzinfo=None)
+
+
+class ReferenceClock:
+    """Опорное время для разбора сроков.
+
+    Внутри `request(...)` все вызовы now() в этом потоке возвращают момент запроса
+    (от клиента, см. parse_client_time, или сервера), вне запроса - текущее время
+    сервера. Так «завтра» в долгоживущем процессе считается от дня запроса, а не от
+    дня запуска. Опорные даты (сегодня, завтра, ближайшие дни недели) строятся один
+    раз на календарный день: первый запрос после полуночи собирает новые.
+    """
+
+    def __init__(self):
+        self._anchors: Dict[date, DayAnchors] = {}
+        self._lock = threading.Lock()
+
+    def now(self) -> datetime:
+        """Опорный момент текущего запроса (местное время без tzinfo)"""
+        reference = _request_time.get()
+        return reference if reference is not None else datetime.now()
+
+    def anchors(self) -> DayAnchors:
+        """Опорные даты дня текущего запроса"""
+        today = self.now().date()
+        anchors = self._anchors.get(today)
+        if anchors is None:
+            anchors = day_anchors(today)
+            with self._lock:
+                # Копия при записи: читатели без блокировки видят старый или новый словарь целиком
+                cache = {day: value for day, value in self._anchors.items()
+                         if abs((day - today).days) < ANCHOR_CACHE_DAYS}
+                cache[today] = anchors
+                self._anchors = cache
+        return anchors
+
+    @contextmanager
+    def request(self, reference: Optional[datetime] = None) -> Iterator[datetime]:
+        """Фиксирует опорный момент (по умолчанию - время сервера) на время обработки запроса"""
+        token = _request_time.set(reference if reference is not None else datetime.now())
+        try:
+            yield _request_time.get()
+        finally:
+            _request_time.reset(token)
+
+
+# Общие часы процесса: сервер, гибридная система и тренер читают одно опорное время
+reference_clock = ReferenceClock()
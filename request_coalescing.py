@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import unicodedata
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+def normalize_request(text: str) -> str:
+    """Ключ текста запроса: NFC и схлопнутые пробелы. Регистр сохраняется - он попадает
+    в заголовок и описание ответа"""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+class _Call:
+    """Одно выполняющееся вычисление и его результат для ожидающих"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Схлопывание одинаковых одновременных вызовов (singleflight).
+
+    Первый вызов с ключом выполняет функцию, остальные вызовы с тем же ключом, пришедшие
+    до ее завершения, ждут и получают тот же результат (или то же исключение). Результат
+    не кэшируется: следующий вызов после завершения считает заново.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Результат fn() и признак того, что он получен от чужого вызова"""
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики для метрик: всего вызовов, выполнено, схлопнуто, выполняется сейчас"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'executed': self.executed,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls)
+            }
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import io
+import time
+import marshal
+import hashlib
+import argparse
+from typing import List, Dict, Any, Optional, Iterable, Sequence, Tuple
+
+from similarity_index import TfidfIndex, SIMILARITY_MIN_SCORE
+import russian_stemmer
+from russian_stemmer import StemTable, stem_text
+
+# Fix console encoding for Windows
+if sys.platform.startswith('win'):
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+# Версия формата снимка; marshal зависит от версии Python, поэтому она тоже в ключе
+RULES_VERSION = 4
+RULES_SNAPSHOT_PATH = "voicaj_rules.snapshot"
+
+# Таблицы правил. Изменение этого файла (или стеммера) меняет хеш и пересобирает снимок правил.
+# Ключевые слова сводятся к основам, поэтому достаточно одной формы слова, а фраза, в которую
+# входит другое ключевое слово той же метки, ничего не добавляет. Несколько форм остаются там,
+# где стеммер дает разные основы: 'устал'/'устала' -> 'уста' (снято окончание прошедшего
+# времени), а 'усталым'/'усталость' -> 'устал'.
+
+# Теги и ключевые слова для _extract_tags (порядок тегов значим)
+TAG_KEYWORDS = {
+    'работа': ['работа', 'офис', 'коллеги', 'проект', 'встреча', 'программировать', 'код', 'разработка', 'клиент', 'презентация', 'карьера', 'бизнес', 'отчёт', 'руководитель', 'поставщик', 'команда', 'совещание', 'интервью', 'кандидат', 'тестирование', 'приложение', 'коммерческое предложение', 'продажи', 'собеседование', 'google'],
+    'семья': ['семья', 'дети', 'родители', 'родственники', 'мама', 'папа', 'день рождения', 'свадьба', 'молодожены'],
+    'здоровье': ['здоровье', 'врач', 'лекарство', 'больница', 'устал', 'усталым', 'подавлен', 'терапевт', 'лечение', 'похудеть', 'диета', 'бросить курить', 'операция'],
+    'спорт': ['спорт', 'тренировка', 'фитнес', 'зал', 'бегать', 'бег', 'беговая', 'тренироваться', 'физическая форма'],
+    'технологии': ['программировать', 'код', 'разработка', 'компьютер', 'технологии', 'сайт', 'портфолио', 'IT', 'программирование'],
+    'настроение': ['настроение', 'чувствую', 'эмоции', 'отлично', 'хорошо', 'плохо', 'волнуюсь', 'нервничаю', 'люблю', 'переживаю', 'тревога', 'стресс'],
+    'учеба': ['учеба', 'экзамен', 'математика', 'изучать', 'обучение', 'курс', 'лекция', 'испанский', 'язык', 'презентация', 'вуз', 'магистратура', 'искусственный интеллект', 'мотивационное письмо', 'английский', 'японский'],
+    'покупки': ['покупки', 'купить', 'магазин', 'товар', 'продукт', 'костюм', 'подарок', 'цветы', 'торт', 'мебель', 'билеты'],
+    'дом': ['дом', 'квартира', 'переезд', 'мебель', 'недвижимость', 'грузчики'],
+    'путешествия': ['путешествия', 'отпуск', 'Европа', 'отель', 'виза', 'самолет', 'транспорт', 'горы', 'поход', 'токио'],
+    'хобби': ['хобби', 'гитара', 'музыка', 'играть', 'занятия'],
+    'красота': ['красота', 'маникюр', 'массаж', 'расслабление', 'уход'],
+    'организация': ['организация', 'упаковка', 'вещи', 'подготовка'],
+    'дизайн': ['дизайн', 'интерфейс', 'ui', 'ux', 'графика', 'визуал'],
+    'подарки': ['подарки', 'подарок', 'поздравление', 'сюрприз'],
+    'новое место': ['новое место', 'новая работа', 'адаптация', 'коллектив'],
+    'кулинария': ['кулинария', 'готовка', 'рецепты', 'шеф-повар', 'кухня'],
+    'музыка': ['музыка', 'пианино', 'гитара', 'инструменты', 'мелодия'],
+    'отчёт': ['отчёт', 'руководитель'],
+    'презентация': ['презентация', 'клиент', 'демонстрация', 'инвесторы'],
+    'переговоры': ['переговоры', 'поставщик', 'обсуждение', 'условия'],
+    'совещание': ['совещание', 'команда'],
+    'система': ['система', 'база данных', 'обновление', 'проверка'],
+    'проект': ['проект', 'техническое задание', 'требования'],
+    'hr': ['hr', 'интервью', 'кандидат', 'найм'],
+    'qa': ['qa', 'тестирование', 'баги', 'проверка'],
+    'продажи': ['продажи', 'коммерческое предложение', 'клиент', 'расценки'],
+    'стартап': ['стартап', 'инвестиции', 'MVP', 'соучредитель'],
+    'медитация': ['медитация', 'приложение', 'wellness', 'здоровье'],
+    'фотография': ['фотография', 'студия', 'творчество'],
+    'привычка': ['привычка', 'регулярно', 'ежедневно', 'каждый день']
+}
+
+# Приоритеты для _extract_priority (проверяются в порядке low, high, medium)
+PRIORITY_KEYWORDS = {
+    'low': ['когда-нибудь', 'не спеша', 'в свободное время', 'срочность низкая', 'неважно', 'не важно', 'неприоритетно', 'в будущем', 'мечтаю'],
+    'high': ['срочно', 'критично', 'немедленно', 'критическая', 'неотложно', 'важно', 'нужно', 'надо', 'требуется', 'организовать', 'подготовить', 'напоминание', 'будильник'],
+    'medium': ['на этой неделе', 'в ближайшее время', 'встреча', 'презентация', 'отчёт', 'хочу', 'планирую', 'изучить', 'фреймворк', 'технологию', 'отправить']
+}
+
+# MOOD_ENTRY - эмоциональные состояния
+MOOD_PATTERNS = [
+    'чувствую', 'волнуюсь', 'переживаю', 'устал', 'грустно', 'радостно',
+    'злой', 'злая', 'раздражен', 'спокоен', 'спокойна', 'тревожно',
+    'беспокоюсь', 'нервничаю', 'настроение', 'эмоции', 'состояние',
+    'депрессия', 'стресс', 'тревога', 'паника', 'счастье', 'радость', 'восторг',
+    'разочарован', 'обижен', 'одинок', 'очень радуюсь', 'горжусь', 'испытываю',
+    'огромную благодарность', 'поддержки друзей', 'важным экзаменом', 'не могу уснуть',
+    'публичным выступлением'
+]
+
+# HABIT - привычки и регулярные действия
+HABIT_PATTERNS = [
+    'каждый день', 'ежедневно', 'регулярно', 'привычка', 'привык', 'начинаю',
+    'хочу начать', 'планирую начать', 'буду делать', 'каждое утро', 'каждый вечер',
+    'каждую неделю', 'каждый месяц', 'тренировка', 'зарядка', 'бег', 'бегать',
+    'медитировать', 'йога', 'спорт', 'фитнес', 'тренироваться'
+]
+
+# GOAL - долгосрочные цели
+GOAL_PATTERNS = [
+    'хочу создать', 'хочу открыть', 'хочу стать', 'хочу достичь', 'цель',
+    'мечтаю', 'планирую', 'когда-нибудь', 'в будущем', 'через год', 'через 5 лет',
+    'стартап', 'бизнес', 'карьера', 'профессия', 'навык', 'мастерство',
+    'достижение', 'амбиции', 'стремление', 'желание', 'намерение',
+    'через несколько лет', 'хочу путешествовать', 'путешествовать по', 'изучить разные культуры',
+    'стать профессиональным', 'фотографом'
+]
+
+# TASK - конкретные задачи
+TASK_PATTERNS = [
+    'нужно', 'должен', 'должна', 'обязательно', 'срочно', 'важно',
+    'встреча', 'встретиться', 'презентация', 'отчет', 'документ', 'письмо', 'звонок',
+    'покупки', 'магазин', 'продукты', 'еда', 'лекарства', 'аптека',
+    'врач', 'больница', 'поликлиника', 'медицина', 'здоровье',
+    'работа', 'офис', 'проект', 'задача', 'дело', 'план',
+    'учеба', 'экзамен', 'курс', 'лекция', 'семинар', 'конференция',
+    'путешествие', 'поездка', 'отпуск', 'билеты', 'отель', 'виза',
+    'ремонт', 'уборка', 'стирка', 'готовка', 'дом', 'квартира'
+]
+
+# Контекстные правила: (метка, группы). Правило срабатывает, когда в запросе есть каждая его
+# группа ('a|b' - любое из слов группы); из сработавших выигрывает первое по порядку
+
+# Особые случаи detect_types, проверяются раньше таблиц типов
+TYPE_CONTEXT_RULES = [
+    ('habit', ['изучить', 'язык программирования|python|javascript']),
+    ('goal', ['когда-нибудь', 'прочитать|прочесть']),
+    ('habit', ['важно изучить', 'язык']),
+    ('habit', ['планирую изучить', 'фреймворк|технологию']),
+    ('goal', ['получить сертификат']),
+    ('task', ['собеседование']),
+    # Экзамен есть в задачах, но волнение перед ним - настроение. Обе формы нужны:
+    # у 'экзамен' стеммер снимает '-ен' как глагольное окончание ('экзам'), у 'экзаменом' - нет
+    ('mood_entry', ['очень нервничаю', 'экзамен|экзаменом'])
+]
+
+# Приоритет, если не сработала PRIORITY_KEYWORDS (случаи со словами из нее сюда не доходят)
+PRIORITY_CONTEXT_RULES = [
+    ('high', ['волнуюсь|тревога|паника|нервничаю|не могу уснуть']),  # Тревога и паника
+    ('high', ['собеседование']),
+    ('high', ['до 12']),  # Дедлайн до полудня
+    ('high', ['проект', 'до|дедлайн']),  # Проекты с дедлайном
+    ('medium', ['радуюсь|счастье|благодарность'])  # Положительные эмоции
+]
+
+# Теги по контексту, если таблица тегов дала меньше двух
+TAG_CONTEXT_KEYWORDS = {
+    'задача': ['завтра', 'послезавтра', 'завтрашний'],
+    'привычка': ['хочу', 'начну'],
+    'настроение': ['чувствую', 'волнуюсь']
+}
+
+# Простые случаи, которые всегда обрабатываются rule-based
+SIMPLE_REQUEST_PATTERNS = [
+    r'завтра.*отправить.*отчёт',
+    r'послезавтра.*отправить.*отчёт',
+    r'завтра.*сходить.*продукт',
+    r'послезавтра.*сходить.*продукт',
+    r'презентация.*вуз',
+    r'код.*работа'
+]
+
+# Сколько похожих примеров голосуют за теги и какая доля веса лучшего тега нужна остальным
+SIMILAR_TOP_K = 3
+SIMILAR_TAG_SHARE = 0.5
+
+# Уверенность ответов правил по источнику: таблица ключевых слов, контекстная ветка, значение по умолчанию
+RULE_TABLE_CONFIDENCE = 0.6
+RULE_CONTEXT_CONFIDENCE = 0.5
+RULE_DEFAULT_CONFIDENCE = 0.2
+
+
+def rules_source_hash(training_paths: Iterable[str] = ()) -> str:
+    """Хеш исходников правил и данных обучения, из которых собран снимок"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{RULES_VERSION}:{sys.version_info[:2]}".encode('ascii'))
+    for path in [os.path.abspath(__file__), os.path.abspath(russian_stemmer.__file__), *training_paths]:
+        digest.update(path.encode('utf-8'))
+        try:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        except FileNotFoundError:
+            digest.update(b'<missing>')
+    return digest.hexdigest()
+
+
+class ContextRules:
+    """Упорядоченные контекстные правила (TYPE_CONTEXT_RULES, PRIORITY_CONTEXT_RULES).
+
+    Как в TemplateIndex (text_templates.py), группы всех правил сведены к основам в одну
+    StemTable, и проверка всех правил - один проход по основам запроса.
+    """
+
+    def __init__(self, compiled: Dict[str, Any]):
+        self.labels = compiled['labels']
+        self._needed = compiled['needed']
+        self._group_rule = compiled['group_rule']
+        self.table = StemTable(compiled['table'])
+
+    @staticmethod
+    def compile(rules: Iterable[Tuple[str, List[str]]]) -> Dict[str, Any]:
+        """Правила в виде, пригодном для marshal"""
+        labels, needed, group_rule, groups = [], [], [], []
+        for number, (label, when) in enumerate(rules):
+            labels.append(label)
+            needed.append(len(when))
+            for group in when:
+                group_rule.append(number)
+                groups.append((len(groups), group.split('|')))
+        return {'labels': labels, 'needed': needed, 'group_rule': group_rule,
+                'table': StemTable.compile(dict(groups))}
+
+    def first_label(self, stems: Sequence[str]) -> Optional[str]:
+        """Метка первого сработавшего правила или None"""
+        hits: Dict[int, int] = {}
+        for group in self.table.matches(stems):
+            rule = self._group_rule[group]
+            hits[rule] = hits.get(rule, 0) + 1
+        matched = [rule for rule, count in hits.items() if count == self._needed[rule]]
+        return self.labels[min(matched)] if matched else None
+
+
+class RuleEngine:
+    """Скомпилированное состояние rule-based части: таблицы основ, шаблоны и индекс похожих примеров"""
+
+    def __init__(self, state: Dict[str, Any]):
+        self.state = state
+        self.source_hash = state['source_hash']
+        self.tag_table = StemTable(state['tag_table'])
+        self.priority_table = StemTable(state['priority_table'])
+        self.type_table = StemTable(state['type_table'])
+        self.tag_context_table = StemTable(state['tag_context_table'])
+        self.type_context = ContextRules(state['type_context'])
+        self.priority_context = ContextRules(state['priority_context'])
+        self.simple_request_patterns = [re.compile(pattern) for pattern in state['simple_request_patterns']]
+        self.similarity_index = state['similarity_index']
+        self._retrieval: Optional[TfidfIndex] = None
+
+    @classmethod
+    def build(cls, training_data: Iterable[Dict[str, Any]], source_hash: str = '') -> 'RuleEngine':
+        """Компилирует таблицы правил и индексирует примеры обучения"""
+        state = {
+            'version': RULES_VERSION,
+            'source_hash': source_hash,
+            'tag_table': StemTable.compile(TAG_KEYWORDS),
+            'priority_table': StemTable.compile(PRIORITY_KEYWORDS),
+            'type_table': StemTable.compile({
+                'mood_entry': MOOD_PATTERNS,
+                'habit': HABIT_PATTERNS,
+                'goal': GOAL_PATTERNS,
+                'task': TASK_PATTERNS
+            }),
+            'tag_context_table': StemTable.compile(TAG_CONTEXT_KEYWORDS),
+            'type_context': ContextRules.compile(TYPE_CONTEXT_RULES),
+            'priority_context': ContextRules.compile(PRIORITY_CONTEXT_RULES),
+            'simple_request_patterns': list(SIMPLE_REQUEST_PATTERNS),
+            'similarity_index': []
+        }
+        engine = cls(state)
+        engine.reindex(training_data)
+        return engine
+
+    @classmethod
+    def load(cls, path: str, source_hash: str) -> Optional['RuleEngine']:
+        """Загружает снимок одним чтением; None, если он устарел или поврежден"""
+        try:
+            with open(path, 'rb') as f:
+                state = marshal.loads(f.read())
+        except (FileNotFoundError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(state, dict) or state.get('version') != RULES_VERSION:
+            return None
+        if state.get('source_hash') != source_hash:
+            return None
+        return cls(state)
+
+    @classmethod
+    def load_or_build(cls, path: str, training_data, training_paths: Iterable[str] = ()) -> 'RuleEngine':
+        """Берет снимок, если он собран из тех же правил и данных; иначе пересобирает и сохраняет"""
+        source_hash = rules_source_hash(training_paths)
+        engine = cls.load(path, source_hash)
+        if engine is not None and len(engine.similarity_index) == len(training_data):
+            return engine
+
+        engine = cls.build(training_data, source_hash)
+        try:
+            engine.save(path)
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить снимок правил: {e}")
+        return engine
+
+    def save(self, path: str):
+        """Атомарно записывает снимок"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(marshal.dumps(self.state))
+        os.replace(tmp_path, path)
+
+    @property
+    def retrieval(self) -> TfidfIndex:
+        """Матрица TF-IDF по текстам индекса; собирается при первом поиске, а не при загрузке снимка"""
+        if self._retrieval is None:
+            self._retrieval = TfidfIndex(self.similarity_index)
+        return self._retrieval
+
+    def _index_entry(self, example) -> Optional[str]:
+        """Запись индекса похожих примеров: текст запроса"""
+        if 'input' not in example:
+            return None
+        return example['input'].lower()
+
+    def reindex(self, training_data: Iterable[Dict[str, Any]]):
+        """Полностью перестраивает индекс похожих примеров"""
+        self.similarity_index[:] = [self._index_entry(example) for example in training_data]
+        self._retrieval = None
+
+    def add_example(self, example: Dict[str, Any]):
+        """Добавляет в индекс новый пример (в том же порядке, что и training_data)"""
+        entry = self._index_entry(example)
+        self.similarity_index.append(entry)
+        if self._retrieval is not None:
+            self._retrieval.add(entry)
+
+    def similar_examples(self, training_data, user_input: str, k: int = SIMILAR_TOP_K,
+                         min_score: float = SIMILARITY_MIN_SCORE) -> List[Tuple[Dict[str, Any], float]]:
+        """До k похожих примеров обучения с косинусом TF-IDF, по убыванию сходства"""
+        return [(training_data[index], score) for index, score in self.retrieval.query(user_input, k, min_score)
+                if index < len(training_data)]
+
+    def is_complex(self, text: str) -> bool:
+        """Сложный ли запрос по эвристикам правил (кандидат на LLM)"""
+        text_lower = text.lower()
+
+        # Простые случаи - обрабатываем rule-based
+        for pattern in self.simple_request_patterns:
+            if pattern.search(text_lower):
+                return False
+
+        # Сложные случаи - нужна LLM
+        complex_indicators = [
+            len(text.split()) > 15,  # Длинный текст
+            'и' in text_lower and text.count('и') > 2,  # Много союзов
+            any(word in text_lower for word in ['одновременно', 'параллельно', 'также', 'кроме того']),
+            text.count(',') > 3,  # Много запятых
+        ]
+
+        return any(complex_indicators)
+
+    def detect_types(self, text: str) -> List[str]:
+        """Определяет типы задач упорядоченным каскадом правил (первое совпадение)"""
+        stems = stem_text(text.lower())
+
+        # 0. Специальные случаи для точного определения
+        special = self.type_context.first_label(stems)
+        if special:
+            return [special]
+
+        # Затем таблицы типов: конкретные задачи важнее эмоций (смешанный запрос - задача),
+        # эмоции - привычек, привычки - целей
+        matched = self.type_table.labels_in(stems)
+        for task_type in ('task', 'mood_entry', 'habit', 'goal'):
+            if task_type in matched:
+                return [task_type]
+
+        # По умолчанию - задача
+        return ['task']
+
+    def extract_tags(self, training_data, text: str) -> List[str]:
+        """Теги по правилам: теги похожего примера, иначе таблица ключевых слов"""
+        return self.extract_tags_scored(training_data, text)[0]
+
+    def extract_tags_scored(self, training_data, text: str) -> Tuple[List[str], float]:
+        """Теги по правилам и уверенность: сходство лучшего примера или уверенность источника правил"""
+        # Похожие примеры голосуют за свои теги с весом сходства
+        votes: Dict[str, float] = {}
+        best_score = 0.0
+        for example, score in self.similar_examples(training_data, text):
+            best_score = max(best_score, score)
+            if 'expected' in example and isinstance(example['expected'], list):
+                for item in example['expected']:
+                    if 'tags' in item and isinstance(item['tags'], list):
+                        for tag in item['tags']:
+                            votes[tag] = votes.get(tag, 0.0) + score
+                        break
+        if votes:
+            best = max(votes.values())
+            ranked = sorted(votes, key=votes.get, reverse=True)
+            return [tag for tag in ranked if votes[tag] >= best * SIMILAR_TAG_SHARE][:4], best_score
+
+        # Если не нашли в обучении, используем улучшенные правила
+        stems = stem_text(text.lower())
+
+        # Ищем совпадения по основам слов
+        tags = self.tag_table.labels_in(stems)
+        confidence = RULE_TABLE_CONFIDENCE if tags else RULE_CONTEXT_CONFIDENCE
+
+        # Если тегов мало, добавляем дополнительные на основе контекста
+        if len(tags) < 2:
+            tags += [tag for tag in self.tag_context_table.labels_in(stems) if tag not in tags]
+
+        if not tags:
+            return ["задача"], RULE_DEFAULT_CONFIDENCE
+        return tags[:4], confidence  # Максимум 4 тега
+    
+
+
+    def extract_priority(self, text: str) -> str:
+        """Приоритет по правилам: таблица ключевых слов, затем контекстные случаи"""
+        return self.extract_priority_scored(text)[0]
+
+    def extract_priority_scored(self, text: str) -> Tuple[str, float]:
+        """Приоритет по правилам и уверенность источника (таблица, контекст или значение по умолчанию)"""
+        stems = stem_text(text.lower())
+
+        # Проверяем наличие ключевых слов (по основам), затем контекстные случаи
+        priority = self.priority_table.first_label(stems)
+        if priority:
+            return priority, RULE_TABLE_CONFIDENCE
+
+        priority = self.priority_context.first_label(stems)
+        if priority:
+            return priority, RULE_CONTEXT_CONFIDENCE
+        return 'medium', RULE_DEFAULT_CONFIDENCE
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Снимок скомпилированных правил Voicaj")
+    parser.add_argument("--data", default="voicaj_training_data.json", help="Снимок данных обучения")
+    parser.add_argument("--output", default=RULES_SNAPSHOT_PATH, help="Файл снимка правил")
+    parser.add_argument("--repeat", type=int, default=20, help="Повторов для замера холодного старта")
+    args = parser.parse_args()
+
+    from training_store import TrainingStore
+    store = TrainingStore(args.data)
+    training_data = store.load()
+    training_paths = [store.snapshot_path, store.log_path]
+
+    source_hash = rules_source_hash(training_paths)
+    engine = RuleEngine.build(training_data, source_hash)
+    engine.save(args.output)
+    print(f"✅ Снимок правил {args.output}: {len(engine.similarity_index)} примеров, "
+          f"{os.path.getsize(args.output) / 1024:.1f} КБ, хеш {source_hash}")
+
+    # Холодный старт rule-части воркера: компиляция с нуля против загрузки снимка
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        re.purge()
+        russian_stemmer.stem.cache_clear()
+        stem_text.cache_clear()
+        RuleEngine.build(training_data, source_hash)
+    build_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        re.purge()
+        russian_stemmer.stem.cache_clear()
+        stem_text.cache_clear()
+        RuleEngine.load_or_build(args.output, training_data, training_paths)
+    load_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+    print(f"⏱️ Холодный старт правил: сборка {build_ms:.2f} мс, загрузка снимка {load_ms:.2f} мс")
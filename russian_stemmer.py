@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from functools import lru_cache
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+from training_corpus import tokenize
+
+# Размер кэшей: словарь запросов невелик, почти каждое слово повторяется
+STEM_CACHE_SIZE = 65536
+TEXT_CACHE_SIZE = 4096
+
+_VOWELS = frozenset('аеиоуыэюя')
+
+# Слова, которые остаются целиком: их основа совпала бы с предлогом ('надо' -> 'над'), и
+# ключевое слово срабатывало бы на «подумать над дизайном»
+_UNSTEMMED = frozenset({'надо'})
+
+# Окончания алгоритма Портера (Snowball) для русского языка. Группа 1 снимается только
+# после «а» или «я», группа 2 - всегда
+_PERFECTIVE_GERUND = (('в', 'вши', 'вшись'), ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+_ADJECTIVE = ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+              'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею')
+_PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+_REFLEXIVE = ('ся', 'сь')
+_VERB = (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+         ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+          'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+_NOUN = ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й',
+         'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я')
+_SUPERLATIVE = ('ейше', 'ейш')
+_DERIVATIONAL = ('ость', 'ост')
+
+
+def _by_length(endings: Iterable[str]) -> Tuple[str, ...]:
+    """Окончания от длинных к коротким: снимается самое длинное подходящее"""
+    return tuple(sorted(set(endings), key=len, reverse=True))
+
+
+_PERFECTIVE_GERUND = tuple(_by_length(group) for group in _PERFECTIVE_GERUND)
+_ADJECTIVE = _by_length(_ADJECTIVE)
+_ADJECTIVAL = (_by_length(participle + adjective for participle in _PARTICIPLE[0] for adjective in _ADJECTIVE),
+               _by_length(participle + adjective for participle in _PARTICIPLE[1] for adjective in _ADJECTIVE)
+               + _ADJECTIVE)
+_VERB = tuple(_by_length(group) for group in _VERB)
+_NOUN = _by_length(_NOUN)
+
+
+def _regions(word: str) -> Tuple[int, int]:
+    """Начала областей RV (после первой гласной) и R2 (Snowball)"""
+    rv = next((i + 1 for i, char in enumerate(word) if char in _VOWELS), len(word))
+    r1 = next((i + 1 for i in range(1, len(word)) if word[i] not in _VOWELS and word[i - 1] in _VOWELS), len(word))
+    r2 = next((i + 1 for i in range(r1 + 1, len(word)) if word[i] not in _VOWELS and word[i - 1] in _VOWELS),
+              len(word))
+    return rv, r2
+
+
+def _strip(word: str, start: int, endings: Sequence[str]) -> str:
+    """Снимает самое длинное окончание, целиком лежащее после позиции start"""
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            return word[:-len(ending)]
+    return word
+
+
+def _strip_grouped(word: str, start: int, groups: Tuple[Sequence[str], Sequence[str]]) -> str:
+    """То же для пары групп, где окончания первой группы требуют перед собой «а» или «я»"""
+    first, second = groups
+    for ending in first:
+        cut = len(word) - len(ending)
+        if word.endswith(ending) and cut - 1 >= start and word[cut - 1] in 'ая':
+            return word[:cut]
+    return _strip(word, start, second)
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word: str) -> str:
+    """Основа слова по алгоритму Портера для русского языка (слово в нижнем регистре)"""
+    word = word.replace('ё', 'е')
+    if word in _UNSTEMMED:
+        return word
+    rv, r2 = _regions(word)
+
+    # Шаг 1: деепричастие, иначе возвратная частица и прилагательное, глагол или существительное
+    stripped = _strip_grouped(word, rv, _PERFECTIVE_GERUND)
+    if stripped == word:
+        word = _strip(word, rv, _REFLEXIVE)
+        for groups in (_ADJECTIVAL, _VERB):
+            stripped = _strip_grouped(word, rv, groups)
+            if stripped != word:
+                break
+        else:
+            stripped = _strip(word, rv, _NOUN)
+    word = stripped
+
+    # Шаг 2: «и» на конце; шаг 3: словообразовательное «ость» в R2
+    word = _strip(word, rv, ('и',))
+    word = _strip(word, r2, _DERIVATIONAL)
+
+    # Шаг 4: превосходная степень, двойное «н» и мягкий знак
+    word = _strip(word, rv, _SUPERLATIVE)
+    if word.endswith('нн') and len(word) - 1 >= rv:
+        return word[:-1]
+    return _strip(word, rv, ('ь',))
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def stem_text(text: str) -> Tuple[str, ...]:
+    """Основы слов текста по порядку. Кэш по тексту: все правила одного запроса
+    разбирают его один раз"""
+    return tuple(stem(token) for token in tokenize(text))
+
+
+def stem_phrase(phrase: str) -> Tuple[str, ...]:
+    """Ключевое слово или фраза таблицы правил в виде основ"""
+    return stem_text(phrase.lower())
+
+
+class StemTable:
+    """Таблица ключевых слов, сведенная к основам: метка -> фразы из основ.
+
+    Фразы индексируются по первой основе, поэтому проверка всех меток таблицы - один
+    проход по основам запроса с поиском в словаре вместо сканирования подстрок.
+    Формы одного слова ('экзамен', 'экзамены') сливаются в одну запись.
+    """
+
+    def __init__(self, compiled: Sequence[Tuple[str, Sequence[Sequence[str]]]]):
+        self.labels = [label for label, _ in compiled]
+        self.compiled = [(label, [list(phrase) for phrase in phrases]) for label, phrases in compiled]
+        self._index: Dict[str, List[Tuple[int, Tuple[str, ...]]]] = {}
+        for position, (_, phrases) in enumerate(compiled):
+            for phrase in phrases:
+                self._index.setdefault(phrase[0], []).append((position, tuple(phrase[1:])))
+
+    @staticmethod
+    def compile(table: Dict[str, Iterable[str]]) -> List[Tuple[str, List[List[str]]]]:
+        """Фразы таблицы в виде основ без повторов (порядок меток сохраняется); пригодно для marshal"""
+        compiled = []
+        for label, keywords in table.items():
+            phrases = [list(phrase) for phrase in dict.fromkeys(stem_phrase(keyword) for keyword in keywords) if phrase]
+            compiled.append((label, phrases))
+        return compiled
+
+    @classmethod
+    def from_table(cls, table: Dict[str, Iterable[str]]) -> 'StemTable':
+        return cls(cls.compile(table))
+
+    def __len__(self) -> int:
+        return sum(len(phrases) for _, phrases in self.compiled)
+
+    def matches(self, stems: Sequence[str]) -> Set[int]:
+        """Номера меток, хотя бы одна фраза которых встречается в основах запроса"""
+        found = set()
+        for i, word in enumerate(stems):
+            for position, rest in self._index.get(word, ()):
+                if position not in found and tuple(stems[i + 1:i + 1 + len(rest)]) == rest:
+                    found.add(position)
+        return found
+
+    def labels_in(self, stems: Sequence[str]) -> List[str]:
+        """Совпавшие метки в порядке таблицы"""
+        found = self.matches(stems)
+        return [label for position, label in enumerate(self.labels) if position in found]
+
+    def first_label(self, stems: Sequence[str]) -> str:
+        """Первая по порядку таблицы совпавшая метка или пустая строка"""
+        found = self.matches(stems)
+        return self.labels[min(found)] if found else ''
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+import threading
+from collections import namedtuple
+from typing import List, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from training_corpus import tokenize
+
+# Ниже этого косинуса пример не считается похожим (подобрано по F1 тегов на отложенной выборке)
+SIMILARITY_MIN_SCORE = 0.5
+
+# Собранная матрица: неизменяемый снимок, который запрос читает целиком один раз.
+# vocabulary - словарь, по которому она собрана (в нем могут быть и более новые слова, их номера >= len(idf))
+_Matrix = namedtuple('_Matrix', ['version', 'vocabulary', 'idf', 'docs', 'weights', 'indptr', 'n_docs'])
+
+
+class TfidfIndex:
+    """Поиск похожих примеров: разреженная матрица TF-IDF входов обучения и top-k по косинусу.
+
+    Матрица хранится по столбцам (слово -> документы и веса, т.е. инвертированный индекс),
+    поэтому произведение матрицы на разреженный вектор запроса затрагивает только списки
+    слов запроса. Строки нормированы, и оценка сразу равна косинусу. Номера документов
+    совпадают с порядком добавления (как у training_data).
+
+    Потоки: add/reset меняют словарь и строки под блокировкой, а матрица собирается из
+    снимка строк в локальные массивы и публикуется одним присваиванием неизменяемого _Matrix.
+    Запрос берет текущую матрицу один раз и не видит полусобранного состояния.
+    """
+
+    def __init__(self, texts: Sequence[Optional[str]] = ()):
+        self.vocabulary: Dict[str, int] = {}
+        self._rows: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._version = 0
+        self._matrix: Optional[_Matrix] = None
+        self._lock = threading.Lock()
+        self.add_all(texts)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @staticmethod
+    def _term_counts(vocabulary: Dict[str, int], text: Optional[str], grow: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """Номера слов текста и их частоты (новые слова попадают в словарь, только если grow)"""
+        counts: Dict[int, int] = {}
+        for token in tokenize(text or ''):
+            term = vocabulary.get(token)
+            if term is None:
+                if not grow:
+                    continue
+                term = vocabulary[token] = len(vocabulary)
+            counts[term] = counts.get(term, 0) + 1
+        return np.fromiter(counts.keys(), dtype=np.int64, count=len(counts)), \
+            np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+
+    def add(self, text: Optional[str]):
+        """Добавляет документ; пересчет IDF откладывается до следующего запроса"""
+        with self._lock:
+            self._rows.append(self._term_counts(self.vocabulary, text, grow=True))
+            self._version += 1
+
+    def add_all(self, texts: Sequence[Optional[str]]):
+        for text in texts:
+            self.add(text)
+
+    def reset(self, texts: Sequence[Optional[str]]):
+        """Полностью перестраивает индекс (новый словарь: уже собранная матрица остается согласованной)"""
+        vocabulary: Dict[str, int] = {}
+        rows = [self._term_counts(vocabulary, text, grow=True) for text in texts]
+        with self._lock:
+            self.vocabulary = vocabulary
+            self._rows = rows
+            self._version += 1
+
+    def _current(self) -> _Matrix:
+        """Матрица, собранная по последней версии строк (пересобирается, если индекс менялся)"""
+        matrix = self._matrix
+        if matrix is not None and matrix.version == self._version:
+            return matrix
+        with self._lock:
+            version, vocabulary = self._version, self.vocabulary
+            rows = list(self._rows)
+            n_terms = len(vocabulary)
+        matrix = self._compile(version, vocabulary, rows, n_terms)
+        # Более новую матрицу из другого потока не затираем
+        current = self._matrix
+        if current is None or current.version < version:
+            self._matrix = matrix
+        return matrix
+
+    @staticmethod
+    def _compile(version: int, vocabulary: Dict[str, int], rows: List[Tuple[np.ndarray, np.ndarray]],
+                 n_terms: int) -> _Matrix:
+        """Собирает столбцы матрицы с весами (1 + log tf) * idf, нормированными по строкам"""
+        lengths = np.array([len(terms) for terms, _ in rows], dtype=np.int64)
+        terms = np.concatenate([terms for terms, _ in rows]) if rows else np.zeros(0, np.int64)
+        counts = np.concatenate([counts for _, counts in rows]) if rows else np.zeros(0, np.float32)
+        docs = np.repeat(np.arange(len(rows)), lengths)
+
+        document_frequency = np.bincount(terms, minlength=n_terms)
+        idf = (np.log((1 + len(rows)) / (1 + document_frequency)) + 1).astype(np.float32)
+        weights = (1 + np.log(counts)) * idf[terms]
+        norms = np.sqrt(np.bincount(docs, weights=weights * weights, minlength=len(rows)))
+        weights = weights / np.maximum(norms[docs], 1e-12)
+
+        order = np.argsort(terms, kind='stable')
+        indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(document_frequency, out=indptr[1:])
+        return _Matrix(version, vocabulary, idf, docs[order], weights[order].astype(np.float32), indptr, len(rows))
+
+    def _query_vector(self, matrix: _Matrix, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        terms, counts = self._term_counts(matrix.vocabulary, text, grow=False)
+        # Слова, добавленные другим потоком после сборки матрицы, в ней еще не представлены
+        known = terms < len(matrix.idf)
+        terms, counts = terms[known], counts[known]
+        weights = (1 + np.log(counts)) * matrix.idf[terms]
+        norm = math.sqrt(float(weights @ weights)) if len(weights) else 0.0
+        return terms, weights / norm if norm else weights
+
+    @staticmethod
+    def _postings(matrix: _Matrix, terms: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Позиции всех вхождений слов в столбцах матрицы и длины их списков"""
+        starts, stops = matrix.indptr[terms], matrix.indptr[terms + 1]
+        lengths = stops - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(int(lengths.sum())), lengths
+
+    def scores(self, text: str) -> np.ndarray:
+        """Косинус запроса со всеми документами: X @ q по спискам слов запроса"""
+        return self._scores(self._current(), text)
+
+    def _scores(self, matrix: _Matrix, text: str) -> np.ndarray:
+        terms, weights = self._query_vector(matrix, text)
+        postings, lengths = self._postings(matrix, terms)
+        contributions = matrix.weights[postings] * np.repeat(weights, lengths)
+        return np.bincount(matrix.docs[postings], weights=contributions, minlength=matrix.n_docs)
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int, min_score: float) -> List[List[Tuple[int, float]]]:
+        """Лучшие k документов для каждой строки матрицы оценок (запросы x документы)"""
+        k = min(k, scores.shape[1])
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < scores.shape[1] else \
+            np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind='stable')
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+        threshold = max(min_score, 1e-9)
+        return [[(int(doc), float(score)) for doc, score in zip(docs, row) if score >= threshold]
+                for docs, row in zip(candidates, candidate_scores)]
+
+    def query(self, text: str, k: int = 5, min_score: float = SIMILARITY_MIN_SCORE) -> List[Tuple[int, float]]:
+        """До k самых похожих документов: [(номер, косинус)] по убыванию сходства"""
+        matrix = self._current()
+        if not matrix.n_docs or k <= 0:
+            return []
+        return self._top(self._scores(matrix, text)[None, :], k, min_score)[0]
+
+    def query_batch(self, texts: Sequence[str], k: int = 5, min_score: float = SIMILARITY_MIN_SCORE,
+                    chunk_queries: int = 16) -> List[List[Tuple[int, float]]]:
+        """То же для пачки запросов: одно произведение X @ Q^T на каждые chunk_queries запросов"""
+        matrix = self._current()
+        n_docs = matrix.n_docs
+        if not n_docs or k <= 0:
+            return [[] for _ in texts]
+        results = []
+        for start in range(0, len(texts), chunk_queries):
+            chunk = texts[start:start + chunk_queries]
+            vectors = [self._query_vector(matrix, text) for text in chunk]
+            terms = np.concatenate([terms for terms, _ in vectors])
+            weights = np.concatenate([weights for _, weights in vectors])
+            rows = np.repeat(np.arange(len(chunk)), [len(terms) for terms, _ in vectors])
+            postings, lengths = self._postings(matrix, terms)
+            cells = np.repeat(rows * n_docs, lengths) + matrix.docs[postings]
+            contributions = matrix.weights[postings] * np.repeat(weights, lengths)
+            scores = np.bincount(cells, weights=contributions, minlength=len(chunk) * n_docs)
+            results.extend(self._top(scores.reshape(len(chunk), n_docs), k, min_score))
+        return results
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+from collections import Counter
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from hashed_features import HashedFeaturizer, stack_batches, sparse_dot, sparse_update
+from type_classifier import holdout_split, reference_split
+
+TAG_MODEL_PATH = "voicaj_tag_model.npz"
+
+# Тегов больше, чем типов, поэтому пространство признаков меньше: веса n_features x n_tags
+TAG_FEATURES = 2 ** 15
+
+# Порог тегов, для которых на отложенной выборке не нашлось примеров
+TAG_DEFAULT_THRESHOLD = 0.3
+
+# Тег попадает в словарь модели, встретившись не реже этого числа раз: и при обучении с нуля,
+# и в обратной связи, где один непроверенный пример не должен заводить столбец весов
+TAG_MIN_COUNT = 2
+
+# Начальное смещение тега, появившегося из обратной связи: sigmoid(-4) ~ 0.02
+NEW_TAG_BIAS = -4.0
+
+# Сетка порогов, из которой для каждого тега выбирается лучший по F1
+THRESHOLD_GRID = np.round(np.arange(0.1, 0.91, 0.05), 2)
+
+
+def example_tags(example: Dict[str, Any]) -> List[str]:
+    """Теги всех объектов expected примера обучения (без повторов, в исходном порядке)"""
+    tags = []
+    for obj in example.get('expected') or []:
+        if not isinstance(obj, dict) or not isinstance(obj.get('tags'), list):
+            continue
+        for tag in obj['tags']:
+            if isinstance(tag, str) and tag and tag not in tags:
+                tags.append(tag)
+    return tags
+
+
+def tag_pairs(training_data: Sequence[Dict[str, Any]]):
+    """Пары (тексты, теги) из примеров обучения, у которых есть теги"""
+    texts, labels = [], []
+    for example in training_data:
+        tags = example_tags(example)
+        if example.get('input') and tags:
+            texts.append(example['input'])
+            labels.append(tags)
+    return texts, labels
+
+
+def _sigmoid(scores: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(scores, -30, 30)))
+
+
+class TagPredictor:
+    """Многометочный предсказатель тегов: one-vs-rest логистическая регрессия с порогами на тег"""
+
+    def __init__(self, featurizer: Optional[HashedFeaturizer] = None, tags: Sequence[str] = (),
+                 weights: Optional[np.ndarray] = None, thresholds: Optional[np.ndarray] = None,
+                 default_threshold: float = TAG_DEFAULT_THRESHOLD, unseen_tags: Optional[Dict[str, int]] = None):
+        self.featurizer = featurizer or HashedFeaturizer(n_features=TAG_FEATURES)
+        self.tags = list(tags)
+        self.tag_index = {tag: column for column, tag in enumerate(self.tags)}
+        self.default_threshold = default_threshold
+        if weights is None:
+            weights = np.zeros((self.featurizer.n_features, len(self.tags)), dtype=np.float32)
+        if thresholds is None:
+            thresholds = np.full(len(self.tags), default_threshold, dtype=np.float32)
+        self.weights = weights
+        self.thresholds = thresholds
+        # Сколько раз обратная связь приносила теги, которых еще нет в словаре
+        self.unseen_tags = Counter(unseen_tags or {})
+
+    def add_tags(self, tags: Sequence[str]):
+        """Добавляет новые теги: нулевые столбцы весов и порог по умолчанию"""
+        new_tags = [tag for tag in dict.fromkeys(tags) if tag not in self.tag_index]
+        if not new_tags:
+            return
+        for tag in new_tags:
+            self.tag_index[tag] = len(self.tags)
+            self.tags.append(tag)
+        padding = np.zeros((self.weights.shape[0], len(new_tags)), dtype=np.float32)
+        # Смещение (признак 0) нового тега начинается с редкого априори, иначе первые
+        # же положительные примеры из обратной связи поднимут тег для любого текста
+        padding[0] = NEW_TAG_BIAS
+        self.weights = np.hstack((self.weights, padding))
+        self.thresholds = np.concatenate((self.thresholds,
+                                          np.full(len(new_tags), self.default_threshold, dtype=np.float32)))
+
+    def _targets(self, labels: Sequence[Sequence[str]]) -> np.ndarray:
+        targets = np.zeros((len(labels), len(self.tags)), dtype=np.float32)
+        for row, tags in enumerate(labels):
+            for tag in tags:
+                column = self.tag_index.get(tag)
+                if column is not None:
+                    targets[row, column] = 1.0
+        return targets
+
+    def partial_fit(self, texts: Sequence[str], labels: Sequence[Sequence[str]], learning_rate: float = 1.0) -> float:
+        """Инкрементальный шаг SGD; новый тег из labels добавляется, когда встретится TAG_MIN_COUNT раз,
+        до этого он не обучается. Возвращает потерю до шага."""
+        self.unseen_tags.update(tag for tags in labels for tag in dict.fromkeys(tags) if tag not in self.tag_index)
+        frequent = [tag for tag, count in self.unseen_tags.items() if count >= TAG_MIN_COUNT]
+        for tag in frequent:
+            del self.unseen_tags[tag]
+        self.add_tags(frequent)
+        batch = self.featurizer.transform(texts)
+        targets = self._targets(labels)
+        probabilities = _sigmoid(sparse_dot(batch, self.weights))
+        loss = _log_loss(probabilities, targets)
+        sparse_update(self.weights, batch, (probabilities - targets) / len(texts), learning_rate)
+        return loss
+
+    def fit(self, texts: Sequence[str], labels: Sequence[Sequence[str]], epochs: int = 40,
+            learning_rate: float = 4.0, batch_size: int = 16, min_count: int = TAG_MIN_COUNT, seed: int = 0) -> List[float]:
+        """Обучение с нуля; в словарь попадают теги, встретившиеся не реже min_count раз"""
+        counts = Counter(tag for tags in labels for tag in tags)
+        self.tags = []
+        self.tag_index = {}
+        self.weights = np.zeros((self.featurizer.n_features, 0), dtype=np.float32)
+        self.thresholds = np.zeros(0, dtype=np.float32)
+        self.unseen_tags = Counter()
+        self.add_tags([tag for tag, count in counts.most_common() if count >= min_count])
+        self.weights[0] = 0.0
+
+        featurized = [self.featurizer.transform([text]) for text in texts]
+        targets = self._targets(labels)
+        rng = np.random.default_rng(seed)
+        history = []
+
+        for epoch in range(epochs):
+            order = rng.permutation(len(texts))
+            rate = learning_rate / (1 + epoch * 0.1)
+            losses = []
+            for start in range(0, len(order), batch_size):
+                rows = order[start:start + batch_size]
+                batch = stack_batches([featurized[row] for row in rows])
+                probabilities = _sigmoid(sparse_dot(batch, self.weights))
+                losses.append(_log_loss(probabilities, targets[rows]))
+                sparse_update(self.weights, batch, (probabilities - targets[rows]) / len(rows), rate)
+            history.append(float(np.mean(losses)) if losses else 0.0)
+        return history
+
+    def tune_thresholds(self, texts: Sequence[str], labels: Sequence[Sequence[str]]) -> np.ndarray:
+        """Подбирает порог каждого тега по F1 на отложенных примерах (теги без примеров сохраняют порог)"""
+        if not texts:
+            return self.thresholds
+        probabilities = self.predict_proba(texts)
+        targets = self._targets(labels).astype(bool)
+
+        # Все пороги сетки сразу: (порог, пример, тег)
+        predicted = probabilities[None, :, :] >= THRESHOLD_GRID[:, None, None]
+        true_positive = (predicted & targets[None]).sum(axis=1)
+        false_positive = (predicted & ~targets[None]).sum(axis=1)
+        false_negative = (~predicted & targets[None]).sum(axis=1)
+        f1 = 2 * true_positive / np.maximum(2 * true_positive + false_positive + false_negative, 1)
+
+        seen = targets.any(axis=0)
+        best = THRESHOLD_GRID[np.argmax(f1, axis=0)]
+        self.thresholds = np.where(seen, best, self.thresholds).astype(np.float32)
+        return self.thresholds
+
+    def copy(self) -> 'TagPredictor':
+        """Независимая копия весов и порогов (признаки и их кеш общие)"""
+        return TagPredictor(self.featurizer, self.tags, self.weights.copy(), self.thresholds.copy(),
+                            self.default_threshold, self.unseen_tags)
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """Вероятности всех тегов для пачки текстов (n_texts x n_tags) одним матричным произведением"""
+        return _sigmoid(sparse_dot(self.featurizer.transform(texts), self.weights))
+
+    def predict(self, texts: Sequence[str], max_tags: int = 4) -> List[List[str]]:
+        """Теги выше своих порогов, по убыванию вероятности"""
+        return [tags for tags, _ in self.predict_scored(texts, max_tags)]
+
+    def predict_scored(self, texts: Sequence[str], max_tags: int = 4) -> List[Tuple[List[str], float]]:
+        """Теги и их средняя вероятность (0.0, если ни один тег не прошел порог)"""
+        if not self.tags:
+            return [([], 0.0) for _ in texts]
+        probabilities = self.predict_proba(texts)
+        results = []
+        for row in probabilities:
+            columns = np.flatnonzero(row >= self.thresholds)
+            columns = columns[np.argsort(-row[columns])][:max_tags]
+            confidence = float(row[columns].mean()) if len(columns) else 0.0
+            results.append(([self.tags[column] for column in columns], confidence))
+        return results
+
+    def save(self, path: str = TAG_MODEL_PATH):
+        """Атомарно сохраняет модель"""
+        tmp_path = path + '.tmp.npz'
+        config = {'featurizer': self.featurizer.config(), 'tags': self.tags,
+                  'default_threshold': self.default_threshold, 'unseen_tags': self.unseen_tags}
+        np.savez_compressed(tmp_path, weights=self.weights, thresholds=self.thresholds,
+                            config=np.array(json.dumps(config, ensure_ascii=False)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = TAG_MODEL_PATH) -> Optional['TagPredictor']:
+        """Загружает модель; None, если файла нет или он поврежден"""
+        try:
+            with np.load(path) as data:
+                config = json.loads(str(data['config']))
+                weights = data['weights'].astype(np.float32)
+                thresholds = data['thresholds'].astype(np.float32)
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            return None
+        return cls(HashedFeaturizer(**config['featurizer']), config['tags'], weights, thresholds,
+                   config.get('default_threshold', TAG_DEFAULT_THRESHOLD), config.get('unseen_tags'))
+
+    @classmethod
+    def load_or_train(cls, path: str, training_data: Sequence[Dict[str, Any]]) -> 'TagPredictor':
+        """Берет сохраненную модель, а если ее нет - обучает на данных обучения (без эталона
+        онлайн-дообучения) и сохраняет. Без размеченных тегов возвращает пустую модель."""
+        model = cls.load(path)
+        if model is not None:
+            return model
+
+        model = train_tag_predictor(reference_split(training_data)[0])
+        if model is None:
+            return cls()
+        try:
+            model.save(path)
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить модель тегов: {e}")
+        return model
+
+
+def _log_loss(probabilities: np.ndarray, targets: np.ndarray) -> float:
+    losses = targets * np.log(probabilities + 1e-9) + (1 - targets) * np.log(1 - probabilities + 1e-9)
+    return float(-losses.sum(axis=1).mean())
+
+
+def train_tag_predictor(training_data: Sequence[Dict[str, Any]], holdout: float = 0.2,
+                        epochs: int = 40) -> Optional[TagPredictor]:
+    """Пороги подбираются на отложенной части, затем веса переобучаются на всех примерах"""
+    texts, labels = tag_pairs(training_data)
+    if not texts:
+        return None
+
+    train, test = holdout_split(training_data, holdout)
+    train_texts, train_labels = tag_pairs(train)
+    test_texts, test_labels = tag_pairs(test)
+    model = TagPredictor()
+    model.fit(train_texts or texts, train_labels or labels, epochs=epochs)
+    model.tune_thresholds(test_texts, test_labels)
+    tuned = dict(zip(model.tags, model.thresholds))
+
+    model.fit(texts, labels, epochs=epochs)
+    model.thresholds = np.array([tuned.get(tag, model.default_threshold) for tag in model.tags], dtype=np.float32)
+    return model
@@ -0,0 +1,25 @@
+from datetime import date
+
+from date_grammar import DateTimeExtractor, day_anchors, due_date
+from field_confidence import FIELD_CONFIDENCE_THRESHOLD
+
+ANCHORS = day_anchors(date(2025, 10, 7))
+
+
+def _due(text):
+    return due_date(DateTimeExtractor().extract(text), ANCHORS)
+
+
+def test_explicit_day_with_default_time_is_not_escalated():
+    due, confidence = _due('завтра нужно отправить отчёт руководителю')
+    assert due == '2025-10-08 18:00'
+    assert confidence >= FIELD_CONFIDENCE_THRESHOLD
+
+
+def test_missing_date_is_escalated():
+    assert _due('нужно отправить отчёт руководителю')[1] < FIELD_CONFIDENCE_THRESHOLD
+    assert _due('в 15:00 позвонить маме')[1] < FIELD_CONFIDENCE_THRESHOLD
+
+
+def test_explicit_date_and_time():
+    assert _due('в пятницу в 7 вечера встреча') == ('2025-10-10 19:00', 0.81)
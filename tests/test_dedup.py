@@ -0,0 +1,59 @@
+import json
+
+from training_corpus import CorpusExample
+from training_store import TrainingStore
+from voicaj_trainer import VoicajTrainer
+
+
+def _example(text, task_type='task'):
+    return {'input': text, 'expected': [{'title': text, 'type': task_type, 'tags': ['дом']}],
+            'timestamp': '2025-10-06T12:00:00'}
+
+
+def _write_corpus(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    examples = [
+        _example('купить хлеб и молоко в магазине после работы вечером'),
+        _example('купить хлеб и молоко в магазине после работы вечером сегодня'),
+        _example('записаться к врачу на следующей неделе', 'task'),
+        _example('записаться к врачу на следующей неделе утром', 'meeting'),
+        _example('прочитать книгу про историю рима'),
+    ]
+    with open('voicaj_training_data.json', 'w', encoding='utf-8') as f:
+        json.dump(examples, f, ensure_ascii=False)
+    VoicajTrainer().build_corpus('voicaj_training_data.json', 'voicaj_training_data.corpus')
+    return examples
+
+
+def test_dedup_reads_built_corpus(tmp_path, monkeypatch):
+    examples = _write_corpus(tmp_path, monkeypatch)
+    store = TrainingStore('voicaj_training_data.json', corpus_path='voicaj_training_data.corpus')
+    assert isinstance(store.load()[0], CorpusExample)
+
+    VoicajTrainer().dedup('voicaj_training_data.json', 'dedup.json')
+
+    with open('dedup.json', 'r', encoding='utf-8') as f:
+        compacted = json.load(f)
+    inputs = [example['input'] for example in compacted]
+    assert len(compacted) == len(examples) - 1
+    assert 'купить хлеб и молоко в магазине после работы вечером' not in inputs
+    assert compacted[0]['expected'][0]['tags'] == ['дом']
+
+
+def test_dedup_in_place_with_built_corpus(tmp_path, monkeypatch):
+    examples = _write_corpus(tmp_path, monkeypatch)
+
+    VoicajTrainer().dedup('voicaj_training_data.json', in_place=True)
+
+    store = TrainingStore('voicaj_training_data.json', corpus_path='voicaj_training_data.corpus')
+    assert len(store.load()) == len(examples) - 1
+
+
+def test_replace_writes_corpus_examples(tmp_path, monkeypatch):
+    examples = _write_corpus(tmp_path, monkeypatch)
+    store = TrainingStore('voicaj_training_data.json', corpus_path='voicaj_training_data.corpus')
+
+    store.replace(store.load())
+
+    with open('voicaj_training_data.json', 'r', encoding='utf-8') as f:
+        assert json.load(f) == examples
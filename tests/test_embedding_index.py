@@ -0,0 +1,44 @@
+import numpy as np
+
+import embedding_index
+from embedding_index import EmbeddingIndex, SemanticSearch, inputs_hash
+
+
+def make_examples(texts):
+    return [{'input': text, 'expected': [{'type': 'task'}]} for text in texts]
+
+
+def random_vectors(count, dim=8):
+    vectors = np.random.default_rng(0).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_index_tracks_order_of_training_data(tmp_path):
+    path = str(tmp_path / 'index')
+    examples = make_examples(['купить молоко', 'встреча с клиентом', 'позвонить маме'])
+    EmbeddingIndex.build(path, random_vectors(3), 'model', 'flat', source=inputs_hash(examples, 3))
+
+    index = EmbeddingIndex.open(path)
+    assert index.matches(examples)
+    assert index.matches(examples + make_examples(['новый пример']))
+    # Сжатие журнала переставило примеры: позиции больше не совпадают
+    assert not index.matches([examples[1], examples[0], examples[2]])
+    assert not index.matches(examples[:2])
+
+    grown = examples + make_examples(['новый пример'])
+    index.append_to_file(random_vectors(1), inputs_hash(grown, 4))
+    reopened = EmbeddingIndex.open(path)
+    assert reopened.meta['rows'] == len(reopened) == 4
+    assert reopened.matches(grown)
+
+
+def test_search_is_disabled_on_mismatch(tmp_path, monkeypatch):
+    path = str(tmp_path / 'index')
+    examples = make_examples(['купить молоко', 'встреча с клиентом'])
+    EmbeddingIndex.build(path, random_vectors(2), 'model', 'flat', source=inputs_hash(examples, 2))
+
+    def fail_load(*args, **kwargs):
+        raise AssertionError('модель не должна загружаться')
+
+    monkeypatch.setattr(embedding_index.MeanPoolEmbedder, 'load', fail_load)
+    assert SemanticSearch.open(examples[::-1], path) is None
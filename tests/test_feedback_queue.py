@@ -0,0 +1,64 @@
+import pytest
+
+from feedback_queue import FeedbackQueue, FeedbackQueueFull
+
+TASK = {'type': 'task', 'title': 'Купить молоко', 'description': 'Зайти в магазин', 'tags': ['покупки'], 'priority': 'medium',
+        'dueDate': '2025-10-01 18:00'}
+
+
+class FakeStore:
+    def __init__(self):
+        self.examples = []
+
+    def append(self, example):
+        self.examples.append(example)
+
+
+class FakeLLM:
+    def __init__(self):
+        self.training_store = FakeStore()
+        self.added = []
+
+    def build_training_example(self, user_input, model_output, feedback):
+        return {'input': user_input, 'expected': model_output, 'feedback': feedback}
+
+    def add_training_example(self, example):
+        self.added.append(example)
+
+
+def test_job_status_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    llm = FakeLLM()
+    accepting = FeedbackQueue(llm, path)
+    polling = FeedbackQueue(FakeLLM(), path)
+
+    job_id = accepting.submit('купить молоко', [TASK], 'верно')
+    accepting._queue.join()
+
+    job = polling.get_job(job_id)
+    assert job['status'] == 'done' and job['progress'] == 1.0
+    assert llm.added and polling.get_job('missing') is None
+
+
+@pytest.mark.parametrize('obj', [{'type': 'unknown'}, dict(TASK, tags='работа'), dict(TASK, priority='urgent'),
+                                 dict(TASK, dueDate='завтра'), dict(TASK, title=' ')])
+def test_invalid_objects_fail(tmp_path, obj):
+    llm = FakeLLM()
+    feedback = FeedbackQueue(llm, str(tmp_path / 'jobs.db'))
+    job_id = feedback.submit('купить молоко', [obj], 'верно')
+    feedback._queue.join()
+
+    job = feedback.get_job(job_id)
+    assert job['status'] == 'failed' and job['error']
+    assert not llm.training_store.examples
+
+
+def test_full_queue_is_rejected(tmp_path):
+    feedback = FeedbackQueue(FakeLLM(), str(tmp_path / 'jobs.db'), max_queued=1)
+    feedback.start = lambda: None  # Воркер не запущен: очередь не разбирается
+    feedback.submit('купить молоко', [TASK], 'верно')
+    with pytest.raises(FeedbackQueueFull):
+        feedback.submit('купить хлеб', [TASK], 'верно')
+    conn = feedback._connect()
+    assert conn.execute('SELECT count(*) FROM feedback_jobs').fetchone()[0] == 1
+    conn.close()
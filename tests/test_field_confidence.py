@@ -0,0 +1,12 @@
+from field_confidence import retrieve_fields
+
+
+def test_retrieval_keeps_free_text_fields_out():
+    neighbour = {'input': 'найти работу в токио', 'expected': [{
+        'title': 'Поиск IT работы в Токио', 'type': 'goal', 'description': 'Найти работу в Токио',
+        'tags': ['работа', 'карьера'], 'priority': 'high'
+    }]}
+
+    found = retrieve_fields([(neighbour, 0.587)], 'goal', ['title', 'description', 'tags', 'priority'])
+
+    assert found == {'tags': (['работа', 'карьера'], 0.587), 'priority': ('high', 0.587)}
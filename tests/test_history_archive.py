@@ -0,0 +1,66 @@
+import sqlite3
+
+from history_archive import HistoryArchiver
+from history_shards import init_history_db
+
+
+def add_messages(db_path, rows):
+    conn = sqlite3.connect(db_path)
+    conn.executemany('INSERT INTO conversations (session_id, user_message, ai_response, timestamp) '
+                     'VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+
+def test_segment_is_written_outside_the_write_transaction(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'chat_history.db')
+    init_history_db(db_path)
+    add_messages(db_path, [('s1', f'старое {i}', '[]', '2020-01-0%d 10:00:00' % (i % 2 + 1)) for i in range(5)] +
+                 [('s1', 'новое', '[]', '2999-01-01 10:00:00')])
+    archiver = HistoryArchiver(db_path, str(tmp_path / 'archive'), pause=0, compression='gzip')
+
+    # Пока пишется архив, другой писатель должен сразу получать блокировку базы
+    append_rows = archiver._append_rows
+
+    def append_while_writing(path, rows):
+        append_rows(path, rows)
+        writer = sqlite3.connect(db_path, timeout=0, isolation_level=None)
+        try:
+            writer.execute('BEGIN IMMEDIATE')
+            writer.execute('ROLLBACK')
+        finally:
+            writer.close()
+
+    monkeypatch.setattr(archiver, '_append_rows', append_while_writing)
+    stats = archiver.archive_old_conversations()
+
+    assert stats['archived'] == 5
+    messages = archiver.load_archived_session('s1')
+    assert [row['user_message'] for row in messages] == ['старое 0', 'старое 2', 'старое 4', 'старое 1', 'старое 3']
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT user_message FROM conversations').fetchall() == [('новое',)]
+    assert conn.execute('SELECT SUM(message_count) FROM archive_index').fetchone()[0] == 5
+    conn.close()
+
+
+def test_rows_deleted_meanwhile_are_not_counted(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'chat_history.db')
+    init_history_db(db_path)
+    add_messages(db_path, [('s1', f'старое {i}', '[]', '2020-01-01 10:00:00') for i in range(3)])
+    archiver = HistoryArchiver(db_path, str(tmp_path / 'archive'), pause=0, compression='gzip')
+
+    append_rows = archiver._append_rows
+
+    def append_and_race(path, rows):
+        append_rows(path, rows)
+        conn = sqlite3.connect(db_path)
+        conn.execute('DELETE FROM conversations WHERE id = 1')
+        conn.commit()
+        conn.close()
+
+    monkeypatch.setattr(archiver, '_append_rows', append_and_race)
+    assert archiver.archive_old_conversations()['archived'] == 2
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT message_count FROM archive_index').fetchall() == [(2,)]
+    conn.close()
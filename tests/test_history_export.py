@@ -0,0 +1,43 @@
+import sqlite3
+
+import pytest
+
+from history_archive import HistoryArchiver
+from history_export import iter_export_records
+from history_shards import init_history_db
+
+
+def make_db(tmp_path, rows):
+    db_path = str(tmp_path / 'chat_history.db')
+    init_history_db(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executemany('INSERT INTO conversations (session_id, user_message, ai_response, timestamp) '
+                     'VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def test_invalid_bound_fails_before_streaming(tmp_path):
+    db_path = make_db(tmp_path, [])
+    with pytest.raises(ValueError):
+        iter_export_records([db_path], date_from='2025-13-01')
+
+
+def test_timezone_offset_is_converted_to_utc(tmp_path):
+    db_path = make_db(tmp_path, [('s', 'утро', '[]', '2025-10-01 05:30:00'),
+                                 ('s', 'день', '[]', '2025-10-01 06:30:00')])
+    records = iter_export_records([db_path], date_from='2025-10-01T09:00:00+03:00')
+    assert [record['user_message'] for record in records] == ['день']
+
+
+def test_archived_conversations_are_exported(tmp_path):
+    db_path = make_db(tmp_path, [('s', 'старое', '[{"type": "task"}]', '2020-01-01 10:00:00'),
+                                 ('s', 'новое', '[{"type": "task"}]', '2999-01-01 10:00:00')])
+    archive_dir = str(tmp_path / 'archive')
+    HistoryArchiver(db_path, archive_dir, pause=0, compression='gzip').archive_old_conversations()
+
+    records = iter_export_records([db_path], 'objects', archive_dir=archive_dir)
+    assert [record['user_message'] for record in records] == ['старое', 'новое']
+    records = iter_export_records([db_path], date_to='2020-01-01', archive_dir=archive_dir)
+    assert [record['user_message'] for record in records] == ['старое']
@@ -0,0 +1,68 @@
+import sqlite3
+
+from history_shards import HistoryShards, init_history_db, rebalance
+
+
+def insert(path, rows):
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO conversations (id, session_id, user_message, ai_response, timestamp) '
+                     'VALUES (?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+
+def all_rows(paths):
+    rows = []
+    for path in paths:
+        conn = sqlite3.connect(path)
+        rows += conn.execute('SELECT id, session_id, user_message FROM conversations').fetchall()
+        conn.close()
+    return sorted(rows)
+
+
+def sessions_for(shards, index, count):
+    return [f'сессия-{i}' for i in range(1000) if shards.shard_index(f'сессия-{i}') == index][:count]
+
+
+def test_rebalance_keeps_ids_and_is_idempotent(tmp_path):
+    base = str(tmp_path / 'chat_history.db')
+    init_history_db(base)
+    rows = [(i + 1, f'сессия-{i % 7}', f'сообщение {i}', '[]', '2025-10-01 10:00:00') for i in range(40)]
+    insert(base, rows)
+
+    rebalance(base, 1, 4)
+    shards = HistoryShards(base, 4)
+    assert all_rows(shards.all_paths()) == sorted(row[:3] for row in rows)
+
+    # Сбой после копии, до удаления: строки снова в исходной базе
+    insert(base, rows[:10])
+    stats = rebalance(base, 1, 4)
+    assert stats['renumbered'] == 0
+    assert all_rows(shards.all_paths()) == sorted(row[:3] for row in rows)
+    assert all_rows([base]) == []
+
+
+def test_colliding_id_gets_id_above_source_sequence(tmp_path):
+    base = str(tmp_path / 'chat_history.db')
+    old, new = HistoryShards(base, 2), HistoryShards(base, 3)
+    for path in old.all_paths():
+        init_history_db(path)
+    # Сессия остается в шарде 0, вторая переезжает из шарда 1 в шард 0 с тем же id
+    staying = [s for s in sessions_for(old, 0, 50) if new.shard_index(s) == 0][0]
+    moving = [s for s in sessions_for(old, 1, 50) if new.shard_index(s) == 0][0]
+    insert(old.shard_path(0), [(1, staying, 'остается', '[]', '2025-10-01 10:00:00')])
+    insert(old.shard_path(1), [(1, moving, 'переезжает', '[]', '2025-10-01 10:00:00'),
+                               (50, moving, 'архивное', '[]', '2025-10-01 10:00:00')])
+    conn = sqlite3.connect(old.shard_path(1))
+    conn.execute('DELETE FROM conversations WHERE id = 50')
+    conn.commit()
+    conn.close()
+
+    assert rebalance(base, 2, 3)['renumbered'] == 1
+    assert rebalance(base, 2, 3)['renumbered'] == 0
+    conn = sqlite3.connect(new.shard_path(0))
+    rows = conn.execute('SELECT id, session_id FROM conversations ORDER BY id').fetchall()
+    conn.close()
+    assert rows[0] == (1, staying)
+    assert rows[1][1] == moving and rows[1][0] > 50
+    assert len(rows) == 2
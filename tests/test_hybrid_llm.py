@@ -0,0 +1,43 @@
+import os
+import shutil
+
+import pytest
+
+import hybrid_voicaj_llm
+from hybrid_voicaj_llm import HybridVoicajLLM
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def analyzer(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('hybrid')
+    for name in ('voicaj_training_data.json', 'voicaj_templates.json'):
+        shutil.copy(os.path.join(ROOT, name), workdir / name)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        yield HybridVoicajLLM()
+    finally:
+        os.chdir(cwd)
+
+
+def test_llm_init_failure_is_cached_and_outside_admission(analyzer, monkeypatch):
+    calls = []
+
+    def offline(model_name):
+        calls.append(analyzer.llm_admission.running)
+        raise OSError('нет сети')
+
+    monkeypatch.setattr(hybrid_voicaj_llm.AutoTokenizer, 'from_pretrained', offline)
+    analyzer._llm_init_failed_at = None
+
+    assert analyzer._generate('User: тест\n\nAssistant: ', 10, 1.3) is None
+    assert analyzer._generate('User: тест\n\nAssistant: ', 10, 1.3) is None
+    assert calls == [0]
+    assert analyzer.llm_admission.stats()['admitted'] == 0
+
+    # После паузы LLM_INIT_RETRY_SECONDS загрузка пробуется снова
+    analyzer._llm_init_failed_at -= hybrid_voicaj_llm.LLM_INIT_RETRY_SECONDS + 1
+    assert analyzer._generate('User: тест\n\nAssistant: ', 10, 1.3) is None
+    assert calls == [0, 0]
@@ -0,0 +1,62 @@
+import os
+from datetime import datetime
+
+import torch
+
+from distillation import analysis_prompt
+from lm_finetune import TINY_MODEL_ID, ByteTokenizer, build_tiny_model, finetune, format_example, load_adapter
+
+EXAMPLES = [
+    {'input': 'завтра купить хлеб', 'expected': [{'title': 'Купить хлеб', 'type': 'task', 'tags': ['покупки'],
+                                                  'priority': 'medium', 'dueDate': '2025-10-08 18:00'}]},
+    {'input': 'хочу бегать по утрам', 'expected': [{'title': 'Утренний бег', 'type': 'habit', 'tags': ['спорт'],
+                                                    'priority': 'medium'}]},
+    {'input': 'без ответа'},
+]
+
+
+def _finetune(tmp_path, steps, resume=True):
+    return finetune(build_tiny_model(), ByteTokenizer(), EXAMPLES, str(tmp_path / 'adapter.pt'),
+                    str(tmp_path / 'checkpoints'), TINY_MODEL_ID, steps=steps, micro_batch=2, grad_accum=2,
+                    rank=4, max_length=512, checkpoint_every=1, log_every=1, resume=resume)
+
+
+def test_finetune_tiny_model_end_to_end(tmp_path):
+    stats = _finetune(tmp_path, steps=2)
+
+    assert os.path.exists(tmp_path / 'adapter.pt')
+    assert os.path.exists(tmp_path / 'checkpoints' / 'checkpoint.pt')
+    assert stats['steps'] == 2 and stats['total_steps'] == 2
+    assert stats['examples'] == 8
+    assert stats['examples_per_second'] > 0 and stats['tokens_per_second'] > 0
+    assert stats['first_loss'] > 0 and stats['last_loss'] > 0
+    assert stats['trainable_parameters'] > 0
+
+
+def test_finetune_resumes_from_checkpoint(tmp_path):
+    _finetune(tmp_path, steps=2)
+    checkpoint = torch.load(tmp_path / 'checkpoints' / 'checkpoint.pt', weights_only=False)
+    assert checkpoint['step'] == 2
+
+    stats = _finetune(tmp_path, steps=3)
+
+    assert stats['steps'] == 1 and stats['total_steps'] == 3
+    assert stats['last_loss'] is not None
+    assert torch.load(tmp_path / 'checkpoints' / 'checkpoint.pt', weights_only=False)['step'] == 3
+
+
+def test_adapter_loads_only_for_its_base_model(tmp_path):
+    _finetune(tmp_path, steps=1)
+
+    assert load_adapter(build_tiny_model(), str(tmp_path / 'adapter.pt'), TINY_MODEL_ID)['rank'] == 4
+    assert load_adapter(build_tiny_model(), str(tmp_path / 'adapter.pt'), 'other-model') is None
+
+
+def test_examples_use_the_serving_prompt():
+    example = dict(EXAMPLES[1], timestamp='2025-10-07T12:00:00')
+    prompt, completion = format_example(example)
+
+    # Промпт llm_analysis с заглушками, потеря - только на продолжении после них
+    assert prompt == analysis_prompt(example['input'], ['habit'], datetime(2025, 10, 7, 12))
+    assert prompt.endswith('}') and '"New habit"' in prompt
+    assert completion.startswith('\n\n{') and 'Утренний бег' in completion
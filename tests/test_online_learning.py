@@ -0,0 +1,89 @@
+import json
+
+from online_learning import OnlineLearner
+from type_classifier import TypeClassifier, reference_split
+
+
+class FakeModel:
+    def __init__(self, quality):
+        self.quality = quality
+
+    def copy(self):
+        return FakeModel(self.quality)
+
+    def partial_fit(self, texts, labels, learning_rate):
+        pass
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'quality': self.quality}, f)
+
+
+class FakeLLM:
+    def __init__(self):
+        self.type_classifier = FakeModel(0.8)
+        self.tag_predictor = FakeModel(0.8)
+        self.priority_classifier = FakeModel(0.8)
+
+
+def make_learner(tmp_path, llm):
+    learner = OnlineLearner(llm, [], writer_lock_path=str(tmp_path / 'models.lock'))
+    for slot in learner.slots:
+        slot.reference = (['текст'], [['task']])
+        slot.metric = lambda model, texts, labels: model.quality
+        slot.path = str(tmp_path / f'{slot.name}.json')
+        slot.loader = lambda path: FakeModel(json.load(open(path))['quality'])
+        slot.best = 0.8
+        slot.mtime = 0.0
+    return learner
+
+
+def test_drift_is_bounded_by_best_score(tmp_path):
+    llm = FakeLLM()
+    learner = make_learner(tmp_path, llm)
+    slot = learner.slots[0]
+
+    promoted = []
+    for quality in (0.79, 0.78, 0.77, 0.76):
+        slot.candidate = FakeModel(quality)
+        slot.pending = 1
+        promoted.append(learner._evaluate(slot)['promoted'])
+
+    # Каждый шаг в пределах tolerance от текущей модели, но не от лучшей
+    assert promoted == [True, True, False, False]
+    assert llm.type_classifier.quality == 0.78
+    assert slot.best == 0.8
+
+
+def test_reference_examples_are_not_trained_on(tmp_path, monkeypatch):
+    data = [{'input': f'купить молоко {i}', 'expected': [{'type': 'task'}]} for i in range(100)]
+    _, reference = reference_split(data)
+    assert reference
+
+    seen = []
+    monkeypatch.setattr(TypeClassifier, 'fit', lambda self, texts, labels, **kwargs: seen.extend(texts))
+    monkeypatch.setattr(TypeClassifier, 'save', lambda self, path: None)
+    TypeClassifier.load_or_train(str(tmp_path / 'missing.npz'), data)
+    assert seen and not set(seen) & {example['input'] for example in reference}
+
+    learner = make_learner(tmp_path, FakeLLM())
+    learner.learn(reference[0])
+    assert all(slot.pending == 0 for slot in learner.slots)
+
+
+def test_only_writer_checkpoints(tmp_path):
+    writer_llm, reader_llm = FakeLLM(), FakeLLM()
+    writer = make_learner(tmp_path, writer_llm)
+    reader = make_learner(tmp_path, reader_llm)
+
+    for learner, quality in ((writer, 0.85), (reader, 0.9)):
+        slot = learner.slots[0]
+        slot.candidate = FakeModel(quality)
+        slot.pending = 1
+        learner._evaluate(slot)
+
+    assert writer.checkpoint() == [writer.slots[0].path]
+    assert reader.checkpoint() == []
+    assert writer.reload_changed() == []
+    assert reader.reload_changed() == ['types']
+    assert reader_llm.type_classifier.quality == 0.85
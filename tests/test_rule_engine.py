@@ -0,0 +1,46 @@
+import pytest
+
+from rule_engine import (
+    RuleEngine, TAG_KEYWORDS, PRIORITY_KEYWORDS, MOOD_PATTERNS, HABIT_PATTERNS, GOAL_PATTERNS, TASK_PATTERNS
+)
+from russian_stemmer import StemTable, stem_phrase, stem_text
+
+TABLES = [*TAG_KEYWORDS.values(), *PRIORITY_KEYWORDS.values(), MOOD_PATTERNS, HABIT_PATTERNS, GOAL_PATTERNS,
+          TASK_PATTERNS]
+
+
+@pytest.fixture(scope='module')
+def rules():
+    return RuleEngine.build([])
+
+
+@pytest.mark.parametrize('keywords', TABLES)
+def test_keyword_tables_have_no_redundant_forms(keywords):
+    phrases = [stem_phrase(keyword) for keyword in keywords]
+    for i, phrase in enumerate(phrases):
+        for j, other in enumerate(phrases):
+            if i != j:
+                assert not any(phrase[k:k + len(other)] == other for k in range(len(phrase) - len(other) + 1)), \
+                    (keywords[i], keywords[j])
+
+
+def test_context_rules_match_word_forms(rules):
+    assert rules.detect_types('очень нервничаю перед экзаменом') == ['mood_entry']
+    assert rules.detect_types('очень нервничаю, завтра экзамен') == ['mood_entry']
+    assert rules.detect_types('подготовка к собеседованию') == ['task']
+    assert rules.extract_priority_scored('сдать проект до пятницы') == ('high', 0.5)
+
+
+def test_context_rules_do_not_match_inside_words(rules):
+    # 'до' внутри 'командой' больше не считается дедлайном
+    assert rules.extract_priority_scored('очень радуюсь успеху проекта и горжусь командой') == ('medium', 0.5)
+    assert rules.extract_tags_scored([], 'поставь будильник к завтрашнему дню')[0] == ['задача']
+
+
+def test_keywords_do_not_match_prepositions(rules):
+    # 'надо' не сводится к основе предлога 'над'
+    table = StemTable.from_table(PRIORITY_KEYWORDS)
+    assert table.first_label(stem_text('подумать над дизайном')) != 'high'
+    assert table.first_label(stem_text('поработать над проектом')) != 'high'
+    assert table.first_label(stem_text('надо позвонить врачу')) == 'high'
+    assert rules.extract_priority_scored('подумать над дизайном')[0] != 'high'
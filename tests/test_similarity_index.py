@@ -0,0 +1,40 @@
+import threading
+
+from similarity_index import TfidfIndex
+
+TEXTS = [f'купить {word} в магазине номер {i}' for i, word in enumerate(['молоко', 'хлеб', 'сыр', 'масло'] * 50)]
+
+
+def test_queries_stay_consistent_while_adding():
+    index = TfidfIndex(TEXTS[:20])
+    errors = []
+
+    def read():
+        try:
+            for i in range(300):
+                for doc, score in index.query(TEXTS[i % len(TEXTS)], k=3, min_score=0.0):
+                    assert 0 <= doc < len(index) and score <= 1.0 + 1e-5
+                index.query_batch(TEXTS[:5], k=2)
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    for text in TEXTS[20:]:
+        index.add(text)
+    for thread in readers:
+        thread.join()
+
+    assert not errors
+    assert index.query(TEXTS[-1], k=3) == TfidfIndex(TEXTS).query(TEXTS[-1], k=3)
+
+
+def test_reset_replaces_documents():
+    index = TfidfIndex(['встреча с клиентом', 'купить хлеб'])
+    assert index.query('купить хлеб', k=1)[0][0] == 1
+
+    index.reset(['купить хлеб'])
+    assert len(index) == 1
+    assert index.query('купить хлеб', k=1)[0][0] == 0
+    assert index.query('встреча с клиентом', k=1) == []
@@ -0,0 +1,22 @@
+from tag_predictor import TagPredictor, example_tags
+
+
+def test_string_tags_are_not_split_into_letters():
+    example = {'input': 'сдать отчет', 'expected': [{'type': 'task', 'tags': 'работа'},
+                                                    {'type': 'task', 'tags': ['отчет', 'работа']}]}
+    assert example_tags(example) == ['отчет', 'работа']
+
+
+def test_feedback_adds_tag_after_min_count(tmp_path):
+    model = TagPredictor()
+    model.fit(['купить молоко', 'купить хлеб'], [['покупки'], ['покупки']], epochs=1)
+
+    model.partial_fit(['сдать отчет'], [['работа']])
+    assert model.tags == ['покупки'] and model.weights.shape[1] == 1
+
+    path = str(tmp_path / 'tags.npz')
+    model.copy().save(path)
+    model = TagPredictor.load(path)
+    model.partial_fit(['написать письмо'], [['работа']])
+    assert model.tags == ['покупки', 'работа'] and model.weights.shape[1] == 2
+    assert not model.unseen_tags
@@ -0,0 +1,65 @@
+from training_store import TrainingStore
+
+
+def example(text):
+    return {'input': text, 'expected': [{'type': 'task', 'title': text}]}
+
+
+def inputs(examples):
+    return [item['input'] for item in examples]
+
+
+def make_stores(tmp_path):
+    # Два процесса с общими файлами: у каждого свое состояние чтения журнала
+    path = str(tmp_path / 'training.json')
+    first, second = TrainingStore(path), TrainingStore(path)
+    first.load()
+    second.load()
+    return first, second
+
+
+def test_append_is_seen_by_other_process(tmp_path):
+    first, second = make_stores(tmp_path)
+    assert second.poll_changes() == []
+
+    first.append(example('купить молоко'))
+    first.append(example('позвонить маме'))
+    assert inputs(second.poll_changes()) == ['купить молоко', 'позвонить маме']
+    assert second.poll_changes() == []
+
+
+def test_poll_reads_rotated_tail_after_compaction(tmp_path):
+    first, second = make_stores(tmp_path)
+    first.append(example('купить молоко'))
+    assert inputs(second.poll_changes()) == ['купить молоко']
+
+    # Хвост, который второй процесс еще не прочитал, уходит в .prev при сжатии
+    first.append(example('позвонить маме'))
+    first.compact()
+    first.append(example('сдать отчет'))
+
+    assert inputs(second.poll_changes()) == ['позвонить маме', 'сдать отчет']
+    assert second.poll_changes() == []
+    assert inputs(second.load()) == ['купить молоко', 'позвонить маме', 'сдать отчет']
+
+
+def test_two_compactions_require_full_reload(tmp_path):
+    first, second = make_stores(tmp_path)
+    first.append(example('купить молоко'))
+    first.compact()
+    first.append(example('позвонить маме'))
+    first.compact()
+
+    assert second.poll_changes() is None
+    assert inputs(second.load()) == ['купить молоко', 'позвонить маме']
+    assert second.poll_changes() == []
+
+
+def test_own_records_are_not_returned(tmp_path):
+    first, second = make_stores(tmp_path)
+    second.append(example('мой пример'))
+    first.append(example('чужой пример'))
+
+    assert inputs(second.poll_changes()) == ['чужой пример']
+    assert inputs(first.poll_changes()) == ['мой пример']
+    assert second.poll_changes() == [] and first.poll_changes() == []
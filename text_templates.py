@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+from collections import namedtuple
+from typing import Any, Dict, List, Sequence
+
+from russian_stemmer import StemTable, stem_text
+
+# Таблица шаблонов заголовков и описаний: правится без изменения кода, читается при запуске
+TEMPLATES_PATH = 'voicaj_templates.json'
+
+# Заголовок и описание для типа, которого нет в таблице
+DEFAULT_TITLE = 'Запись'
+DEFAULT_DESCRIPTION = 'Описание: {text}'
+
+# Слоты, доступные в шаблонах: {text} - исходный текст запроса
+TEMPLATE_SLOTS = ('text',)
+
+# Результат подстановки: matched - сработало ли правило (иначе это заглушка default)
+Rendered = namedtuple('Rendered', ['text', 'matched'])
+
+
+def _check_template(template: Any, where: str) -> str:
+    """Шаблон - строка, в которой только известные слоты"""
+    if not isinstance(template, str) or not template.strip():
+        raise ValueError(f"{where}: шаблон должен быть непустой строкой")
+    try:
+        template.format_map({slot: '' for slot in TEMPLATE_SLOTS})
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"{where}: неизвестный слот или ошибка в шаблоне {template!r} ({e})") from e
+    return template
+
+
+class TemplateIndex:
+    """Правила одного поля одного типа: триггеры -> шаблон.
+
+    Правило срабатывает, когда в запросе есть каждая его группа триггеров ('a|b' -
+    любое из слов группы); из сработавших выигрывает первое по порядку таблицы.
+    Группы всех правил сведены к основам в одну StemTable, поэтому поиск - один
+    проход по основам запроса, и стоит он O(совпадений), а не O(правил).
+    """
+
+    def __init__(self, rules: Sequence[Dict[str, Any]], default: str, where: str = ''):
+        self.default = _check_template(default, f"{where}.default")
+        self.templates: List[str] = []
+        self._needed: List[int] = []
+        self._group_rule: List[int] = []
+        groups = []
+        for number, rule in enumerate(rules):
+            place = f"{where}.rules[{number}]"
+            when = rule.get('when') if isinstance(rule, dict) else None
+            if not isinstance(when, list) or not when or not all(isinstance(group, str) for group in when):
+                raise ValueError(f"{place}: 'when' должен быть непустым списком строк")
+            self.templates.append(_check_template(rule.get('template'), place))
+            self._needed.append(len(when))
+            for group in when:
+                self._group_rule.append(number)
+                groups.append((len(groups), [word.strip() for word in group.split('|') if word.strip()]))
+        self.table = StemTable.from_table(dict(groups))
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def match(self, stems: Sequence[str]) -> int:
+        """Номер первого сработавшего правила или -1"""
+        hits: Dict[int, int] = {}
+        for group in self.table.matches(stems):
+            rule = self._group_rule[group]
+            hits[rule] = hits.get(rule, 0) + 1
+        matched = [rule for rule, count in hits.items() if count == self._needed[rule]]
+        return min(matched) if matched else -1
+
+    def render(self, text: str) -> Rendered:
+        """Шаблон первого сработавшего правила (или default) с подставленными слотами"""
+        rule = self.match(stem_text(text.lower()))
+        template = self.templates[rule] if rule >= 0 else self.default
+        return Rendered(template.format_map({'text': text}), rule >= 0)
+
+
+class TemplateTable:
+    """Шаблоны заголовков и описаний по типам объектов (см. voicaj_templates.json)"""
+
+    def __init__(self, titles: Dict[str, TemplateIndex], descriptions: Dict[str, TemplateIndex]):
+        self.titles = titles
+        self.descriptions = descriptions
+        self._default_title = TemplateIndex([], DEFAULT_TITLE)
+        self._default_description = TemplateIndex([], DEFAULT_DESCRIPTION)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TemplateTable':
+        """Собирает индексы из разобранного JSON; ошибка в таблице - ValueError с местом ошибки"""
+        sections = []
+        for section in ('titles', 'descriptions'):
+            by_type = data.get(section, {}) if isinstance(data, dict) else None
+            if not isinstance(by_type, dict):
+                raise ValueError(f"{section}: ожидается объект тип -> правила")
+            indexes = {}
+            for task_type, entry in by_type.items():
+                where = f"{section}.{task_type}"
+                if not isinstance(entry, dict):
+                    raise ValueError(f"{where}: ожидается объект с 'default' и 'rules'")
+                indexes[task_type] = TemplateIndex(entry.get('rules', []), entry.get('default'), where)
+            sections.append(indexes)
+        return cls(*sections)
+
+    @classmethod
+    def load(cls, path: str = TEMPLATES_PATH) -> 'TemplateTable':
+        """Загружает таблицу; без файла остаются только общие заглушки"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            print(f"⚠️ Таблица шаблонов {path} не найдена, используются заглушки")
+            return cls({}, {})
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: некорректный JSON ({e})") from e
+        try:
+            return cls.from_dict(data)
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}") from e
+
+    def __len__(self) -> int:
+        return sum(len(index) for index in self.titles.values()) + \
+            sum(len(index) for index in self.descriptions.values())
+
+    def title(self, text: str, task_type: str) -> Rendered:
+        return self.titles.get(task_type, self._default_title).render(text)
+
+    def description(self, text: str, task_type: str) -> Rendered:
+        return self.descriptions.get(task_type, self._default_description).render(text)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Проверка таблицы шаблонов и покрытие на примерах обучения")
+    parser.add_argument("--templates", default=TEMPLATES_PATH, help="Файл таблицы шаблонов")
+    parser.add_argument("--data", default="voicaj_training_data.json", help="Снимок данных обучения")
+    parser.add_argument("--repeat", type=int, default=20, help="Повторов для замера")
+    args = parser.parse_args()
+
+    table = TemplateTable.load(args.templates)
+    print(f"✅ {args.templates}: {len(table)} правил")
+
+    from training_store import TrainingStore
+    labeled = [(example['input'], example['expected'][0]['type']) for example in TrainingStore(args.data).load()
+               if example.get('input') and example.get('expected') and example['expected'][0].get('type')]
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        titles = [table.title(text, task_type) for text, task_type in labeled]
+        descriptions = [table.description(text, task_type) for text, task_type in labeled]
+    elapsed_us = (time.perf_counter() - start) * 1e6 / args.repeat / max(len(labeled), 1)
+
+    print(f"⏱️ Заголовок и описание: {elapsed_us:.1f} мкс/текст на {len(labeled)} примерах")
+    print(f"🎯 Сработал шаблон: заголовок {sum(t.matched for t in titles) / max(len(titles), 1):.1%}, "
+          f"описание {sum(d.matched for d in descriptions) / max(len(descriptions), 1):.1%}")
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import io
+import json
+import mmap
+import struct
+import hashlib
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import List, Dict, Any, Optional, Iterator
+
+# Fix console encoding for Windows
+if sys.platform.startswith('win'):
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+CORPUS_MAGIC = b'VCJCORP1'
+CORPUS_VERSION = 1
+NONE = 0xFFFFFFFF  # Отсутствующее значение в u32 полях
+
+# Заголовок: magic, версия, число секций, хеш исходного снимка
+_HEADER = struct.Struct('<8sII32s')
+# Таблица секций: имя, смещение, длина в байтах
+_SECTION = struct.Struct('<8sQQ')
+
+# Поля примера и объекта, хранящиеся в колонках; остальные - в extra (JSON)
+_EXAMPLE_FIELDS = ('input', 'expected', 'feedback', 'timestamp')
+_OBJECT_FIELDS = ('title', 'type', 'description', 'tags', 'priority', 'dueDate')
+_EXAMPLE_RECORD = 6  # input, feedback, timestamp, obj_start, obj_count, extra
+_OBJECT_RECORD = 8   # type, title, description, priority, dueDate, tag_start, tag_count, extra
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Токенизация для корпуса: слова в нижнем регистре"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def source_hash(path: str) -> bytes:
+    """Хеш содержимого снимка обучения (без разбора JSON)"""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+class _StringPool:
+    """Пул строк с интернированием: одинаковые строки хранятся один раз"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.data = bytearray()
+        self.offsets = array('I', [0])
+
+    def add(self, value: Optional[str]) -> int:
+        if value is None:
+            return NONE
+        sid = self.ids.get(value)
+        if sid is None:
+            sid = len(self.offsets) - 1
+            self.ids[value] = sid
+            self.data += value.encode('utf-8')
+            self.offsets.append(len(self.data))
+        return sid
+
+
+class _Vocab:
+    """Словарь значений (типы, теги, приоритеты, токены) -> номера"""
+
+    def __init__(self, pool: _StringPool):
+        self.pool = pool
+        self.ids: Dict[str, int] = {}
+        self.sids = array('I')
+
+    def add(self, value: Any) -> int:
+        if value is None:
+            return NONE
+        value = str(value)
+        index = self.ids.get(value)
+        if index is None:
+            index = len(self.sids)
+            self.ids[value] = index
+            self.sids.append(self.pool.add(value))
+        return index
+
+
+def build_corpus(examples: List[Dict[str, Any]], path: str, snapshot_hash: bytes = b'\0' * 32) -> Dict[str, int]:
+    """Собирает бинарный колоночный корпус и атомарно записывает его в path"""
+    pool = _StringPool()
+    types, tags, priorities, tokens = _Vocab(pool), _Vocab(pool), _Vocab(pool), _Vocab(pool)
+    example_records, object_records = array('I'), array('I')
+    object_tags, token_offsets, token_ids = array('I'), array('I', [0]), array('I')
+
+    def extra_sid(item: Dict[str, Any], fields) -> int:
+        extra = {key: value for key, value in item.items() if key not in fields}
+        return pool.add(json.dumps(extra, ensure_ascii=False)) if extra else NONE
+
+    for example in examples:
+        expected = example.get('expected')
+        objects = expected if isinstance(expected, list) else []
+        obj_start = len(object_records) // _OBJECT_RECORD if 'expected' in example else NONE
+
+        for obj in objects:
+            obj_tags = obj.get('tags')
+            tag_start = len(object_tags) if isinstance(obj_tags, list) else NONE
+            for tag in obj_tags if isinstance(obj_tags, list) else []:
+                object_tags.append(tags.add(tag))
+            object_records.extend([
+                types.add(obj.get('type')),
+                pool.add(obj.get('title')),
+                pool.add(obj.get('description')),
+                priorities.add(obj.get('priority')),
+                pool.add(obj.get('dueDate')),
+                tag_start,
+                len(obj_tags) if isinstance(obj_tags, list) else 0,
+                extra_sid(obj, _OBJECT_FIELDS)
+            ])
+
+        example_records.extend([
+            pool.add(example.get('input')),
+            pool.add(example.get('feedback')),
+            pool.add(example.get('timestamp')),
+            obj_start,
+            len(objects),
+            extra_sid(example, _EXAMPLE_FIELDS)
+        ])
+
+        token_ids.extend(tokens.add(token) for token in tokenize(example.get('input', '')))
+        token_offsets.append(len(token_ids))
+
+    sections = [
+        (b'strpool ', bytes(pool.data)),
+        (b'stroffs ', pool.offsets.tobytes()),
+        (b'examples', example_records.tobytes()),
+        (b'objects ', object_records.tobytes()),
+        (b'objtags ', object_tags.tobytes()),
+        (b'types   ', types.sids.tobytes()),
+        (b'tags    ', tags.sids.tobytes()),
+        (b'prios   ', priorities.sids.tobytes()),
+        (b'tokens  ', tokens.sids.tobytes()),
+        (b'tokoffs ', token_offsets.tobytes()),
+        (b'tokids  ', token_ids.tobytes()),
+    ]
+
+    # Секции выравниваются на 8 байт, чтобы u32 массивы читались без копирования
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    table, layout = [], []
+    for name, data in sections:
+        offset += -offset % 8
+        table.append(_SECTION.pack(name, offset, len(data)))
+        layout.append((offset, data))
+        offset += len(data)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(CORPUS_MAGIC, CORPUS_VERSION, len(sections), snapshot_hash))
+        f.write(b''.join(table))
+        for section_offset, data in layout:
+            f.write(b'\0' * (section_offset - f.tell()))
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    return {"examples": len(examples), "objects": len(object_records) // _OBJECT_RECORD,
+            "strings": len(pool.offsets) - 1, "tokens": len(tokens.sids), "bytes": offset}
+
+
+class CorpusExample(Mapping):
+    """Пример обучения из корпуса; поля декодируются лениво при обращении"""
+
+    __slots__ = ('_corpus', '_index', '_cache')
+
+    def __init__(self, corpus: 'MappedCorpus', index: int):
+        self._corpus = corpus
+        self._index = index
+        self._cache = None
+
+    def _fields(self) -> Dict[str, Any]:
+        if self._cache is None:
+            self._cache = self._corpus._decode_example(self._index)
+        return self._cache
+
+    def __getitem__(self, key):
+        if key == 'input' and self._cache is None:
+            value = self._corpus.input(self._index)
+            if value is not None:
+                return value
+        return self._fields()[key]
+
+    def __iter__(self):
+        return iter(self._fields())
+
+    def __len__(self):
+        return len(self._fields())
+
+    def __contains__(self, key):
+        if key == 'input' and self._cache is None:
+            return self._corpus.input(self._index) is not None
+        return key in self._fields()
+
+
+class MappedCorpus(Sequence):
+    """Корпус обучения, открытый через mmap: одна копия в page cache на все процессы"""
+
+    def __init__(self, path: str):
+        if sys.byteorder != 'little':
+            raise ValueError("Формат корпуса рассчитан на little-endian")
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, version, section_count, self.source_hash = _HEADER.unpack_from(self._mmap, 0)
+        if magic != CORPUS_MAGIC or version != CORPUS_VERSION:
+            raise ValueError(f"{path}: неподдерживаемый формат корпуса")
+
+        sections = {}
+        for i in range(section_count):
+            name, offset, length = _SECTION.unpack_from(self._mmap, _HEADER.size + i * _SECTION.size)
+            sections[name.decode('ascii').strip()] = view[offset:offset + length]
+
+        self._pool = sections['strpool']
+        self._string_offsets = sections['stroffs'].cast('I')
+        self._examples = sections['examples'].cast('I')
+        self._objects = sections['objects'].cast('I')
+        self._object_tags = sections['objtags'].cast('I')
+        self._token_offsets = sections['tokoffs'].cast('I')
+        self._token_ids = sections['tokids'].cast('I')
+
+        # Небольшие словари декодируем сразу
+        self.types = [self.string(sid) for sid in sections['types'].cast('I')]
+        self.tags = [self.string(sid) for sid in sections['tags'].cast('I')]
+        self.priorities = [self.string(sid) for sid in sections['prios'].cast('I')]
+        self._token_sids = sections['tokens'].cast('I')
+
+    def string(self, sid: int) -> Optional[str]:
+        """Строка из пула по номеру"""
+        if sid == NONE:
+            return None
+        return bytes(self._pool[self._string_offsets[sid]:self._string_offsets[sid + 1]]).decode('utf-8')
+
+    def __len__(self) -> int:
+        return len(self._examples) // _EXAMPLE_RECORD
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return CorpusExample(self, index)
+
+    def input(self, index: int) -> Optional[str]:
+        """Текст запроса примера без декодирования остальных полей"""
+        return self.string(self._examples[index * _EXAMPLE_RECORD])
+
+    def token_ids(self, index: int) -> memoryview:
+        """Предвычисленные номера токенов запроса (без копирования)"""
+        return self._token_ids[self._token_offsets[index]:self._token_offsets[index + 1]]
+
+    def token(self, token_id: int) -> str:
+        return self.string(self._token_sids[token_id])
+
+    @property
+    def token_count(self) -> int:
+        return len(self._token_sids)
+
+    def _decode_object(self, index: int) -> Dict[str, Any]:
+        base = index * _OBJECT_RECORD
+        type_id, title, description, priority_id, due_date, tag_start, tag_count, extra = \
+            self._objects[base:base + _OBJECT_RECORD]
+        obj: Dict[str, Any] = {}
+        if title != NONE:
+            obj['title'] = self.string(title)
+        if type_id != NONE:
+            obj['type'] = self.types[type_id]
+        if description != NONE:
+            obj['description'] = self.string(description)
+        if tag_start != NONE:
+            obj['tags'] = [self.tags[tag_id] for tag_id in self._object_tags[tag_start:tag_start + tag_count]]
+        if priority_id != NONE:
+            obj['priority'] = self.priorities[priority_id]
+        if due_date != NONE:
+            obj['dueDate'] = self.string(due_date)
+        if extra != NONE:
+            obj.update(json.loads(self.string(extra)))
+        return obj
+
+    def _decode_example(self, index: int) -> Dict[str, Any]:
+        base = index * _EXAMPLE_RECORD
+        input_sid, feedback, timestamp, obj_start, obj_count, extra = self._examples[base:base + _EXAMPLE_RECORD]
+        example: Dict[str, Any] = {}
+        if input_sid != NONE:
+            example['input'] = self.string(input_sid)
+        if obj_start != NONE:
+            example['expected'] = [self._decode_object(obj_start + i) for i in range(obj_count)]
+        if feedback != NONE:
+            example['feedback'] = self.string(feedback)
+        if timestamp != NONE:
+            example['timestamp'] = self.string(timestamp)
+        if extra != NONE:
+            example.update(json.loads(self.string(extra)))
+        return example
+
+
+class CorpusList(Sequence):
+    """Неизменяемый корпус из mmap плюс примеры, добавленные после его сборки"""
+
+    def __init__(self, corpus: MappedCorpus, extra: Optional[List[Dict[str, Any]]] = None):
+        self.corpus = corpus
+        self.extra = list(extra or [])
+
+    def __len__(self) -> int:
+        return len(self.corpus) + len(self.extra)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < len(self.corpus):
+            return self.corpus[index]
+        return self.extra[index - len(self.corpus)]
+
+    def __iter__(self) -> Iterator:
+        yield from self.corpus
+        yield from self.extra
+
+    def append(self, example: Dict[str, Any]):
+        self.extra.append(example)
+
+    def extend(self, examples):
+        self.extra.extend(examples)
+
+
+def open_corpus(corpus_path: str, snapshot_path: str) -> Optional[MappedCorpus]:
+    """Открывает корпус, если он собран из текущего снимка; иначе None"""
+    if not os.path.exists(corpus_path) or not os.path.exists(snapshot_path):
+        return None
+    try:
+        corpus = MappedCorpus(corpus_path)
+    except (ValueError, KeyError, struct.error):
+        return None
+    if corpus.source_hash != source_hash(snapshot_path):
+        return None
+    return corpus
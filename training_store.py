@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import io
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from typing import Callable, List, Dict, Any, Optional
+
+from training_corpus import build_corpus, open_corpus, source_hash, CorpusList
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Fix console encoding for Windows
+if sys.platform.startswith('win'):
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+
+@contextmanager
+def _file_lock(path: str, exclusive: bool):
+    """Межпроцессная блокировка через отдельный .lock файл"""
+    with open(path + '.lock', 'a+b') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        else:
+            # msvcrt умеет только эксклюзивную блокировку
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _example_key(example: Dict[str, Any]) -> str:
+    """Ключ дедупликации: нормализованный текст запроса"""
+    return " ".join(str(example.get('input', '')).lower().split())
+
+
+class TrainingStore:
+    """Хранилище примеров обучения: снимок JSON + журнал JSONL только на дозапись
+
+    Сжатие переименовывает журнал в .prev и увеличивает номер поколения в .gen файле,
+    поэтому другие процессы дочитывают только новые строки (poll_changes) и не
+    перечитывают весь корпус.
+    """
+
+    def __init__(self, snapshot_path: str = "voicaj_training_data.json", log_path: Optional[str] = None,
+                 fsync_batch: int = 16, fsync_interval: float = 1.0, corpus_path: Optional[str] = None):
+        self.snapshot_path = snapshot_path
+        self.corpus_path = corpus_path  # Бинарный корпус (training_corpus.py), если собран
+        self.log_path = log_path or os.path.splitext(snapshot_path)[0] + ".log.jsonl"
+        self.prev_log_path = self.log_path + ".prev"
+        self.generation_path = os.path.splitext(snapshot_path)[0] + ".gen"
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.Lock()
+        self._log_file = None
+        self._pending = 0  # Записи, еще не сброшенные на диск через fsync
+        self._flusher = None
+        self._compactor = None
+        self._watcher = None
+
+        # Что из журнала уже прочитано этим процессом
+        self._generation = 0
+        self._log_offset = 0
+        self._own_ids = set()  # Свои записи не возвращаем из poll_changes повторно
+
+    def load(self) -> List[Dict[str, Any]]:
+        """Загружает снимок (в т.ч. прежний voicaj_training_data.json) и дочитывает журнал"""
+        with _file_lock(self.snapshot_path, exclusive=False):
+            return self._load_locked()
+
+    def _load_locked(self) -> List[Dict[str, Any]]:
+        self._generation = self._read_generation()["generation"]
+        corpus = open_corpus(self.corpus_path, self.snapshot_path) if self.corpus_path else None
+        # Актуальный корпус открывается через mmap без разбора JSON снимка
+        examples = CorpusList(corpus) if corpus is not None else self._read_snapshot()
+        log_examples, self._log_offset = self._read_log(self.log_path)
+        examples.extend(log_examples)
+        with self._lock:
+            self._own_ids.clear()
+        return examples
+
+    def _read_snapshot(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        return data if isinstance(data, list) else []
+
+    def _read_log(self, path: str, offset: int = 0):
+        """Читает полные строки журнала начиная с offset; возвращает (примеры, новый offset)"""
+        examples = []
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return examples, offset
+
+        # Недописанный хвост без перевода строки дочитаем в следующий раз
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.decode('utf-8').splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                examples.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Поврежденная строка после сбоя - пропускаем
+                continue
+        return examples, offset + len(complete)
+
+    def _read_generation(self) -> Dict[str, Any]:
+        try:
+            with open(self.generation_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"generation": 0, "rotated": False}
+
+    def _write_generation(self, rotated: bool):
+        """Увеличивает общий счетчик поколений (атомарной заменой файла)"""
+        generation = self._read_generation()["generation"] + 1
+        tmp_path = self.generation_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"generation": generation, "rotated": rotated}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.generation_path)
+
+    def append(self, example: Dict[str, Any]):
+        """Дописывает пример в журнал; fsync выполняется пачками"""
+        example.setdefault('id', uuid.uuid4().hex)
+        line = json.dumps(example, ensure_ascii=False) + "\n"
+
+        with self._lock:
+            self._own_ids.add(example['id'])
+            with _file_lock(self.snapshot_path, exclusive=False):
+                # Журнал мог быть переименован сжатием в другом процессе - открываем заново
+                if self._log_file is not None and self._log_rotated():
+                    self._close_log_locked()
+                if self._log_file is None:
+                    self._log_file = open(self.log_path, 'a', encoding='utf-8')
+                self._log_file.write(line)
+                self._log_file.flush()
+            self._pending += 1
+
+            if self._pending >= self.fsync_batch:
+                self._fsync_locked()
+            elif self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="training-log-fsync", daemon=True)
+                self._flusher.start()
+
+    def _log_rotated(self) -> bool:
+        try:
+            return os.fstat(self._log_file.fileno()).st_ino != os.stat(self.log_path).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _close_log_locked(self):
+        self._fsync_locked()
+        self._log_file.close()
+        self._log_file = None
+
+    def _fsync_locked(self):
+        if self._log_file is not None and self._pending:
+            os.fsync(self._log_file.fileno())
+            self._pending = 0
+
+    def _flush_loop(self):
+        """Досбрасывает на диск неполную пачку не позже чем через fsync_interval"""
+        while True:
+            time.sleep(self.fsync_interval)
+            with self._lock:
+                self._fsync_locked()
+
+    def flush(self):
+        """Принудительно сбрасывает журнал на диск"""
+        with self._lock:
+            self._fsync_locked()
+
+    def poll_changes(self) -> Optional[List[Dict[str, Any]]]:
+        """Новые примеры из других процессов с момента последнего чтения.
+
+        Возвращает None, если дельту восстановить нельзя (корпус заменен целиком
+        или пропущено больше одного сжатия) - тогда нужно вызвать load().
+        """
+        generation = self._read_generation()
+        if generation["generation"] == self._generation:
+            # Быстрый путь: журнал не вырос
+            try:
+                if os.path.getsize(self.log_path) <= self._log_offset:
+                    return []
+            except FileNotFoundError:
+                return []
+
+        with _file_lock(self.snapshot_path, exclusive=False):
+            generation = self._read_generation()
+            if generation["generation"] == self._generation:
+                examples, self._log_offset = self._read_log(self.log_path, self._log_offset)
+            elif generation["generation"] == self._generation + 1 and generation.get("rotated"):
+                # Хвост предыдущего журнала + новый журнал с начала
+                examples, _ = self._read_log(self.prev_log_path, self._log_offset)
+                new_examples, self._log_offset = self._read_log(self.log_path, 0)
+                examples.extend(new_examples)
+                self._generation = generation["generation"]
+            else:
+                return None
+
+        with self._lock:
+            fresh = []
+            for example in examples:
+                if example.get('id') in self._own_ids:
+                    self._own_ids.discard(example['id'])
+                else:
+                    fresh.append(example)
+        return fresh
+
+    def compact(self, select: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None
+                ) -> Dict[str, int]:
+        """Пишет дедуплицированный снимок атомарной заменой файла и ротирует журнал.
+        select - дополнительный отбор примеров после точной дедупликации (под той же блокировкой)"""
+        with self._lock:
+            with _file_lock(self.snapshot_path, exclusive=True):
+                examples = self._read_snapshot() + self._read_log(self.log_path)[0]
+
+                # Для повторяющегося запроса оставляем последний (самый свежий) пример
+                deduplicated: Dict[str, Dict[str, Any]] = {}
+                for example in examples:
+                    key = _example_key(example)
+                    deduplicated.pop(key, None)
+                    deduplicated[key] = example
+
+                kept = list(deduplicated.values())
+                if select is not None:
+                    kept = select(kept)
+                self._write_snapshot_locked(kept, rotate=True)
+                if self.corpus_path:
+                    self.build_corpus_locked(kept)
+                return {"examples": len(examples), "kept": len(kept)}
+
+    def build_corpus(self) -> Dict[str, int]:
+        """Собирает бинарный корпус из текущего снимка"""
+        with _file_lock(self.snapshot_path, exclusive=False):
+            return self.build_corpus_locked(self._read_snapshot())
+
+    def build_corpus_locked(self, examples: List[Dict[str, Any]]) -> Dict[str, int]:
+        try:
+            return build_corpus(examples, self.corpus_path, source_hash(self.snapshot_path))
+        except PermissionError:
+            # Windows не дает заменить файл, открытый через mmap; воркеры
+            # вернутся к JSON до следующей сборки
+            print(f"⚠️ Не удалось обновить корпус {self.corpus_path}")
+            return {}
+
+    def replace(self, examples: List[Dict[str, Any]]):
+        """Заменяет весь корпус (для инструментов, загрузивших его целиком через load)"""
+        with self._lock:
+            with _file_lock(self.snapshot_path, exclusive=True):
+                self._write_snapshot_locked(examples, rotate=False)
+
+    def _write_snapshot_locked(self, examples: List[Dict[str, Any]], rotate: bool):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            # Загруженный через load() корпус может содержать ленивые CorpusExample из mmap
+            json.dump([dict(example) for example in examples], f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        # Журнал уже вошел в снимок: переносим его в .prev, чтобы другие процессы
+        # могли дочитать свой хвост. При сбое до ротации записи повторятся при
+        # следующей загрузке и уйдут при следующем сжатии.
+        if self._log_file is not None:
+            self._close_log_locked()
+        if os.path.exists(self.log_path):
+            try:
+                os.replace(self.log_path, self.prev_log_path)
+            except PermissionError:
+                # Windows не дает переименовать открытый файл - просто очищаем журнал
+                rotate = False
+                with open(self.log_path, 'w', encoding='utf-8') as f:
+                    f.flush()
+                    os.fsync(f.fileno())
+        self._write_generation(rotated=rotate)
+
+    def log_size(self) -> int:
+        """Размер журнала в байтах"""
+        try:
+            return os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return 0
+
+    def start_compactor(self, interval_seconds: int = 600, min_log_bytes: int = 64 * 1024) -> threading.Thread:
+        """Фоновое сжатие журнала в снимок, когда он разрастается"""
+        if self._compactor is not None:
+            return self._compactor
+
+        def worker():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    if self.log_size() >= min_log_bytes:
+                        stats = self.compact()
+                        print(f"🗜️ Журнал обучения сжат: {stats['examples']} -> {stats['kept']} примеров")
+                except Exception as e:
+                    print(f"❌ Ошибка сжатия журнала обучения: {e}")
+
+        self._compactor = threading.Thread(target=worker, name="training-log-compactor", daemon=True)
+        self._compactor.start()
+        return self._compactor
+
+    def start_watcher(self, on_examples: Callable[[List[Dict[str, Any]]], None],
+                      on_reload: Callable[[List[Dict[str, Any]]], None],
+                      interval_seconds: float = 2.0) -> threading.Thread:
+        """Следит за журналом и передает новые примеры других процессов в on_examples"""
+        if self._watcher is not None:
+            return self._watcher
+
+        def worker():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    examples = self.poll_changes()
+                    if examples is None:
+                        on_reload(self.load())
+                    elif examples:
+                        on_examples(examples)
+                except Exception as e:
+                    print(f"❌ Ошибка чтения журнала обучения: {e}")
+
+        self._watcher = threading.Thread(target=worker, name="training-log-watcher", daemon=True)
+        self._watcher.start()
+        return self._watcher
+
+
+if __name__ == "__main__":
+    store = TrainingStore()
+    stats = store.compact()
+    print(f"✅ Снимок обучения записан: {stats['examples']} -> {stats['kept']} примеров")
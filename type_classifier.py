@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import zlib
+from typing import List, Dict, Any, Optional, Sequence, Callable
+
+import numpy as np
+
+from hashed_features import HashedFeaturizer, stack_batches, sparse_dot, sparse_update
+
+TYPE_MODEL_PATH = "voicaj_type_model.npz"
+
+# Ниже этой вероятности лучшего типа решение остается за каскадом правил
+TYPE_CONFIDENCE_THRESHOLD = 0.6
+
+# Тот же классификатор с тремя классами предсказывает приоритет
+PRIORITY_MODEL_PATH = "voicaj_priority_model.npz"
+PRIORITY_LEVELS = ['low', 'medium', 'high']
+PRIORITY_CONFIDENCE_THRESHOLD = 0.7
+
+# Эталон онлайн-дообучения (online_learning.py): на этой доле примеров не обучается ни одна
+# рабочая модель, иначе проверка кандидата на дрейф сводилась бы к проверке запоминания
+REFERENCE_FRACTION = 0.1
+
+# Все типы схемы Voicaj (см. README), порядок задает столбцы матрицы весов
+VOICAJ_TYPES = [
+    'task', 'diary_entry', 'habit', 'health', 'workout', 'meal', 'goal', 'advice',
+    'study_note', 'time_log', 'shared_task', 'focus_session', 'mood_entry', 'expense', 'travel_plan'
+]
+
+
+def example_types(example: Dict[str, Any]) -> List[str]:
+    """Типы объектов из expected примера обучения (без повторов, в исходном порядке)"""
+    types = []
+    for obj in example.get('expected') or []:
+        if isinstance(obj, dict) and obj.get('type') in VOICAJ_TYPES and obj['type'] not in types:
+            types.append(obj['type'])
+    return types
+
+
+def example_priority(example: Dict[str, Any]) -> List[str]:
+    """Приоритет первого объекта expected примера (список из одного элемента или пустой)"""
+    for obj in example.get('expected') or []:
+        if isinstance(obj, dict) and obj.get('priority') in PRIORITY_LEVELS:
+            return [obj['priority']]
+        break
+    return []
+
+
+def _softmax(scores: np.ndarray) -> np.ndarray:
+    scores = scores - scores.max(axis=1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class TypeClassifier:
+    """Многоклассовый линейный классификатор по хешированным n-граммам (типы схемы или приоритеты)"""
+
+    def __init__(self, featurizer: Optional[HashedFeaturizer] = None, types: Sequence[str] = VOICAJ_TYPES,
+                 weights: Optional[np.ndarray] = None):
+        self.featurizer = featurizer or HashedFeaturizer()
+        self.types = list(types)
+        if weights is None:
+            weights = np.zeros((self.featurizer.n_features, len(self.types)), dtype=np.float32)
+        self.weights = weights
+
+    def _targets(self, labels: Sequence[Sequence[str]]) -> np.ndarray:
+        """Мягкие метки: у примера с k типами каждый тип получает 1/k"""
+        targets = np.zeros((len(labels), len(self.types)), dtype=np.float32)
+        for row, types in enumerate(labels):
+            for name in types:
+                targets[row, self.types.index(name)] = 1.0 / len(types)
+        return targets
+
+    def partial_fit(self, texts: Sequence[str], labels: Sequence[Sequence[str]], learning_rate: float = 0.5) -> float:
+        """Один шаг SGD по пачке; возвращает кросс-энтропию до шага"""
+        batch = self.featurizer.transform(texts)
+        targets = self._targets(labels)
+        probabilities = _softmax(sparse_dot(batch, self.weights))
+        loss = float(-(targets * np.log(probabilities + 1e-9)).sum(axis=1).mean())
+        sparse_update(self.weights, batch, (probabilities - targets) / len(texts), learning_rate)
+        return loss
+
+    def fit(self, texts: Sequence[str], labels: Sequence[Sequence[str]], epochs: int = 30,
+            learning_rate: float = 2.0, batch_size: int = 16, seed: int = 0) -> List[float]:
+        """Обучение мини-пачками SGD; возвращает среднюю потерю по эпохам"""
+        # Признаки считаем один раз, эпохи только перемешивают готовые строки
+        featurized = [self.featurizer.transform([text]) for text in texts]
+        targets = self._targets(labels)
+        rng = np.random.default_rng(seed)
+        history = []
+
+        for epoch in range(epochs):
+            order = rng.permutation(len(texts))
+            rate = learning_rate / (1 + epoch * 0.1)
+            losses = []
+            for start in range(0, len(order), batch_size):
+                rows = order[start:start + batch_size]
+                batch = stack_batches([featurized[row] for row in rows])
+                probabilities = _softmax(sparse_dot(batch, self.weights))
+                batch_targets = targets[rows]
+                losses.append(float(-(batch_targets * np.log(probabilities + 1e-9)).sum(axis=1).mean()))
+                sparse_update(self.weights, batch, (probabilities - batch_targets) / len(rows), rate)
+            history.append(float(np.mean(losses)) if losses else 0.0)
+        return history
+
+    def copy(self) -> 'TypeClassifier':
+        """Независимая копия весов (признаки и их кеш общие)"""
+        return TypeClassifier(self.featurizer, self.types, self.weights.copy())
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """Вероятности всех типов схемы для пачки текстов (n_texts x n_types)"""
+        return _softmax(sparse_dot(self.featurizer.transform(texts), self.weights))
+
+    def confidence(self, texts: Sequence[str]) -> np.ndarray:
+        """Вероятность лучшего класса для каждого текста"""
+        return self.predict_proba(texts).max(axis=1)
+
+    def predict(self, texts: Sequence[str], secondary_threshold: float = 0.35, max_types: int = 2,
+                min_confidence: float = 0.0) -> List[List[str]]:
+        """Типы для каждого текста: лучший тип и, для смешанных запросов, еще уверенные.
+        Если вероятность лучшего типа ниже min_confidence, для текста возвращается пустой список."""
+        probabilities = self.predict_proba(texts)
+        ranked = np.argsort(-probabilities, axis=1)[:, :max_types]
+        results = []
+        for row, columns in enumerate(ranked):
+            if probabilities[row, columns[0]] < min_confidence:
+                results.append([])
+                continue
+            types = [self.types[columns[0]]]
+            types.extend(self.types[column] for column in columns[1:]
+                         if probabilities[row, column] >= secondary_threshold)
+            results.append(types)
+        return results
+
+    def save(self, path: str = TYPE_MODEL_PATH):
+        """Атомарно сохраняет модель (np.savez добавляет .npz к имени без расширения)"""
+        tmp_path = path + '.tmp.npz'
+        config = {'featurizer': self.featurizer.config(), 'types': self.types}
+        np.savez_compressed(tmp_path, weights=self.weights, config=np.array(json.dumps(config)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = TYPE_MODEL_PATH) -> Optional['TypeClassifier']:
+        """Загружает модель; None, если файла нет или он поврежден"""
+        try:
+            with np.load(path) as data:
+                config = json.loads(str(data['config']))
+                weights = data['weights'].astype(np.float32)
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            return None
+        featurizer = HashedFeaturizer(**config['featurizer'])
+        return cls(featurizer, config['types'], weights)
+
+    @classmethod
+    def load_or_train(cls, path: str, training_data: Sequence[Dict[str, Any]], classes: Sequence[str] = VOICAJ_TYPES,
+                      label_fn: Callable = example_types) -> 'TypeClassifier':
+        """Берет сохраненную модель, а если ее нет - обучает на данных обучения (без эталона
+        онлайн-дообучения) и сохраняет. Без размеченных примеров возвращает необученную модель."""
+        model = cls.load(path)
+        if model is not None:
+            return model
+
+        model = cls(types=classes)
+        texts, labels = training_pairs(reference_split(training_data)[0], label_fn)
+        if not texts:
+            return model
+        model.fit(texts, labels)
+        try:
+            model.save(path)
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить модель {path}: {e}")
+        return model
+
+
+def training_pairs(training_data: Sequence[Dict[str, Any]], label_fn: Callable = example_types):
+    """Пары (тексты, метки) из примеров обучения, у которых есть известные метки"""
+    texts, labels = [], []
+    for example in training_data:
+        types = label_fn(example)
+        if example.get('input') and types:
+            texts.append(example['input'])
+            labels.append(types)
+    return texts, labels
+
+
+def holdout_split(training_data: Sequence[Dict[str, Any]], fraction: float = 0.2, salt: str = ''):
+    """Детерминированное разбиение на обучение и отложенную выборку по хешу текста запроса.
+    Другая соль дает разбиение, не связанное с разбиением по умолчанию."""
+    train, holdout = [], []
+    for example in training_data:
+        key = zlib.crc32((salt + str(example.get('input', ''))).lower().encode('utf-8')) % 1000
+        (holdout if key < fraction * 1000 else train).append(example)
+    return train, holdout
+
+
+def reference_split(training_data: Sequence[Dict[str, Any]], fraction: float = REFERENCE_FRACTION):
+    """(примеры для рабочих моделей, эталон онлайн-дообучения)"""
+    return holdout_split(training_data, fraction, salt='reference')
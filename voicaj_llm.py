@@ -1,17 +1,22 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import json
-import re
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
 
+from training_store import TrainingStore
+from similarity_index import TfidfIndex
+from russian_stemmer import StemTable, stem_text
+from request_clock import reference_clock
+
 class VoicajLLM:
     """Voicaj LLM с системой обучения"""
     
     def __init__(self):
         self.training_data = []
-        self.current_date = datetime.now()
+        self.similarity_index = TfidfIndex()
+        self.training_store = TrainingStore('voicaj_training_data.json')
+        self.clock = reference_clock
         self.load_training_data()
         
         # Паттерны для определения типов задач
@@ -111,57 +116,32 @@ class VoicajLLM:
             'medium': ['на этой неделе', 'в ближайшее время'],
             'low': ['когда-нибудь', 'не спеша', 'в свободное время', 'срочность низкая', 'неважно', 'не важно']
         }
+        
+        # Таблицы, сведенные к основам слов: формы слова совпадают с любым ключевым словом
+        self.type_table = StemTable.from_table({
+            task_type: [keyword for pattern in patterns for keyword in pattern.split('|')]
+            for task_type, patterns in self.patterns.items()
+        })
+        self.tag_table = StemTable.from_table(self.tags_keywords)
+        self.priority_table = StemTable.from_table(self.priority_keywords)
+
+    @property
+    def current_date(self) -> datetime:
+        """Опорный момент текущего запроса (request_clock.py), а не время запуска"""
+        return self.clock.now()
 
     def load_training_data(self):
         """Загружает данные обучения"""
         try:
             # Безопасная загрузка без print
-            with open('voicaj_training_data.json', 'r', encoding='utf-8') as f:
-                self.training_data = json.load(f)
+            self.training_data = self.training_store.load()
         except Exception:
             self.training_data = []
+        self.similarity_index.reset([example.get('input') for example in self.training_data])
             
-    def find_similar_examples(self, user_input: str) -> List[Dict[str, Any]]:
-        """Находит похожие примеры из данных обучения"""
-        similar = []
-        input_lower = user_input.lower()
-        
-        # Сначала ищем точные совпадения фраз
-        for example in self.training_data:
-            if 'input' in example:
-                example_input = example['input'].lower()
-                
-                # Проверяем точное совпадение
-                if input_lower == example_input:
-                    return [example]
-                
-                # Проверяем частичное совпадение (80% слов)
-                input_words = set(input_lower.split())
-                example_words = set(example_input.split())
-                common_words = input_words & example_words
-                
-                if len(common_words) >= len(input_words) * 0.8:  # 80% совпадение
-                    similar.append(example)
-        
-        # Если нет точных совпадений, ищем по ключевым словам
-        if not similar:
-            key_words = ['отчёт', 'руководитель', 'презентация', 'код', 'программирование', 'работа', 'вуз', 'учеба', 'задача', 'срочность', 'написание']
-            
-            for example in self.training_data:
-                if 'input' in example:
-                    example_input = example['input'].lower()
-                    
-                    # Проверяем точные совпадения ключевых слов
-                    input_keywords = [word for word in key_words if word in input_lower]
-                    example_keywords = [word for word in key_words if word in example_input]
-                    
-                    # Если есть совпадения ключевых слов
-                    if input_keywords and example_keywords:
-                        common_keywords = set(input_keywords) & set(example_keywords)
-                        if len(common_keywords) >= 1:  # Минимум 1 общий ключевой термин
-                            similar.append(example)
-                            
-        return similar[:1]  # Возвращаем только 1 наиболее похожий пример
+    def find_similar_examples(self, user_input: str, k: int = 3) -> List[Dict[str, Any]]:
+        """Находит похожие примеры из данных обучения (TF-IDF, самый похожий первым)"""
+        return [self.training_data[index] for index, _ in self.similarity_index.query(user_input, k)]
 
     def improve_from_feedback(self, user_input: str, original_output: List[Dict], feedback: str):
         """Улучшает модель на основе обратной связи"""
@@ -268,11 +248,11 @@ class VoicajLLM:
         }
         
         self.training_data.append(example)
+        self.similarity_index.add(user_input)
         
-        # Сохраняем в файл
+        # Дописываем в журнал обучения
         try:
-            with open('voicaj_training_data.json', 'w', encoding='utf-8') as f:
-                json.dump(self.training_data, f, ensure_ascii=False, indent=2)
+            self.training_store.append(example)
         except Exception:
             pass  # Игнорируем ошибки записи
 
@@ -357,16 +337,8 @@ class VoicajLLM:
             return date_str
         
     def _detect_types(self, text: str) -> List[str]:
-        """Определяет типы задач в тексте"""
-        detected = set()
-        
-        for task_type, patterns in self.patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, text):
-                    detected.add(task_type)
-                    break  # Переходим к следующему типу после первого совпадения
-                    
-        return list(detected)
+        """Определяет типы задач в тексте (по основам слов)"""
+        return self.type_table.labels_in(stem_text(text.lower()))
         
     def _create_object(self, text: str, task_type: str) -> Dict[str, Any]:
         """Создает объект"""
@@ -561,16 +533,7 @@ class VoicajLLM:
                         return item['tags']
         
         # Если не нашли в обучении, используем базовые правила
-        tags = []
-        text_lower = text.lower()
-        
-        for tag, keywords in self.tags_keywords.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    if tag not in tags:
-                        tags.append(tag)
-                    break
-                    
+        tags = self.tag_table.labels_in(stem_text(text.lower()))
         return tags[:3]
         
     def _extract_priority(self, text: str) -> str:
@@ -585,14 +548,7 @@ class VoicajLLM:
                         return item['priority']
         
         # Если не нашли в обучении, используем базовые правила
-        text_lower = text.lower()
-        
-        for priority, keywords in self.priority_keywords.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    return priority
-                    
-        return "medium"
+        return self.priority_table.first_label(stem_text(text.lower())) or "medium"
         
     def _extract_frequency(self, text: str) -> str:
         """Извлекает частоту для привычек"""
@@ -1,12 +1,36 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os
 import sys
 import io
 import json
+import time
+import argparse
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
 
+from training_store import TrainingStore
+from training_corpus import open_corpus
+from rule_engine import RuleEngine
+from type_classifier import TypeClassifier, TYPE_MODEL_PATH, TYPE_CONFIDENCE_THRESHOLD, training_pairs, holdout_split
+from type_classifier import PRIORITY_MODEL_PATH, PRIORITY_LEVELS, example_priority, reference_split
+from tag_predictor import TAG_MODEL_PATH, tag_pairs, train_tag_predictor
+from history_shards import HistoryShards
+from distillation import (
+    DistillationLog, DISTILL_LOG_PATH, DISTILL_REPORT_PATH, dedupe_distilled, escalation_share,
+    load_traffic_sample, read_report, append_report, last_offset
+)
+from embedding_index import EMBEDDING_INDEX_PATH, build_embedding_index, benchmark_search
+from near_duplicates import NEAR_DUP_THRESHOLD, dedupe_near_duplicates
+from request_clock import reference_clock
+from lm_finetune import (
+    LM_MODEL_NAME, LM_ADAPTER_PATH, LM_CHECKPOINT_DIR, TINY_MODEL_ID, configure_threads, load_causal_lm, finetune,
+    load_adapter, format_example
+)
+from generation_cache import model_id
+from inference_backends import BACKENDS, LLM_EXPORT_PATHS, EagerBackend, export_backend, open_backend, benchmark_backends
+
 # Fix console encoding for Windows
 if sys.platform.startswith('win'):
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
@@ -17,7 +41,12 @@ class VoicajTrainer:
     
     def __init__(self):
         self.training_data = []
-        self.current_date = datetime.now()
+        self.clock = reference_clock
+
+    @property
+    def current_date(self) -> datetime:
+        """Опорный момент текущего запроса (request_clock.py), а не время запуска"""
+        return self.clock.now()
         
     def add_training_example(self, user_input: str, expected_output: List[Dict[str, Any]], 
                            feedback: str = ""):
@@ -166,20 +195,323 @@ class VoicajTrainer:
             return self.current_date.strftime("%Y-%m-%d %H:%M")
             
     def save_training_data(self, filename: str = "voicaj_training_data.json"):
-        """Сохраняет данные обучения в файл"""
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(self.training_data, f, ensure_ascii=False, indent=2)
+        """Сохраняет данные обучения в файл (атомарная замена снимка)"""
+        TrainingStore(filename).replace(self.training_data)
         print(f"💾 Данные обучения сохранены в {filename}")
         
     def load_training_data(self, filename: str = "voicaj_training_data.json"):
         """Загружает данные обучения из файла"""
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                self.training_data = json.load(f)
-            print(f"📂 Загружено {len(self.training_data)} примеров обучения")
-        except FileNotFoundError:
+        store = TrainingStore(filename)
+        if not os.path.exists(store.snapshot_path) and not os.path.exists(store.log_path):
             print(f"⚠️ Файл {filename} не найден, начинаем с пустого набора")
+            return
+        self.training_data = store.load()
+        print(f"📂 Загружено {len(self.training_data)} примеров обучения")
+            
+    def build_corpus(self, filename: str = "voicaj_training_data.json",
+                     output: str = "voicaj_training_data.corpus"):
+        """Собирает бинарный колоночный корпус, который воркеры открывают через mmap"""
+        stats = TrainingStore(filename, corpus_path=output).build_corpus()
+        print(f"📦 Корпус {output}: {stats['examples']} примеров, {stats['objects']} объектов, "
+              f"{stats['strings']} строк, {stats['tokens']} токенов, {stats['bytes'] / 1024:.1f} КБ")
+        
+        # Сравниваем время загрузки: разбор JSON против открытия mmap
+        start = time.perf_counter()
+        with open(filename, 'r', encoding='utf-8') as f:
+            json.load(f)
+        json_ms = (time.perf_counter() - start) * 1000
+        
+        start = time.perf_counter()
+        corpus = open_corpus(output, filename)
+        mmap_ms = (time.perf_counter() - start) * 1000
+        print(f"⏱️ Загрузка: JSON {json_ms:.2f} мс, mmap {mmap_ms:.2f} мс (актуален: {corpus is not None})")
+        
+    def train_type_classifier(self, filename: str = "voicaj_training_data.json",
+                              output: str = TYPE_MODEL_PATH, holdout: float = 0.2, epochs: int = 30):
+        """Обучает классификатор типов и сравнивает его с каскадом правил на отложенной выборке"""
+        training_data = TrainingStore(filename).load()
+        train, test = holdout_split(training_data, holdout)
+        train_texts, train_labels = training_pairs(train)
+        test_texts, test_labels = training_pairs(test)
+        print(f"🧪 Примеров: обучение {len(train_texts)}, отложено {len(test_texts)}")
+        
+        model = TypeClassifier()
+        start = time.perf_counter()
+        losses = model.fit(train_texts, train_labels, epochs=epochs)
+        print(f"🏋️ Обучение: {time.perf_counter() - start:.2f} с, потеря {losses[0]:.3f} -> {losses[-1]:.3f}")
+        
+        rules = RuleEngine.build(training_data)
+        if test_texts:
+            predictors = {
+                'правила': lambda texts: [rules.detect_types(text) for text in texts],
+                'модель': model.predict,
+                # Как в HybridVoicajLLM._detect_types: неуверенные ответы модели отдаются правилам
+                'модель+правила': lambda texts: [
+                    types or rules.detect_types(text)
+                    for text, types in zip(texts, model.predict(texts, min_confidence=TYPE_CONFIDENCE_THRESHOLD))
+                ]
+            }
+            print(f"\n{'':15} {'top-1':>7} {'точно':>7} {'мкс/запрос':>11} {'мкс/текст в пачке':>18}")
+            for name, predict in predictors.items():
+                predicted = predict(test_texts)
+                top1 = sum(types[0] in labels for types, labels in zip(predicted, test_labels)) / len(test_texts)
+                exact = sum(set(types) == set(labels) for types, labels in zip(predicted, test_labels)) / len(test_texts)
+                
+                # Задержка одного запроса (как в analyze_text) и пакетный режим
+                start = time.perf_counter()
+                for text in test_texts:
+                    predict([text])
+                single_us = (time.perf_counter() - start) * 1e6 / len(test_texts)
+                start = time.perf_counter()
+                predict(test_texts)
+                batch_us = (time.perf_counter() - start) * 1e6 / len(test_texts)
+                print(f"{name:15} {top1:>7.1%} {exact:>7.1%} {single_us:>11.1f} {batch_us:>18.1f}")
+            print("ℹ️ Правила подбирались вручную на всех примерах, включая отложенные")
+        
+        # Итоговая модель обучается на всех примерах, кроме эталона онлайн-дообучения
+        texts, labels = training_pairs(reference_split(training_data)[0])
+        model = TypeClassifier()
+        model.fit(texts, labels, epochs=epochs)
+        model.save(output)
+        print(f"\n✅ Модель типов сохранена: {output} ({os.path.getsize(output) / 1024:.1f} КБ)")
+        
+    def train_tag_predictor(self, filename: str = "voicaj_training_data.json",
+                            output: str = TAG_MODEL_PATH, holdout: float = 0.2, epochs: int = 40):
+        """Обучает предсказатель тегов и сравнивает его с правилами на отложенной выборке"""
+        training_data = TrainingStore(filename).load()
+        train, test = holdout_split(training_data, holdout)
+        test_texts, test_labels = tag_pairs(test)
+        print(f"🧪 Примеров с тегами: обучение {len(tag_pairs(train)[0])}, отложено {len(test_texts)}")
+        
+        start = time.perf_counter()
+        model = train_tag_predictor(train, holdout, epochs)
+        if model is None:
+            print("❌ В данных обучения нет тегов")
+            return
+        print(f"🏋️ Обучение: {time.perf_counter() - start:.2f} с, тегов в модели: {len(model.tags)}")
+        
+        # Правила ищут похожие примеры только среди обучающих, иначе отложенный пример найдет сам себя
+        rules = RuleEngine.build(train)
+        if test_texts:
+            predictors = {
+                'правила': lambda texts: [rules.extract_tags(train, text) for text in texts],
+                'модель': model.predict,
+                # Как в HybridVoicajLLM._extract_tags: без уверенных тегов модели работают правила
+                'модель+правила': lambda texts: [
+                    tags or rules.extract_tags(train, text) for text, tags in zip(texts, model.predict(texts))
+                ]
+            }
+            print(f"\n{'':15} {'точность':>9} {'полнота':>8} {'F1':>6} {'мкс/запрос':>11}")
+            for name, predict in predictors.items():
+                predicted = predict(test_texts)
+                hits = sum(len(set(tags) & set(labels)) for tags, labels in zip(predicted, test_labels))
+                precision = hits / max(sum(len(tags) for tags in predicted), 1)
+                recall = hits / max(sum(len(labels) for labels in test_labels), 1)
+                f1 = 2 * precision * recall / max(precision + recall, 1e-9)
+                
+                start = time.perf_counter()
+                for text in test_texts:
+                    predict([text])
+                single_us = (time.perf_counter() - start) * 1e6 / len(test_texts)
+                print(f"{name:15} {precision:>9.1%} {recall:>8.1%} {f1:>6.3f} {single_us:>11.1f}")
+        
+        # Итоговая модель: пороги с отложенной части, веса на всех примерах, кроме эталона онлайн-дообучения
+        model = train_tag_predictor(reference_split(training_data)[0], holdout, epochs)
+        model.save(output)
+        print(f"\n✅ Модель тегов сохранена: {output} ({len(model.tags)} тегов, {os.path.getsize(output) / 1024:.1f} КБ)")
+        
+    def distill(self, filename: str = "voicaj_training_data.json", log_path: str = DISTILL_LOG_PATH,
+                report_path: str = DISTILL_REPORT_PATH, db_path: str = "chat_history.db", shards: int = 1,
+                sample: int = 2000):
+        """Раунд дистилляции: новые ответы LLM -> данные обучения -> переобучение быстрых моделей"""
+        store = TrainingStore(filename)
+        training_data = list(store.load())
+        rounds = read_report(report_path)
+        records, offset = DistillationLog(log_path).read(last_offset(rounds))
+        examples, stats = dedupe_distilled(records, training_data)
+        print(f"🧪 Ответов LLM: {stats['records']}, невалидных {stats['invalid']}, повторов {stats['duplicates']}, "
+              f"противоречивых {stats['conflicts']}, уже известных {stats['known']}, новых примеров {len(examples)}")
+        
+        # Доля эскалаций меряется на последних запросах из истории (или на самих ответах LLM, если истории нет)
+        traffic = load_traffic_sample(HistoryShards(db_path, shards).all_paths(), sample)
+        if not traffic:
+            traffic = [record['input'] for record in records if record.get('input')]
+        # Маршрут запросов - тот же, что у сервиса: весь запрос или неуверенные поля в LLM
+        from hybrid_voicaj_llm import HybridVoicajLLM
+        share_before = escalation_share(HybridVoicajLLM(filename).llm_route, traffic)
+        share_after = share_before
+        
+        if examples:
+            for example in examples:
+                store.append(example)
+            store.flush()
+            training_data.extend(examples)
             
+            # Эталон онлайн-дообучения в переобучение не попадает
+            serving_data, _ = reference_split(training_data)
+            texts, labels = training_pairs(serving_data)
+            type_model = TypeClassifier()
+            type_model.fit(texts, labels)
+            type_model.save(TYPE_MODEL_PATH)
+            
+            texts, labels = training_pairs(serving_data, example_priority)
+            priority_model = TypeClassifier(types=PRIORITY_LEVELS)
+            priority_model.fit(texts, labels)
+            priority_model.save(PRIORITY_MODEL_PATH)
+            
+            tag_model = train_tag_predictor(serving_data)
+            if tag_model is not None:
+                tag_model.save(TAG_MODEL_PATH)
+            share_after = escalation_share(HybridVoicajLLM(filename).llm_route, traffic)
+        
+        entry = {
+            'round': len(rounds) + 1,
+            'timestamp': datetime.now().isoformat(),
+            **stats,
+            'added': len(examples),
+            'retrained': bool(examples),
+            'traffic': len(traffic),
+            'llm_share_before': round(share_before, 4),
+            'llm_share_after': round(share_after, 4),
+            'log_offset': offset
+        }
+        append_report(entry, report_path)
+        
+        print(f"\n{'раунд':>5} {'дата':>10} {'новых':>6} {'запросов':>9} {'LLM до':>7} {'LLM после':>10}")
+        for item in rounds + [entry]:
+            print(f"{item['round']:>5} {item['timestamp'][:10]:>10} {item['added']:>6} {item['traffic']:>9} "
+                  f"{item['llm_share_before']:>7.1%} {item['llm_share_after']:>10.1%}")
+        
+    def finetune_lm(self, filename: str = "voicaj_training_data.json", model_name: str = LM_MODEL_NAME,
+                    output: str = LM_ADAPTER_PATH, checkpoint_dir: str = LM_CHECKPOINT_DIR, tiny: bool = False,
+                    steps: int = 200, micro_batch: int = 4, grad_accum: int = 4, learning_rate: float = 2e-4,
+                    rank: int = 8, max_length: int = 512, threads: int = 0, interop_threads: int = 0,
+                    checkpoint_every: int = 50, bf16: bool = False, resume: bool = True):
+        """Дообучает адаптеры LoRA генеративной модели из HybridVoicajLLM.init_llm на CPU"""
+        intra, inter = configure_threads(threads, interop_threads)
+        print(f"🧵 Потоки: {intra} внутри операций, {inter} между операциями")
+        
+        # Маленькая модель со случайными весами и байтовым токенизатором: проверка без сети
+        model_name = TINY_MODEL_ID if tiny else model_name
+        model, tokenizer = load_causal_lm(model_name)
+        
+        examples = TrainingStore(filename, corpus_path="voicaj_training_data.corpus").load()
+        print(f"📚 Поток по {len(examples)} примерам: {steps} шагов x {grad_accum} микропачек x {micro_batch}")
+        stats = finetune(model, tokenizer, examples, output, checkpoint_dir, model_name, steps, micro_batch,
+                         grad_accum, learning_rate, rank, 2.0 * rank, max_length, checkpoint_every,
+                         bf16=bf16, resume=resume)
+        if stats['last_loss'] is None:
+            return
+        print(f"\n⏱️ {stats['steps']} шагов за {stats['seconds']:.1f} с: {stats['examples_per_second']:.1f} примеров/с, "
+              f"{stats['tokens_per_second']:.0f} токенов/с; потеря {stats['first_loss']:.4f} -> {stats['last_loss']:.4f}")
+        print(f"✅ Адаптеры сохранены: {output} ({os.path.getsize(output) / 1024:.1f} КБ)")
+        
+    def _load_lm(self, model_name: str, adapter: str, tiny: bool):
+        """Генеративная модель с адаптерами, как в HybridVoicajLLM.init_llm, ее токенизатор и идентификатор весов"""
+        model_name = TINY_MODEL_ID if tiny else model_name
+        model, tokenizer = load_causal_lm(model_name)
+        if load_adapter(model, adapter, model_name):
+            print(f"🧩 Подключены адаптеры LoRA: {adapter}")
+        return model, tokenizer, model_id(model_name, adapter)
+        
+    def export_lm(self, model_name: str = LM_MODEL_NAME, adapter: str = LM_ADAPTER_PATH, tiny: bool = False,
+                  backend: str = 'all', output: str = ""):
+        """Снимает граф генеративной модели для бэкендов traced и onnx (см. inference_backends.LLM_BACKEND)"""
+        model, _, identifier = self._load_lm(model_name, adapter, tiny)
+        kinds = list(LLM_EXPORT_PATHS) if backend == 'all' else [backend]
+        for kind in kinds:
+            start = time.perf_counter()
+            try:
+                path = export_backend(model, kind, identifier, output or None)
+            except ValueError as e:
+                print(f"❌ {kind}: {e}")
+                continue
+            print(f"✅ {kind}: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} МБ) за "
+                  f"{time.perf_counter() - start:.1f} с, веса {identifier}")
+        
+    def bench_lm(self, filename: str = "voicaj_training_data.json", model_name: str = LM_MODEL_NAME,
+                 adapter: str = LM_ADAPTER_PATH, tiny: bool = False, backends: str = ','.join(BACKENDS),
+                 prompts: int = 20, max_new_tokens: int = 32, threads: int = 0):
+        """Сравнивает бэкенды на промптах из данных обучения: задержка, токены/с и совпадение ответов с первым"""
+        intra, _ = configure_threads(threads)
+        model, tokenizer, identifier = self._load_lm(model_name, adapter, tiny)
+        
+        runners = []
+        for kind in [name.strip() for name in backends.split(',') if name.strip()]:
+            if kind == 'eager':
+                runners.append(EagerBackend(model))
+                continue
+            try:
+                runners.append(open_backend(kind, identifier, threads=threads))
+            except ValueError as e:
+                print(f"⚠️ {kind} пропущен: {e}")
+        if not runners:
+            return
+        
+        examples = TrainingStore(filename, corpus_path="voicaj_training_data.corpus").load()
+        pairs = [pair for pair in (format_example(example) for example in examples) if pair][:prompts]
+        prompt_ids = [tokenizer.encode(prompt) for prompt, _ in pairs]
+        if not prompt_ids:
+            print(f"⚠️ В {filename} нет примеров для промптов")
+            return
+        print(f"⏱️ {len(prompt_ids)} промптов, до {max_new_tokens} новых токенов, жадно; потоков {intra}")
+        
+        rows = benchmark_backends(runners, prompt_ids, max_new_tokens, eos_token_id=tokenizer.eos_token_id)
+        print(f"\n{'бэкенд':>8} {'среднее, мс':>12} {'p95, мс':>8} {'токенов/с':>10} {'совпадение':>11} {'Δ логитов':>10}")
+        for row in rows:
+            print(f"{row['backend']:>8} {row['mean_ms']:>12.1f} {row['p95_ms']:>8.1f} {row['tokens_per_second']:>10.0f} "
+                  f"{row['parity']:>11.1%} {row['logit_diff']:>10.2e}")
+        
+    def dedup(self, filename: str = "voicaj_training_data.json", output: str = "voicaj_training_data.dedup.json",
+              threshold: float = NEAR_DUP_THRESHOLD, in_place: bool = False, show: int = 10):
+        """Ищет почти одинаковые запросы (MinHash/LSH), печатает противоречивые кластеры и пишет сжатый корпус"""
+        report = []
+        
+        def select(examples: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            start = time.perf_counter()
+            compacted, clusters = dedupe_near_duplicates(examples, threshold)
+            report.extend(clusters)
+            print(f"🔎 {len(examples)} примеров за {time.perf_counter() - start:.2f} с: кластеров {len(clusters)}, "
+                  f"в них примеров {sum(c['size'] for c in clusters)}, удалено {len(examples) - len(compacted)}")
+            return compacted
+        
+        store = TrainingStore(filename, corpus_path="voicaj_training_data.corpus")
+        if in_place:
+            # Под блокировкой снимка: заодно точная дедупликация, ротация журнала и пересборка корпуса
+            stats = store.compact(select)
+            print(f"✅ Снимок {filename} перезаписан: {stats['examples']} -> {stats['kept']} примеров")
+        else:
+            # Примеры из mmap-корпуса - ленивые CorpusExample, json их не пишет
+            examples = select([dict(example) for example in store.load()])
+            with open(output, 'w', encoding='utf-8') as f:
+                json.dump(examples, f, ensure_ascii=False, indent=2)
+            print(f"✅ Сжатый корпус: {output} ({len(examples)} примеров)")
+        
+        conflicts = [cluster for cluster in report if cluster['conflict']]
+        print(f"\n⚠️ Кластеров с разными типами: {len(conflicts)} (сохранены целиком, нужна ручная проверка)")
+        for cluster in sorted(conflicts, key=lambda c: -c['size'])[:show]:
+            labels = '; '.join(f"{types} x{count}" for types, count in cluster['labels'].items())
+            print(f"  [{cluster['size']}] {labels}")
+            for text in cluster['inputs'][:3]:
+                print(f"      {text[:90]}")
+        
+    def build_embeddings(self, filename: str = "voicaj_training_data.json", output: str = EMBEDDING_INDEX_PATH,
+                         model_name: str = LM_MODEL_NAME, tiny: bool = False, kind: str = 'auto',
+                         batch_size: int = 32, update: bool = False, benchmark: str = ""):
+        """Строит индекс эмбеддингов входов обучения для семантического поиска похожих примеров"""
+        model_name = TINY_MODEL_ID if tiny else model_name
+        examples = TrainingStore(filename, corpus_path="voicaj_training_data.corpus").load()
+        index, embedded, rate = build_embedding_index(examples, output, model_name, kind, batch_size, update=update)
+        size = os.path.getsize(output + '.f16') / 1024
+        print(f"🧭 Индекс {output} ({index.meta['kind']}, размерность {index.dim}): {len(index)} векторов, "
+              f"посчитано {embedded} ({rate:.0f} текстов/с), {size:.1f} КБ float16")
+        
+        if benchmark:
+            sizes = [int(value) for value in benchmark.split(',') if value.strip()]
+            print(f"\n{'векторов':>9} {'перебор, мс':>12} {'IVF, мс':>8} {'IVF recall@1':>13}")
+            for row in benchmark_search(index.dim, sizes):
+                print(f"{row['size']:>9} {row['flat_ms']:>12.2f} {row['ivf_ms']:>8.2f} {row['ivf_recall']:>13.1%}")
+        
     def print_training_summary(self):
         """Выводит сводку по обучению"""
         print(f"\n📊 СВОДКА ПО ОБУЧЕНИЮ:")
@@ -189,8 +521,8 @@ class VoicajTrainer:
             print(f"Последний пример: {self.training_data[-1]['input'][:50]}...")
             print(f"Время последнего обновления: {self.training_data[-1]['timestamp']}")
 
-# Пример использования
-if __name__ == "__main__":
+def run_demo():
+    """Пример анализа обратной связи и сохранения примера обучения"""
     trainer = VoicajTrainer()
     
     # Загружаем существующие данные
@@ -239,3 +571,113 @@ if __name__ == "__main__":
     trainer.add_training_example(user_input, improved_output, feedback)
     trainer.save_training_data()
     trainer.print_training_summary()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обучение Voicaj LLM")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("demo", help="Пример анализа обратной связи (по умолчанию)")
+
+    corpus_parser = subparsers.add_parser("build-corpus", help="Собрать бинарный корпус для mmap-загрузки")
+    corpus_parser.add_argument("--data", default="voicaj_training_data.json", help="Снимок данных обучения")
+    corpus_parser.add_argument("--output", default="voicaj_training_data.corpus", help="Файл корпуса")
+
+    types_parser = subparsers.add_parser("train-types", help="Обучить классификатор типов и сравнить с правилами")
+    types_parser.add_argument("--data", default="voicaj_training_data.json", help="Снимок данных обучения")
+    types_parser.add_argument("--output", default=TYPE_MODEL_PATH, help="Файл модели типов")
+    types_parser.add_argument("--holdout", type=float, default=0.2, help="Доля отложенной выборки для отчета")
+    types_parser.add_argument("--epochs", type=int, default=30)
+
+    tags_parser = subparsers.add_parser("train-tags", help="Обучить предсказатель тегов и сравнить с правилами")
+    tags_parser.add_argument("--data", default="voicaj_training_data.json", help="Снимок данных обучения")
+    tags_parser.add_argument("--output", default=TAG_MODEL_PATH, help="Файл модели тегов")
+    tags_parser.add_argument("--holdout", type=float, default=0.2, help="Доля отложенной выборки для отчета")
+    tags_parser.add_argument("--epochs", type=int, default=40)
+
+    distill_parser = subparsers.add_parser("distill", help="Раунд дистилляции ответов LLM в быстрые модели")
+    distill_parser.add_argument("--data", default="voicaj_training_data.json", help="Снимок данных обучения")
+    distill_parser.add_argument("--log", default=DISTILL_LOG_PATH, help="Журнал ответов LLM")
+    distill_parser.add_argument("--report", default=DISTILL_REPORT_PATH, help="Отчет по раундам")
+    distill_parser.add_argument("--db", default="chat_history.db", help="Базовый путь к базе истории")
+    distill_parser.add_argument("--shards", type=int, default=1, help="Число шардов истории")
+    distill_parser.add_argument("--sample", type=int, default=2000, help="Запросов из истории для оценки доли LLM")
+
+    dedup_parser = subparsers.add_parser("dedup", help="Найти почти одинаковые примеры и сжать корпус")
+    dedup_parser.add_argument("--data", default="voicaj_training_data.json", help="Снимок данных обучения")
+    dedup_parser.add_argument("--output", default="voicaj_training_data.dedup.json", help="Файл сжатого корпуса")
+    dedup_parser.add_argument("--threshold", type=float, default=NEAR_DUP_THRESHOLD, help="Порог сходства Жаккара")
+    dedup_parser.add_argument("--in-place", action="store_true", help="Перезаписать сам снимок данных обучения")
+    dedup_parser.add_argument("--show", type=int, default=10, help="Сколько противоречивых кластеров показать")
+
+    emb_parser = subparsers.add_parser("build-embeddings", help="Построить индекс эмбеддингов для семантического поиска")
+    emb_parser.add_argument("--data", default="voicaj_training_data.json", help="Снимок данных обучения")
+    emb_parser.add_argument("--output", default=EMBEDDING_INDEX_PATH, help="Базовый путь файлов индекса")
+    emb_parser.add_argument("--model", default=LM_MODEL_NAME, help="Модель transformers для эмбеддингов")
+    emb_parser.add_argument("--tiny", action="store_true", help="Маленькая локальная модель вместо базовой (без сети)")
+    emb_parser.add_argument("--kind", choices=["auto", "flat", "ivf"], default="auto", help="Тип индекса")
+    emb_parser.add_argument("--batch-size", type=int, default=32)
+    emb_parser.add_argument("--update", action="store_true", help="Досчитать только новые примеры")
+    emb_parser.add_argument("--benchmark", default="", help="Размеры корпуса для замера поиска, например 1000,10000,100000")
+
+    lm_parser = subparsers.add_parser("finetune-lm", help="Дообучить адаптеры LoRA генеративной модели на CPU")
+    lm_parser.add_argument("--data", default="voicaj_training_data.json", help="Снимок данных обучения")
+    lm_parser.add_argument("--model", default=LM_MODEL_NAME, help="Базовая модель transformers")
+    lm_parser.add_argument("--tiny", action="store_true", help="Маленькая локальная модель вместо базовой (без сети)")
+    lm_parser.add_argument("--output", default=LM_ADAPTER_PATH, help="Файл адаптеров")
+    lm_parser.add_argument("--checkpoints", default=LM_CHECKPOINT_DIR, help="Каталог чекпоинтов")
+    lm_parser.add_argument("--steps", type=int, default=200, help="Шагов оптимизатора")
+    lm_parser.add_argument("--micro-batch", type=int, default=4, help="Примеров в микропачке")
+    lm_parser.add_argument("--grad-accum", type=int, default=4, help="Микропачек на шаг оптимизатора")
+    lm_parser.add_argument("--lr", type=float, default=2e-4)
+    lm_parser.add_argument("--rank", type=int, default=8, help="Ранг адаптеров")
+    lm_parser.add_argument("--max-length", type=int, default=512, help="Предел токенов примера")
+    lm_parser.add_argument("--threads", type=int, default=0, help="Потоки внутри операций (0 - по умолчанию)")
+    lm_parser.add_argument("--interop-threads", type=int, default=0, help="Потоки между операциями")
+    lm_parser.add_argument("--checkpoint-every", type=int, default=50, help="Шагов между чекпоинтами")
+    lm_parser.add_argument("--bf16", action="store_true", help="Автокаст в bfloat16 (CPU с AVX512-BF16/AMX)")
+    lm_parser.add_argument("--no-resume", action="store_true", help="Не продолжать с чекпоинта")
+
+    export_parser = subparsers.add_parser("export-lm", help="Собрать граф генеративной модели (TorchScript/ONNX)")
+    export_parser.add_argument("--backend", choices=list(LLM_EXPORT_PATHS) + ["all"], default="all")
+    export_parser.add_argument("--model", default=LM_MODEL_NAME, help="Базовая модель transformers")
+    export_parser.add_argument("--adapter", default=LM_ADAPTER_PATH, help="Файл адаптеров LoRA")
+    export_parser.add_argument("--tiny", action="store_true", help="Маленькая локальная модель вместо базовой (без сети)")
+    export_parser.add_argument("--output", default="", help="Файл графа (по умолчанию - путь бэкенда)")
+
+    bench_parser = subparsers.add_parser("bench-lm", help="Сравнить бэкенды генеративной модели")
+    bench_parser.add_argument("--data", default="voicaj_training_data.json", help="Снимок данных обучения")
+    bench_parser.add_argument("--model", default=LM_MODEL_NAME, help="Базовая модель transformers")
+    bench_parser.add_argument("--adapter", default=LM_ADAPTER_PATH, help="Файл адаптеров LoRA")
+    bench_parser.add_argument("--tiny", action="store_true", help="Маленькая локальная модель вместо базовой (без сети)")
+    bench_parser.add_argument("--backends", default=",".join(BACKENDS), help="Бэкенды через запятую, первый - эталон")
+    bench_parser.add_argument("--prompts", type=int, default=20, help="Промптов из данных обучения")
+    bench_parser.add_argument("--max-new-tokens", type=int, default=32)
+    bench_parser.add_argument("--threads", type=int, default=0, help="Потоки внутри операций (0 - по умолчанию)")
+
+    args = parser.parse_args()
+
+    if args.command == "build-corpus":
+        VoicajTrainer().build_corpus(args.data, args.output)
+    elif args.command == "train-types":
+        VoicajTrainer().train_type_classifier(args.data, args.output, args.holdout, args.epochs)
+    elif args.command == "train-tags":
+        VoicajTrainer().train_tag_predictor(args.data, args.output, args.holdout, args.epochs)
+    elif args.command == "distill":
+        VoicajTrainer().distill(args.data, args.log, args.report, args.db, args.shards, args.sample)
+    elif args.command == "dedup":
+        VoicajTrainer().dedup(args.data, args.output, args.threshold, args.in_place, args.show)
+    elif args.command == "build-embeddings":
+        VoicajTrainer().build_embeddings(args.data, args.output, args.model, args.tiny, args.kind, args.batch_size,
+                                         args.update, args.benchmark)
+    elif args.command == "finetune-lm":
+        VoicajTrainer().finetune_lm(args.data, args.model, args.output, args.checkpoints, args.tiny, args.steps,
+                                    args.micro_batch, args.grad_accum, args.lr, args.rank, args.max_length,
+                                    args.threads, args.interop_threads, args.checkpoint_every, args.bf16,
+                                    not args.no_resume)
+    elif args.command == "export-lm":
+        VoicajTrainer().export_lm(args.model, args.adapter, args.tiny, args.backend, args.output)
+    elif args.command == "bench-lm":
+        VoicajTrainer().bench_lm(args.data, args.model, args.adapter, args.tiny, args.backends, args.prompts,
+                                 args.max_new_tokens, args.threads)
+    else:
+        run_demo()